@@ -39,6 +39,8 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY=os.getenv('SECRET_KEY'),
         UPLOAD_FOLDER=os.path.join(app.root_path, 'uploads'),
+        RENDER_CACHE_MAX_BYTES=int(os.getenv('RENDER_CACHE_MAX_BYTES', 2 * 1024 ** 3)),  # 0 disables the render cache
+        RENDER_FUSE_GRAPH=os.getenv('RENDER_FUSE_GRAPH', 'True').lower() == 'true',  # False: always decode + encode separately
         SQLALCHEMY_DATABASE_URI=os.getenv('DATABASE_URL', 'sqlite:///app.db'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         GOOGLE_CLIENT_ID=os.getenv('GOOGLE_CLIENT_ID'),
@@ -53,6 +55,12 @@ def create_app(test_config=None):
         BABEL_DEFAULT_LOCALE='en',
         LANGUAGES=['en', 'pl'],
         BABEL_TRANSLATION_DIRECTORIES=os.path.join(app.root_path, 'translations'),
+        REDIS_URL=_redis_url,
+        TASK_EVENTS_STREAM_SECONDS=int(os.getenv('TASK_EVENTS_STREAM_SECONDS', 300)),  # SSE clients reconnect after this
+        TASK_EVENTS_MAX_STREAMS=int(os.getenv('TASK_EVENTS_MAX_STREAMS', 8)),  # SSE streams per web worker process (threads they may hold)
+        TASK_EVENTS_MAX_STREAMS_PER_USER=int(os.getenv('TASK_EVENTS_MAX_STREAMS_PER_USER', 4)),  # open tabs beyond this poll instead
+        TASK_STATE_FLUSH_SECONDS=int(os.getenv('TASK_STATE_FLUSH_SECONDS', 5)),  # write-behind delay of finished task states
+        UPLOAD_MAX_BYTES=int(os.getenv('UPLOAD_MAX_BYTES', 4 * 1024 ** 3)),  # largest chunked upload accepted
         CELERY_BROKER_URL=_redis_url,
         CELERY_RESULT_BACKEND=_redis_url,
         # Session configuration for proper cookie handling
@@ -1,14 +1,33 @@
 import os
 import json
-from flask import request, jsonify, current_app, url_for, render_template, redirect
+import shutil
+from flask import (request, jsonify, current_app, url_for, render_template, redirect, send_file, Response,
+                   stream_with_context)
 from werkzeug.utils import secure_filename
 from flask_login import login_required, current_user
 from datetime import datetime, UTC
-from app.tasks.audio_tasks import process_audio_file
+from app.tasks.audio_tasks import process_audio_file, OUTPUT_FORMATS, MAX_OUTPUT_TARGETS
 from app.models import db, AudioFile, ProcessingTask, User
 from app.utils.decorators import subscription_required
+from app.services.waveform import peaks_path_for
+from app.services.spectrogram import spectrogram_dir_for, tile_path, read_spectrogram_index
+from app.services.loudness_history import history_path_for
+from app.services.stereo_image import stereo_path_for
+from app.services.analysis_cache import analysis_path_for
+from app.services.storage import store_upload
+from app.services.probe import probe_header
+from app.services.cover_art import store_cover_art, cover_art_path_for, is_cover_art_id
+from app.services.task_events import acquire_stream_slot, stream_task_events, task_event, TERMINAL_STATUSES
+from app.services.task_progress import read_task_progress
+from app.services.task_state import (read_task_states, record_queued, flush_task_states, pending_task_states,
+                                    overlay_task_state)
+from app.services.chunked_upload import (UploadError, CLIENT_CHUNK_BYTES, create_upload, read_upload, append_chunk,
+                                         complete_upload, abort_upload)
 from . import bp
 
+# Supported audio formats (both lossless and lossy)
+SUPPORTED_FORMATS = ['.wav', '.mp3', '.m4a', '.aac', '.flac', '.ogg', '.wma', '.aiff', '.opus']
+
 def _get_user_id_from_request_or_current_user():
     """
     Pomocnicza funkcja do pobierania ID użytkownika, wspierająca tryb testowy.
@@ -20,6 +39,30 @@ def _get_user_id_from_request_or_current_user():
     else:
         return None
 
+def _validate_output_targets(targets):
+    """
+    Sprawdza listę formatów docelowych z opcji; zwraca komunikat błędu albo None.
+    """
+    if targets is None:
+        return None
+    if not isinstance(targets, list) or not targets or not all(isinstance(target, dict) for target in targets):
+        return "Targets must be a non-empty list of objects"
+    if len(targets) > MAX_OUTPUT_TARGETS:
+        return f"Too many output targets (max {MAX_OUTPUT_TARGETS})"
+    for target in targets:
+        if str(target.get('format', 'mp3')).lower() not in OUTPUT_FORMATS:
+            return f"Unsupported output format: {target.get('format')}. Supported formats: {', '.join(OUTPUT_FORMATS)}"
+    return None
+
+def _output_file_paths(audio_file):
+    """
+    Ścieżki wszystkich plików wyjściowych pliku audio (również starych rekordów bez AudioOutput).
+    """
+    paths = [output.file_path for output in audio_file.outputs]
+    if audio_file.processed_file_path and audio_file.processed_file_path not in paths:
+        paths.insert(0, audio_file.processed_file_path)
+    return paths
+
 @bp.route('/')
 @login_required
 def index():
@@ -40,25 +83,35 @@ def dashboard():
     # Statystyki
     total_files = AudioFile.query.filter_by(user_id=user_id).count()
     total_tasks = ProcessingTask.query.filter_by(user_id=user_id).count()
-    completed_tasks = ProcessingTask.query.filter_by(user_id=user_id, status='COMPLETED').count()
-    failed_tasks = ProcessingTask.query.filter_by(user_id=user_id, status='FAILED').count()
+    # Zadania niezakończone w bazie mogą mieć nowszy stan w Redis (w toku albo czekające na zapis)
+    open_tasks = ProcessingTask.query.filter_by(user_id=user_id).filter(
+        ProcessingTask.status.notin_(TERMINAL_STATUSES)
+    ).all()
+    pending = pending_task_states(open_tasks)
+    finished = [state['status'] for state in pending.values() if state['status'] in TERMINAL_STATUSES]
+    completed_tasks = ProcessingTask.query.filter_by(user_id=user_id, status='COMPLETED').count() + finished.count('COMPLETED')
+    failed_tasks = ProcessingTask.query.filter_by(user_id=user_id, status='FAILED').count() + finished.count('FAILED')
     pending_tasks = ProcessingTask.query.filter_by(user_id=user_id).filter(
         ProcessingTask.status.in_(['PENDING', 'QUEUED', 'PROCESSING'])
-    ).count()
+    ).count() - len(finished)
     
     # Ostatnie pliki (5 najnowszych)
     recent_files = AudioFile.query.filter_by(user_id=user_id).order_by(
         AudioFile.upload_date.desc()
     ).limit(5).all()
     
-    # Statystyki LUFS (średnia głośność)
+    # Statystyki LUFS (średnia głośność), z wynikami jeszcze niezapisanymi w bazie
     files_with_lufs = AudioFile.query.filter_by(user_id=user_id).filter(
         AudioFile.loudness_lufs.isnot(None)
     ).all()
-    
+    lufs_by_file = {f.id: f.loudness_lufs for f in files_with_lufs}
+    lufs_by_file.update({
+        state['audio_file_id']: state['audio_file']['loudness_lufs'] for state in pending.values()
+        if state['audio_file'] and state['audio_file'].get('loudness_lufs') is not None
+    })
     avg_lufs = None
-    if files_with_lufs:
-        avg_lufs = sum(f.loudness_lufs for f in files_with_lufs) / len(files_with_lufs)
+    if lufs_by_file:
+        avg_lufs = sum(lufs_by_file.values()) / len(lufs_by_file)
     
     # Total storage used
     total_storage_bytes = db.session.query(
@@ -70,6 +123,7 @@ def dashboard():
         task = ProcessingTask.query.filter_by(audio_file_id=af.id).order_by(
             ProcessingTask.created_at.desc()
         ).first()
+        task, af = overlay_task_state(task, af, pending)
         
         processed_file_url = None
         if af.processed_filename and os.path.exists(
@@ -102,6 +156,91 @@ def dashboard():
         recent_files=recent_data
     )
 
+def _upload_limit_response(user):
+    """
+    Odpowiedź 403 po wyczerpaniu miesięcznego limitu plików.
+    """
+    limit = user.get_usage_limit()
+    remaining = user.get_remaining_uploads()
+    return jsonify({
+        "error": f"Osiągnięto miesięczny limit ({user.monthly_upload_count}/{limit} plików). "
+                f"Ulepsz swój plan lub poczekaj do następnego miesiąca.",
+        "limit_reached": True,
+        "used": user.monthly_upload_count,
+        "limit": limit,
+        "remaining": remaining
+    }), 403
+
+def _unsupported_format_response(file_extension):
+    return jsonify({
+        "error": f"Unsupported file format: {file_extension}. Supported formats: {', '.join(SUPPORTED_FORMATS)}"
+    }), 400
+
+def _validate_upload_options(options, user_id):
+    """
+    Sprawdza opcje przetwarzania przed przyjęciem pliku; zwraca komunikat błędu albo None.
+    Usuwa ścieżkę okładki podaną przez klienta.
+    """
+    if not isinstance(options, dict):
+        return "Invalid options format"
+    targets_error = _validate_output_targets(options.get('targets'))
+    if targets_error:
+        return targets_error
+    # Okładka wysłana raz na całą partię przez /cover-art - plik wskazuje ją po ID
+    cover_art_id = options.get('cover_art_id')
+    if cover_art_id is not None and not (
+        is_cover_art_id(cover_art_id)
+        and os.path.exists(cover_art_path_for(current_app.config['UPLOAD_FOLDER'], user_id, cover_art_id))
+    ):
+        return "Unknown cover art"
+    options.pop('cover_art_path', None)
+    return None
+
+def _queue_processing(user, filename, filepath, content_hash, file_size, created, options):
+    """
+    Zapisuje przyjęty oryginał w bazie i kolejkuje jego przetwarzanie; odpowiedź 202 dla klienta.
+    """
+    # Odczyt nagłówka w procesie (bez ffprobe) - tani na tyle, by zrobić go już tutaj;
+    # zadanie dostaje wynik i nie sonduje pliku drugi raz
+    input_format_info = probe_header(filepath)
+    new_audio_file = AudioFile(
+        user_id=user.id,
+        original_filename=filename,
+        original_file_path=filepath,
+        file_size_bytes=file_size,
+        content_hash=content_hash
+    )
+    db.session.add(new_audio_file)
+    db.session.flush()
+    new_processing_task = ProcessingTask(
+        user_id=user.id,
+        audio_file_id=new_audio_file.id,
+        status='QUEUED'
+    )
+    db.session.add(new_processing_task)
+    
+    # ZWIĘKSZ LICZNIK UPLOADÓW po udanym zapisie - jeden commit dla pliku, zadania i licznika
+    user.increment_upload_count()
+    
+    task = process_audio_file.delay(
+        new_processing_task.id,
+        filepath,
+        filename,
+        user.id,
+        options,
+        input_format_info=input_format_info
+    )
+    # ID zadania Celery trafia do stanu w Redis (bez drugiego commitu); bez Redis - do bazy
+    record_queued(new_processing_task, task.id)
+    status_url = f"/audio/task-status/{new_processing_task.id}"
+    return jsonify({
+        "message": "File uploaded and queued for processing",
+        "status_url": status_url,
+        "task_id": new_processing_task.id,
+        "deduplicated": not created,
+        "input_format": input_format_info,
+    }), 202
+
 @bp.route('/upload-and-process', methods=['GET', 'POST'])
 @login_required
 @subscription_required
@@ -113,16 +252,7 @@ def upload_and_process_audio():
         # SPRAWDŹ LIMIT UPLOADÓW
         user = db.session.get(User, user_id_int)
         if not user.can_upload():
-            limit = user.get_usage_limit()
-            remaining = user.get_remaining_uploads()
-            return jsonify({
-                "error": f"Osiągnięto miesięczny limit ({user.monthly_upload_count}/{limit} plików). "
-                        f"Ulepsz swój plan lub poczekaj do następnego miesiąca.",
-                "limit_reached": True,
-                "used": user.monthly_upload_count,
-                "limit": limit,
-                "remaining": remaining
-            }), 403
+            return _upload_limit_response(user)
         
         if 'file' not in request.files:
             return jsonify({"error": "No file part in the request"}), 400
@@ -134,7 +264,11 @@ def upload_and_process_audio():
             options = json.loads(options_str)
         except json.JSONDecodeError:
             return jsonify({"error": "Invalid options format"}), 400
-        
+        options_error = _validate_upload_options(options, user_id_int)
+        if options_error:
+            return jsonify({"error": options_error}), 400
+
+        # Starsi klienci wciąż dołączają okładkę do każdego pliku
         cover_art_file = request.files.get('cover_art')
         cover_art_path = None
         if cover_art_file:
@@ -145,59 +279,159 @@ def upload_and_process_audio():
             options['cover_art_path'] = cover_art_path
 
         filename = secure_filename(file.filename)
-        # Supported audio formats (both lossless and lossy)
-        SUPPORTED_FORMATS = ['.wav', '.mp3', '.m4a', '.aac', '.flac', '.ogg', '.wma', '.aiff', '.opus']
         file_extension = os.path.splitext(filename)[1].lower()
         
         if file_extension not in SUPPORTED_FORMATS:
             if cover_art_path and os.path.exists(cover_art_path):
                 os.remove(cover_art_path)
-            return jsonify({
-                "error": f"Unsupported file format: {file_extension}. Supported formats: {', '.join(SUPPORTED_FORMATS)}"
-            }), 400
-
-        unique_filename = f"{user_id_int}_{datetime.now(UTC).strftime('%Y%m%d%H%M%S')}_{filename}"
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(filepath)
-        new_audio_file = AudioFile(
-            user_id=user_id_int,
-            original_filename=filename,
-            original_file_path=filepath,
-            file_size_bytes=os.path.getsize(filepath)
-        )
-        db.session.add(new_audio_file)
-        db.session.commit()
-        new_processing_task = ProcessingTask(
-            user_id=user_id_int,
-            audio_file_id=new_audio_file.id,
-            status='QUEUED'
-        )
-        db.session.add(new_processing_task)
-        db.session.commit()
-        
-        # ZWIĘKSZ LICZNIK UPLOADÓW po udanym zapisie
-        user = db.session.get(User, user_id_int)
-        user.increment_upload_count()
-        
-        task = process_audio_file.delay(
-            new_processing_task.id,
-            filepath,
-            filename,
-            user_id_int,
-            options
+            return _unsupported_format_response(file_extension)
+
+        # Oryginał zapisywany strumieniowo pod swoim SHA-256: ponowny upload tych samych bajtów
+        # używa istniejącego pliku i jego zapisanej analizy
+        filepath, content_hash, file_size, created = store_upload(
+            file.stream, current_app.config['UPLOAD_FOLDER'], user_id_int, file_extension
         )
-        new_processing_task.celery_task_id = task.id
-        db.session.commit()
-        status_url = f"/audio/task-status/{new_processing_task.id}"
-        return jsonify({
-            "message": "File uploaded and queued for processing",
-            "status_url": status_url,
-        }), 202
+        return _queue_processing(user, filename, filepath, content_hash, file_size, created, options)
     user_object = db.session.get(User, user_id_int)
     user_email = user_object.email if user_object else "Nieznany"
     current_year = datetime.now(UTC).year
     return render_template('upload_audio.html', user_email=user_email, current_year=current_year)
 
+def _upload_state_response(upload_id, meta, status=200, **extra):
+    response = jsonify({
+        "upload_id": upload_id,
+        "offset": meta['offset'],
+        "length": meta['length'],
+        "container": meta['container'],
+        **extra,
+    })
+    response.status_code = status
+    response.headers['Upload-Offset'] = str(meta['offset'])
+    response.headers['Upload-Length'] = str(meta['length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/uploads', methods=['POST'])
+@login_required
+@subscription_required
+def create_chunked_upload():
+    """
+    Otwiera wznawialny upload w kawałkach (w stylu tus): JSON {filename, length, options}.
+    Limit, format i opcje są sprawdzane tutaj - zanim klient wyśle pierwszy bajt.
+    """
+    user_id_int = _get_user_id_from_request_or_current_user()
+    if user_id_int is None:
+        return jsonify({"error": "User ID not found"}), 401
+    user = db.session.get(User, user_id_int)
+    if not user.can_upload():
+        return _upload_limit_response(user)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON body"}), 400
+    filename = secure_filename(str(data.get('filename') or ''))
+    if not filename:
+        return jsonify({"error": "No selected file"}), 400
+    file_extension = os.path.splitext(filename)[1].lower()
+    if file_extension not in SUPPORTED_FORMATS:
+        return _unsupported_format_response(file_extension)
+    length = data.get('length')
+    if not isinstance(length, int) or isinstance(length, bool) or length <= 0:
+        return jsonify({"error": "Upload length must be a positive number of bytes"}), 400
+    max_bytes = current_app.config['UPLOAD_MAX_BYTES']
+    if length > max_bytes:
+        return jsonify({"error": f"File is larger than {max_bytes // (1024 * 1024)} MB"}), 413
+    options = data.get('options', {})
+    options_error = _validate_upload_options(options, user_id_int)
+    if options_error:
+        return jsonify({"error": options_error}), 400
+    upload_id = create_upload(current_app.config['UPLOAD_FOLDER'], user_id_int, filename, file_extension, length, options)
+    upload_url = url_for('audio_processing.chunked_upload', upload_id=upload_id)
+    response = _upload_state_response(upload_id, {'offset': 0, 'length': length, 'container': None}, 201,
+                                      upload_url=upload_url, chunk_bytes=CLIENT_CHUNK_BYTES)
+    response.headers['Location'] = upload_url
+    return response
+
+@bp.route('/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+@login_required
+@subscription_required
+def chunked_upload(upload_id):
+    """
+    GET/HEAD: ile bajtów serwer już ma (Upload-Offset) - od tego miejsca klient wznawia.
+    PATCH: kolejny kawałek w surowym ciele żądania, dopisywany od nagłówka Upload-Offset.
+    DELETE: porzucenie uploadu.
+    """
+    user_id_int = _get_user_id_from_request_or_current_user()
+    if user_id_int is None:
+        return jsonify({"error": "User ID not found"}), 401
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    if request.method == 'DELETE':
+        if not abort_upload(upload_folder, user_id_int, upload_id):
+            return jsonify({"error": "Upload not found"}), 404
+        return '', 204
+    if request.method in ('GET', 'HEAD'):
+        meta = read_upload(upload_folder, user_id_int, upload_id)
+        if meta is None:
+            return jsonify({"error": "Upload not found"}), 404
+        return _upload_state_response(upload_id, meta)
+    offset = request.headers.get('Upload-Offset', '')
+    if not offset.isdigit():
+        return jsonify({"error": "Missing or invalid Upload-Offset header"}), 400
+    # Ciało czytane prosto ze strumienia (bez request.files), więc nic nie jest buforowane w plikach tymczasowych
+    try:
+        meta = append_chunk(upload_folder, user_id_int, upload_id, int(offset), request.stream)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return _upload_state_response(upload_id, meta)
+
+@bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+@subscription_required
+def complete_chunked_upload(upload_id):
+    """
+    Kończy upload: plik trafia pod swój SHA-256 (liczony w trakcie przesyłania) i do kolejki
+    przetwarzania - odpowiedź jak z /upload-and-process.
+    """
+    user_id_int = _get_user_id_from_request_or_current_user()
+    if user_id_int is None:
+        return jsonify({"error": "User ID not found"}), 401
+    user = db.session.get(User, user_id_int)
+    if not user.can_upload():
+        return _upload_limit_response(user)
+    try:
+        filepath, content_hash, file_size, created, meta = complete_upload(
+            current_app.config['UPLOAD_FOLDER'], user_id_int, upload_id
+        )
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return _queue_processing(user, meta['filename'], filepath, content_hash, file_size, created, meta['options'])
+
+@bp.route('/cover-art', methods=['POST'])
+@login_required
+@subscription_required
+def upload_cover_art():
+    """
+    Przyjmuje okładkę raz dla całej partii plików: normalizuje ją do JPEG (maks. 1400 px)
+    i zwraca ID, które kolejne uploady podają w opcjach jako cover_art_id.
+    """
+    user_id_int = _get_user_id_from_request_or_current_user()
+    if user_id_int is None:
+        return jsonify({"error": "User ID not found"}), 401
+    cover_art_file = request.files.get('cover_art')
+    if not cover_art_file or cover_art_file.filename == '':
+        return jsonify({"error": "No cover art in the request"}), 400
+    try:
+        cover_art_id, (width, height), created = store_cover_art(
+            cover_art_file.stream, current_app.config['UPLOAD_FOLDER'], user_id_int
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "cover_art_id": cover_art_id,
+        "width": width,
+        "height": height,
+        "deduplicated": not created,
+    }), 201 if created else 200
+
 @bp.route('/history', methods=['GET'])
 @login_required
 def get_processing_history():
@@ -207,12 +441,18 @@ def get_processing_history():
     user_object = db.session.get(User, user_id_to_query)
     user_email = user_object.email if user_object else "Nieznany"
     audio_files = AudioFile.query.filter_by(user_id=user_id_to_query).order_by(AudioFile.upload_date.desc()).all()
+    latest_tasks = [
+        (af, ProcessingTask.query.filter_by(audio_file_id=af.id).order_by(ProcessingTask.created_at.desc()).first())
+        for af in audio_files
+    ]
+    # Stan z Redis dla zadań w toku i zakończonych, ale jeszcze niezapisanych w bazie
+    pending = pending_task_states(task for _, task in latest_tasks if task)
     results = []
-    for af in audio_files:
+    for af, task in latest_tasks:
+        task, af = overlay_task_state(task, af, pending)
         processed_file_url = None
         if af.processed_filename and os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], af.processed_filename)):
             processed_file_url = f"/uploads/{af.processed_filename}"
-        task = ProcessingTask.query.filter_by(audio_file_id=af.id).order_by(ProcessingTask.created_at.desc()).first()
         results.append({
             "audio_file_id": af.id,
             "original_filename": af.original_filename,
@@ -230,20 +470,145 @@ def get_processing_history():
     current_year = datetime.now(UTC).year 
     return render_template('history.html', history_data=results, user_email=user_email, current_year=current_year)
 
+MAX_STATUS_TASK_IDS = 500
+_SUMMARY_KEYS = ('loudness_lufs', 'true_peak_db', 'duration_seconds', 'processed_file_url', 'error')
+_TASK_PROGRESS = {'PENDING': 0, 'QUEUED': 0, 'COMPLETED': 100, 'FAILED': 100}
+
+def _parse_task_ids(value):
+    """
+    Lista ID zadań z parametru ?ids=1,2,3 (bez duplikatów); ValueError dla niepoprawnych wartości.
+    """
+    task_ids = []
+    for task_id in value.split(','):
+        if task_id.strip() and int(task_id) not in task_ids:
+            task_ids.append(int(task_id))
+    return task_ids
+
+def _task_summary(result_json):
+    """
+    Skrót wyniku zadania - tylko pola potrzebne listom plików, bez pełnej analizy.
+    """
+    try:
+        result = json.loads(result_json) if isinstance(result_json, str) else result_json
+    except ValueError:
+        return None
+    if not isinstance(result, dict):
+        return None
+    return {key: result[key] for key in _SUMMARY_KEYS if key in result}
+
+@bp.route('/task-status', methods=['GET'])
+@login_required
+def get_task_statuses():
+    """
+    Status, postęp i skrót wyniku wielu zadań naraz (?ids=1,2,3, maks. MAX_STATUS_TASK_IDS)
+    jednym zapytaniem IN po kluczu głównym - jeden request na interwał zamiast jednego na plik.
+    """
+    user_id_to_query = _get_user_id_from_request_or_current_user()
+    if user_id_to_query is None:
+        return jsonify({"error": "User ID not found"}), 401
+    try:
+        task_ids = _parse_task_ids(request.args.get('ids', ''))
+    except ValueError:
+        return jsonify({"error": "Invalid task ids"}), 400
+    if not task_ids:
+        return jsonify({"error": "No task ids given"}), 400
+    if len(task_ids) > MAX_STATUS_TASK_IDS:
+        return jsonify({"error": f"Too many task ids (max {MAX_STATUS_TASK_IDS})"}), 400
+    # Stan zadań w toku i świeżo zakończonych czytany jest z hashy w Redis; baza tylko dla reszty
+    hot = {task_id: state for task_id, state in read_task_states(task_ids).items()
+           if state.get('user_id') == user_id_to_query and state.get('status')}
+    rows = [(task_id, state['status'], state.get('result_json')) for task_id, state in hot.items()]
+    cold_ids = [task_id for task_id in task_ids if task_id not in hot]
+    if cold_ids:
+        rows += db.session.query(ProcessingTask.id, ProcessingTask.status, ProcessingTask.result_json).filter(
+            ProcessingTask.id.in_(cold_ids), ProcessingTask.user_id == user_id_to_query
+        ).all()
+    # Postęp na żywo (procent, etap, ETA) trzymany jest w Redis - jeden MGET dla zadań w toku
+    live = read_task_progress(task_id for task_id, status, _ in rows if status not in TERMINAL_STATUSES)
+    tasks = {}
+    for task_id, status, result_json in rows:
+        progress = live.get(task_id, {})
+        tasks[str(task_id)] = {
+            "status": status,
+            "progress": progress.get('percent', _TASK_PROGRESS.get(status)),
+            "stage": progress.get('stage'),
+            "eta_seconds": progress.get('eta_seconds'),
+            "summary": _task_summary(result_json),
+        }
+    return jsonify({
+        "tasks": tasks,
+        "missing": [task_id for task_id in task_ids if str(task_id) not in tasks],
+    }), 200
+
 @bp.route('/task-status/<int:task_id>', methods=['GET'])
 @login_required
 def get_task_status(task_id):
     user_id_to_query = _get_user_id_from_request_or_current_user()
     if user_id_to_query is None:
         return jsonify({"error": "User ID not found"}), 401
-    task_entry = db.session.get(ProcessingTask, task_id)
-    if not task_entry or task_entry.user_id != user_id_to_query:
-        return jsonify({"error": "Task not found"}), 404
+    state = read_task_states([task_id]).get(task_id)
+    if state and state.get('user_id') == user_id_to_query and state.get('status'):
+        status, result_json = state['status'], state.get('result_json')
+    else:
+        task_entry = db.session.get(ProcessingTask, task_id)
+        if not task_entry or task_entry.user_id != user_id_to_query:
+            return jsonify({"error": "Task not found"}), 404
+        status, result_json = task_entry.status, task_entry.result_json
+    progress = None
+    if status not in TERMINAL_STATUSES:
+        progress = read_task_progress([task_id]).get(task_id)
     return jsonify({
-        "status": task_entry.status,
-        "result": task_entry.result_json,
+        "status": status,
+        "result": result_json,
+        "progress": progress,
     }), 200
 
+@bp.route('/task-events', methods=['GET'])
+@login_required
+def task_events():
+    """
+    Strumień SSE ze zmianami statusu zadań użytkownika (Redis pub/sub, publikowane przez workera).
+    Opcjonalne ?ids=1,2,3 - bieżący stan tych zadań jest wysyłany zaraz po subskrypcji, więc
+    klient wznawiający połączenie nie gubi zmian. Polling /task-status zostaje jako fallback.
+    """
+    user_id_to_query = _get_user_id_from_request_or_current_user()
+    if user_id_to_query is None:
+        return jsonify({"error": "User ID not found"}), 401
+    try:
+        task_ids = _parse_task_ids(request.args.get('ids', ''))[:MAX_STATUS_TASK_IDS]
+    except ValueError:
+        return jsonify({"error": "Invalid task ids"}), 400
+
+    def snapshot():
+        if not task_ids:
+            return []
+        tasks = ProcessingTask.query.filter(
+            ProcessingTask.id.in_(task_ids), ProcessingTask.user_id == user_id_to_query
+        ).all()
+        events = [task_event(task) for task in tasks]
+        db.session.remove()  # strumień trwa minutami - nie trzymamy połączenia z bazą
+        hot = read_task_states(event['task_id'] for event in events)
+        for event in events:
+            state = hot.get(event['task_id'], {})
+            event.update(status=state.get('status', event['status']), result=state.get('result_json', event['result']))
+        live = read_task_progress(event['task_id'] for event in events if event['status'] not in TERMINAL_STATUSES)
+        for event in events:
+            event['progress'] = live.get(event['task_id'])  # bieżący postęp z Redis dołączamy do stanu z bazy
+        return events
+
+    # Strumień zajmuje wątek workera przez cały czas trwania - limit na proces i na użytkownika;
+    # po 503 klient przechodzi na polling /task-status
+    release = acquire_stream_slot(user_id_to_query)
+    if release is None:
+        return jsonify({"error": "Too many open status streams"}), 503
+    stream = stream_task_events(user_id_to_query, snapshot, current_app.config['TASK_EVENTS_STREAM_SECONDS'])
+    response = Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx nie buforuje zdarzeń
+    })
+    response.call_on_close(release)
+    return response
+
 @bp.route('/file/<int:file_id>')
 @login_required
 def file_details(file_id):
@@ -260,6 +625,8 @@ def file_details(file_id):
     task = ProcessingTask.query.filter_by(audio_file_id=file_id).order_by(
         ProcessingTask.created_at.desc()
     ).first()
+    # Zadanie w toku albo wynik czekający w Redis na zapis do bazy
+    task, audio_file = overlay_task_state(task, audio_file, pending_task_states([task] if task else []))
     
     # Get processed file URL
     processed_file_url = None
@@ -268,6 +635,28 @@ def file_details(file_id):
     ):
         processed_file_url = f"/uploads/{audio_file.processed_filename}"
     
+    # Wszystkie formaty wyrenderowane w jednym zadaniu (pierwszy to plik główny)
+    output_downloads = [
+        {'format': output.format, 'filename': output.filename, 'url': f"/uploads/{output.filename}"}
+        for output in audio_file.outputs if os.path.exists(output.file_path)
+    ]
+    
+    peaks_url = None
+    if audio_file.processed_file_path and os.path.exists(peaks_path_for(audio_file.processed_file_path)):
+        peaks_url = url_for('audio_processing.file_peaks', file_id=audio_file.id)
+    
+    loudness_history_url = None
+    if audio_file.processed_file_path and os.path.exists(history_path_for(audio_file.processed_file_path)):
+        loudness_history_url = url_for('audio_processing.file_loudness_history', file_id=audio_file.id)
+    
+    stereo_url = None
+    if audio_file.processed_file_path and os.path.exists(stereo_path_for(audio_file.processed_file_path)):
+        stereo_url = url_for('audio_processing.file_stereo', file_id=audio_file.id)
+    
+    spectrogram_url = None
+    if audio_file.processed_file_path and os.path.exists(os.path.join(spectrogram_dir_for(audio_file.processed_file_path), 'index.json')):
+        spectrogram_url = url_for('audio_processing.file_spectrogram', file_id=audio_file.id)
+    
     # Parse result JSON for additional data
     result_data = {}
     if task and task.result_json:
@@ -282,11 +671,98 @@ def file_details(file_id):
         file=audio_file,
         task=task,
         processed_file_url=processed_file_url,
+        output_downloads=output_downloads,
+        peaks_url=peaks_url,
+        spectrogram_url=spectrogram_url,
+        loudness_history_url=loudness_history_url,
+        stereo_url=stereo_url,
         result_data=result_data,
         user_email=current_user.email,
         current_year=current_year
     )
 
+def _send_file_artifact(file_id, path_for, missing_message):
+    """
+    Wysyła plik pomocniczy (peaks, historia głośności, stereo) zapisany obok przetworzonego pliku,
+    tylko dla właściciela.
+    """
+    user_id = _get_user_id_from_request_or_current_user()
+    audio_file = db.session.get(AudioFile, file_id)
+    if not audio_file or audio_file.user_id != user_id or not audio_file.processed_file_path:
+        return jsonify({"error": "File not found"}), 404
+    artifact_path = path_for(audio_file.processed_file_path)
+    if not os.path.exists(artifact_path):
+        return jsonify({"error": missing_message}), 404
+    response = send_file(artifact_path, mimetype='application/octet-stream', conditional=True, etag=True)
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    return response
+
+@bp.route('/file/<int:file_id>/peaks')
+@login_required
+def file_peaks(file_id):
+    """
+    Binarna piramida min/max (app.services.waveform) dla odtwarzacza - rysuje waveform bez
+    pobierania i dekodowania całego pliku w przeglądarce.
+    """
+    return _send_file_artifact(file_id, peaks_path_for, "Peaks not available")
+
+@bp.route('/file/<int:file_id>/loudness-history')
+@login_required
+def file_loudness_history(file_id):
+    """
+    Przebiegi głośności momentary/short-term w formacie binarnym (app.services.loudness_history),
+    gotowe do narysowania bez ponownej analizy.
+    """
+    return _send_file_artifact(file_id, history_path_for, "Loudness history not available")
+
+@bp.route('/file/<int:file_id>/stereo')
+@login_required
+def file_stereo(file_id):
+    """
+    Korelacja fazowa w czasie i histogram mid/side (goniometr) z app.services.stereo_image.
+    """
+    return _send_file_artifact(file_id, stereo_path_for, "Stereo data not available")
+
+def _owned_spectrogram_dir(file_id):
+    user_id = _get_user_id_from_request_or_current_user()
+    audio_file = db.session.get(AudioFile, file_id)
+    if not audio_file or audio_file.user_id != user_id or not audio_file.processed_file_path:
+        return None
+    directory = spectrogram_dir_for(audio_file.processed_file_path)
+    return directory if os.path.exists(os.path.join(directory, 'index.json')) else None
+
+@bp.route('/file/<int:file_id>/spectrogram')
+@login_required
+def file_spectrogram(file_id):
+    """
+    Indeks kafelków spektrogramu (app.services.spectrogram). Parametr v w URL kafelków zmienia się
+    przy każdym przeliczeniu, więc same kafelki mogą być cache'owane bez końca.
+    """
+    directory = _owned_spectrogram_dir(file_id)
+    if not directory:
+        return jsonify({"error": "Spectrogram not available"}), 404
+    index = read_spectrogram_index(directory)
+    version = int(os.path.getmtime(os.path.join(directory, 'index.json')))
+    index['tile_url'] = f"/audio/file/{file_id}/spectrogram/{{zoom}}/{{tile}}?v={version}"
+    response = jsonify(index)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/file/<int:file_id>/spectrogram/<int:zoom>/<int:tile>')
+@login_required
+def file_spectrogram_tile(file_id, zoom, tile):
+    directory = _owned_spectrogram_dir(file_id)
+    path = tile_path(directory, zoom, tile) if directory else None
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "Tile not found"}), 404
+    response = send_file(path, mimetype='application/octet-stream', conditional=True, etag=True)
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
 @bp.route('/download-multiple', methods=['POST'])
 @login_required
 def download_multiple():
@@ -309,10 +785,10 @@ def download_multiple():
     with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
         for file_id in file_ids:
             audio_file = db.session.get(AudioFile, int(file_id))
-            if audio_file and audio_file.user_id == user_id and audio_file.processed_filename:
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], audio_file.processed_filename)
-                if os.path.exists(file_path):
-                    zf.write(file_path, audio_file.processed_filename)
+            if audio_file and audio_file.user_id == user_id:
+                for file_path in _output_file_paths(audio_file):
+                    if os.path.exists(file_path):
+                        zf.write(file_path, os.path.basename(file_path))
     
     memory_file.seek(0)
     return send_file(
@@ -332,6 +808,8 @@ def delete_files():
     if not isinstance(ids_to_delete, list):
         return jsonify({"error": "IDs must be a list"}), 400
     current_user_id = int(current_user.get_id())
+    # Zaległe stany zadań z Redis trafiają do bazy przed usunięciem ich wierszy
+    flush_task_states()
     deleted_count = 0
     errors = []
     for file_id in ids_to_delete:
@@ -344,10 +822,29 @@ def delete_files():
                 continue 
             if audio_file.processing_task:
                 db.session.delete(audio_file.processing_task)
-            if os.path.exists(audio_file.original_file_path):
-                os.remove(audio_file.original_file_path)
-            if audio_file.processed_file_path and os.path.exists(audio_file.processed_file_path):
-                os.remove(audio_file.processed_file_path)
+            # Oryginał może być współdzielony przez kilka uploadów tej samej treści
+            shared_original = AudioFile.query.filter(
+                AudioFile.original_file_path == audio_file.original_file_path, AudioFile.id != audio_file.id
+            ).count()
+            if not shared_original:
+                for original_path in (audio_file.original_file_path, analysis_path_for(audio_file.original_file_path),
+                                      peaks_path_for(audio_file.original_file_path)):
+                    if os.path.exists(original_path):
+                        os.remove(original_path)
+                # Kafelki spektrogramu oryginału (zapisywane przy zadaniach bez ponownego kodowania)
+                if os.path.isdir(spectrogram_dir_for(audio_file.original_file_path)):
+                    shutil.rmtree(spectrogram_dir_for(audio_file.original_file_path))
+            for output_path in _output_file_paths(audio_file):
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            if audio_file.processed_file_path and os.path.exists(peaks_path_for(audio_file.processed_file_path)):
+                os.remove(peaks_path_for(audio_file.processed_file_path))
+            if audio_file.processed_file_path and os.path.exists(history_path_for(audio_file.processed_file_path)):
+                os.remove(history_path_for(audio_file.processed_file_path))
+            if audio_file.processed_file_path and os.path.exists(stereo_path_for(audio_file.processed_file_path)):
+                os.remove(stereo_path_for(audio_file.processed_file_path))
+            if audio_file.processed_file_path and os.path.isdir(spectrogram_dir_for(audio_file.processed_file_path)):
+                shutil.rmtree(spectrogram_dir_for(audio_file.processed_file_path))
             db.session.delete(audio_file)
             deleted_count += 1
         except Exception as e:
@@ -1,9 +1,15 @@
+import json
 import click
 from faker import Faker
 from flask.cli import with_appcontext
 from . import db
 from .models import User, AudioFile, ProcessingTask, Plan
+from .services.render_cache import RenderCache, render_cache_root
+from .services.analysis_cache import analysis_path_for, read_analysis
+from .services.probe import probe_header, probe_format
+from .tasks.audio_tasks import benchmark_render, plan_render, render_outputs
 from flask import current_app
+import os
 import random
 from datetime import datetime, timedelta, UTC
 
@@ -246,7 +252,57 @@ def seed_plans_command():
     click.echo("📍 View at: http://localhost:5000/pricing")
     click.echo("")
 
+@click.command('render-cache')
+@click.option('--clear', is_flag=True, help='Remove every cached render.')
+@with_appcontext
+def render_cache_command(clear):
+    """Show render cache counters and size (optionally clearing it)."""
+    cache = RenderCache(render_cache_root(current_app.config['UPLOAD_FOLDER']),
+                        current_app.config.get('RENDER_CACHE_MAX_BYTES', 0))
+    if clear:
+        cache.clear()
+        click.echo('Render cache cleared.')
+    stats = cache.stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else 'n/a'
+    click.echo(f"Entries: {stats['entries']} ({stats['size_bytes']} / {stats['max_bytes']} bytes)")
+    click.echo(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Hit rate: {hit_rate}")
+    click.echo(f"Stores: {stats['stores']}  Evictions: {stats['evictions']}")
+
+@click.command('render-plan')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--options', 'options_json', default='{}', help='Processing options as JSON, as sent by the upload form.')
+@click.option('--benchmark', 'runs', type=int, default=0, help='Also render N times with each strategy and compare.')
+@with_appcontext
+def render_plan_command(path, options_json, runs):
+    """Dry-run: print how a job would be rendered and how many processes it takes."""
+    options = json.loads(options_json)
+    input_format_info = probe_header(path)
+    probe_processes = 0 if input_format_info else 1
+    cached = read_analysis(analysis_path_for(path))
+    source_analysis = cached[0] if cached else None
+    input_format_info = input_format_info or probe_format(path)
+    outputs = render_outputs(options, os.path.basename(path), current_app.config['UPLOAD_FOLDER'])
+    plan = plan_render(path, outputs, options, input_format_info, source_analysis)
+
+    click.echo(f"Strategy: {plan['strategy']}" + (f" ({plan['reason']})" if plan['reason'] else ''))
+    click.echo(f"probe: {'in process' if not probe_processes else 'ffprobe'}")
+    for stage in plan['stages']:
+        click.echo(f"{stage}")
+    for command in plan['commands']:
+        click.echo(f"$ {' '.join(command)}")
+    click.echo(f"Estimated processes: {plan['processes'] + probe_processes}")
+
+    if runs:
+        for strategy, result in benchmark_render(path, options, runs).items():
+            if 'error' in result:
+                click.echo(f"{strategy:>11}: {result['error']}")
+            else:
+                click.echo(f"{strategy:>11}: {min(result['seconds']):.3f}s best of {runs}, {result['processes']} process(es)")
+
 def register_commands(app):
     app.cli.add_command(seed_admin_command)
     app.cli.add_command(seed_users_command)
     app.cli.add_command(seed_plans_command)
+    app.cli.add_command(render_cache_command)
+    app.cli.add_command(render_plan_command)
@@ -95,12 +95,28 @@ class AudioFile(db.Model):
     upload_date = db.Column(db.DateTime, default=datetime.now(UTC))
     original_file_path = db.Column(db.String(512), nullable=False)
     processed_file_path = db.Column(db.String(512), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the original
     
     processing_task = db.relationship('ProcessingTask', backref='processed_audio', uselist=False, lazy=True)
+    outputs = db.relationship('AudioOutput', backref='audio_file', lazy=True, cascade='all, delete-orphan',
+                              order_by='AudioOutput.id')
     
     def __repr__(self):
         return f'<AudioFile {self.original_filename}>'
 
+class AudioOutput(db.Model):
+    """Jeden wyrenderowany plik wyjściowy (format docelowy) należący do AudioFile."""
+    id = db.Column(db.Integer, primary_key=True)
+    audio_file_id = db.Column(db.Integer, db.ForeignKey('audio_file.id'), nullable=False, index=True)
+    format = db.Column(db.String(16), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(512), nullable=False)
+    file_size_bytes = db.Column(db.BigInteger, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
+
+    def __repr__(self):
+        return f'<AudioOutput {self.filename}>'
+
 class ProcessingTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -0,0 +1,81 @@
+import io
+import json
+import zipfile
+import numpy as np
+from app.services.audio_analyzer import AnalysisResult
+
+ANALYSIS_VERSION = 1
+
+# Layout: a compressed .npz (no pickles) holding the arrays of an AnalysisResult plus 'meta',
+# a UTF-8 JSON document with the scalars and the probed format info of the original.
+_SCALARS = ('integrated_lufs', 'relative_gate', 'loudness_range', 'true_peak_db', 'sample_peak_db',
+            'rms_db', 'dc_offset', 'clipped_samples', 'duration_seconds')
+
+def encode_analysis(result, format_info=None):
+    """Serialize an AnalysisResult (and the format probe it came with)."""
+    history = result.history
+    stereo = history['stereo']
+    meta = {key: getattr(result, key) for key in _SCALARS}
+    meta.update({
+        'version': ANALYSIS_VERSION,
+        'format_info': format_info,
+        'seconds_per_point': history['seconds_per_point'],
+        'max_momentary': history['max_momentary'],
+        'max_short_term': history['max_short_term'],
+        'stereo': {
+            'correlation_overall': stereo['correlation_overall'],
+            'goniometer_extent': stereo['goniometer_extent'],
+        } if stereo else None,
+    })
+    arrays = {
+        'meta': np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+        'clip_histogram': result.clip_histogram,
+        'momentary': history['momentary'],
+        'short_term': history['short_term'],
+    }
+    if stereo:
+        arrays['correlation'] = stereo['correlation']
+        arrays['goniometer'] = stereo['goniometer']
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+def decode_analysis(data):
+    """Inverse of encode_analysis: (AnalysisResult, format_info)."""
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        meta = json.loads(arrays['meta'].tobytes().decode())
+        if meta.get('version') != ANALYSIS_VERSION:
+            raise ValueError("Unsupported analysis cache version.")
+        stereo = None
+        if meta['stereo']:
+            stereo = dict(meta['stereo'], correlation=arrays['correlation'], goniometer=arrays['goniometer'])
+        history = {
+            'seconds_per_point': meta['seconds_per_point'],
+            'momentary': arrays['momentary'],
+            'short_term': arrays['short_term'],
+            'max_momentary': meta['max_momentary'],
+            'max_short_term': meta['max_short_term'],
+            'stereo': stereo,
+        }
+        result = AnalysisResult(clip_histogram=arrays['clip_histogram'], history=history,
+                                **{key: meta[key] for key in _SCALARS})
+    return result, meta['format_info']
+
+def analysis_path_for(original_file_path):
+    """The cached analysis lives next to the (content-addressed) original it describes."""
+    return f"{original_file_path}.analysis"
+
+def write_analysis(result, path, format_info=None):
+    """Write encode_analysis(result, format_info) to `path`; returns the size in bytes."""
+    data = encode_analysis(result, format_info)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+def read_analysis(path):
+    """(AnalysisResult, format_info) from `path`, or None if there is no usable cache entry."""
+    try:
+        with open(path, 'rb') as f:
+            return decode_analysis(f.read())
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
@@ -0,0 +1,526 @@
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import sosfilt
+from app.services.converter import get_stream_layout, iter_audio_blocks
+
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+LRA_RELATIVE_GATE_LU = -20.0
+MOMENTARY_HOPS = 4   # 400 ms gating block, 75% overlap
+SHORT_TERM_HOPS = 30  # 3 s short-term window
+HOP_SECONDS = 0.1
+HISTOGRAM_STEP_LU = 0.01
+HISTOGRAM_BINS = int(round((10.0 - ABSOLUTE_GATE_LUFS) / HISTOGRAM_STEP_LU))
+HISTORY_BUCKET_HOPS = 5  # loudness history keeps the loudest block of every 500 ms
+GONIOMETER_BINS = 128
+CLIP_LEVEL = 32767 / 32768  # full scale at 16 bit; float input at or above this counts as clipped
+CLIP_LEVEL_DB = 20 * np.log10(CLIP_LEVEL)
+LEVEL_HISTOGRAM_STEP_DB = 0.01
+LEVEL_HISTOGRAM_RANGE_DB = (-40.0, 20.0)  # relative to CLIP_LEVEL_DB
+LEVEL_HISTOGRAM_BINS = int(round((LEVEL_HISTOGRAM_RANGE_DB[1] - LEVEL_HISTOGRAM_RANGE_DB[0]) / LEVEL_HISTOGRAM_STEP_DB))
+ANALYSIS_BLOCK_FRAMES = 1 << 16
+TRUE_PEAK_BLOCK_FRAMES = ANALYSIS_BLOCK_FRAMES
+
+# BS.1770-4 Annex 2: 48-tap interpolating FIR for 4x oversampling, split into its 4 phases
+TRUE_PEAK_PHASES = np.array([
+    [0.0017089843750, 0.0109863281250, -0.0196533203125, 0.0332031250000, -0.0594482421875, 0.1373291015625,
+     0.9721679687500, -0.1022949218750, 0.0476074218750, -0.0266113281250, 0.0148925781250, -0.0083007812500],
+    [-0.0291748046875, 0.0292968750000, -0.0517578125000, 0.0891113281250, -0.1665039062500, 0.4650878906250,
+     0.7797851562500, -0.2003173828125, 0.1015625000000, -0.0582275390625, 0.0330810546875, -0.0189208984375],
+    [-0.0189208984375, 0.0330810546875, -0.0582275390625, 0.1015625000000, -0.2003173828125, 0.7797851562500,
+     0.4650878906250, -0.1665039062500, 0.0891113281250, -0.0517578125000, 0.0292968750000, -0.0291748046875],
+    [-0.0083007812500, 0.0148925781250, -0.0266113281250, 0.0476074218750, -0.1022949218750, 0.9721679687500,
+     0.1373291015625, -0.0594482421875, 0.0332031250000, -0.0196533203125, 0.0109863281250, 0.0017089843750],
+], dtype=np.float32)
+TRUE_PEAK_TAPS = TRUE_PEAK_PHASES.shape[1]
+
+@lru_cache(maxsize=None)
+def k_weighting_sos(sample_rate):
+    """
+    BS.1770 K-weighting (high-shelf pre-filter + RLB high-pass) as second-order sections.
+
+    Cached per sample rate; the returned array is shared, so callers must not modify it.
+    """
+    # Stage 1: high shelf, coefficients re-derived for any sample rate
+    f0 = 1681.974450955533
+    gain_db = 3.999843853973347
+    q = 0.7071752369554196
+    k = np.tan(np.pi * f0 / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+        1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0,
+    ]
+    # Stage 2: RLB high-pass
+    f0 = 38.13547087602444
+    q = 0.5003270373238773
+    k = np.tan(np.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, highpass])
+
+def channel_weights(channels):
+    """BS.1770 channel gains: surrounds get +1.5 dB, LFE is excluded."""
+    if channels == 5:
+        return np.array([1.0, 1.0, 1.0, 1.41, 1.41])
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+class TruePeakMeter:
+    """
+    BS.1770-4 true-peak meter: 4x polyphase FIR oversampling, fed block by block.
+
+    The last taps-1 input frames are carried between blocks, so any block size gives the same
+    result as processing the whole signal at once while memory stays bounded by the block.
+    """
+
+    def __init__(self, channels):
+        self._history = np.zeros((TRUE_PEAK_TAPS - 1, channels), dtype=np.float32)
+        self._peak = 0.0
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32).reshape(len(block), -1)
+        if not len(block):
+            return
+        signal = np.concatenate([self._history, block])
+        self._peak = max(self._peak, self._block_peak(signal), float(np.abs(block).max()))
+        self._history = signal[-(TRUE_PEAK_TAPS - 1):].copy()
+
+    @staticmethod
+    def _block_peak(signal):
+        # (frames, channels, taps) view of every window; each window yields the 4 interpolated phases.
+        # Phases mirror each other, so correlation vs. convolution order does not change the maximum.
+        windows = sliding_window_view(signal, TRUE_PEAK_TAPS, axis=0)
+        return float(np.abs(windows @ TRUE_PEAK_PHASES.T).max())
+
+    @property
+    def true_peak(self):
+        """Linear true peak, including the filter tail of the last samples fed."""
+        tail = np.concatenate([self._history, np.zeros_like(self._history)])
+        return max(self._peak, self._block_peak(tail))
+
+    @property
+    def true_peak_db(self):
+        peak = self.true_peak
+        return 20 * np.log10(peak) if peak > 0 else -np.inf
+
+def measure_true_peak(samples, block_frames=TRUE_PEAK_BLOCK_FRAMES):
+    """True peak in dBTP of a (frames, channels) buffer, measured in fixed-size blocks."""
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    meter = TruePeakMeter(samples.shape[1])
+    for start in range(0, len(samples), block_frames):
+        meter.process(samples[start:start + block_frames])
+    return meter.true_peak_db
+
+def _energy_to_lufs(energy):
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10 * np.log10(energy)
+
+def _sliding_mean(values, width):
+    if len(values) < width:
+        return np.empty(0)
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return (cumulative[width:] - cumulative[:-width]) / width
+
+def _clipped_after_gain(clipped, hot, gain_db):
+    if not gain_db:
+        return int(clipped)
+    first = int(np.ceil(-gain_db / LEVEL_HISTOGRAM_STEP_DB - 1e-9)) - int(round(LEVEL_HISTOGRAM_RANGE_DB[0] / LEVEL_HISTOGRAM_STEP_DB))
+    return int(hot[min(max(first, 0), LEVEL_HISTOGRAM_BINS):].sum())
+
+class LevelMeter:
+    """
+    Unweighted level statistics fed block by block: sample peak, RMS, DC offset and clipping.
+
+    Magnitudes within 40 dB of full scale also go into a 0.01 dB histogram, so the clipped-sample
+    count after a later gain change can be read back without another pass over the audio.
+    """
+
+    def __init__(self, channels):
+        self.frames = 0
+        self._peak = np.zeros(channels)
+        self._sum = np.zeros(channels)
+        self._sum_squares = np.zeros(channels)
+        self._clipped = 0
+        self._hot = np.zeros(LEVEL_HISTOGRAM_BINS, dtype=np.int64)
+        self._hot_floor = CLIP_LEVEL * 10 ** (LEVEL_HISTOGRAM_RANGE_DB[0] / 20)
+
+    def process(self, block):
+        magnitude = np.abs(block)
+        self._peak = np.maximum(self._peak, magnitude.max(axis=0))
+        self._sum += block.sum(axis=0, dtype=np.float64)
+        self._sum_squares += np.einsum('ij,ij->j', block, block, dtype=np.float64)
+        self._clipped += int(np.count_nonzero(magnitude >= CLIP_LEVEL))
+        hot = magnitude[magnitude > self._hot_floor]
+        if len(hot):
+            # bin edges sit on CLIP_LEVEL_DB + k * step
+            with np.errstate(divide='ignore'):
+                index = np.floor((20 * np.log10(hot) - CLIP_LEVEL_DB - LEVEL_HISTOGRAM_RANGE_DB[0])
+                                 / LEVEL_HISTOGRAM_STEP_DB).astype(np.int64)
+            self._hot += np.bincount(np.clip(index, 0, LEVEL_HISTOGRAM_BINS - 1), minlength=LEVEL_HISTOGRAM_BINS)
+        self.frames += len(block)
+
+    def clipped_samples(self, gain_db=0.0):
+        """Samples at or above full scale after `gain_db` (exact at 0 dB, 0.01 dB resolution otherwise)."""
+        return _clipped_after_gain(self._clipped, self._hot, gain_db)
+
+    @property
+    def clip_histogram(self):
+        return self._hot
+
+    @property
+    def sample_peak_db(self):
+        peak = self._peak.max() if len(self._peak) else 0.0
+        return 20 * np.log10(peak) if peak > 0 else -np.inf
+
+    @property
+    def rms_db(self):
+        if not self.frames:
+            return -np.inf
+        mean_square = self._sum_squares.sum() / (self.frames * len(self._sum_squares))
+        return 10 * np.log10(mean_square) if mean_square > 0 else -np.inf
+
+    @property
+    def crest_factor_db(self):
+        """Sample peak over RMS; 0 for silence."""
+        return self.sample_peak_db - self.rms_db if np.isfinite(self.rms_db) else 0.0
+
+    @property
+    def dc_offset(self):
+        """Mean value per channel (linear, full scale = 1)."""
+        return self._sum / self.frames if self.frames else np.zeros_like(self._sum)
+
+class StereoMeter:
+    """
+    Phase correlation over time and a mid/side density histogram (goniometer) of the first two
+    channels, fed block by block.
+
+    Correlation uses per-bucket sums of L*R, L^2 and R^2 (the same 500 ms buckets as the loudness
+    history); the goniometer is a fixed bins x bins count of (side, mid) over [-1, 1], mid up.
+    """
+
+    def __init__(self, sample_rate, bins=GONIOMETER_BINS):
+        self.bins = bins
+        self._bucket = int(round(sample_rate * HOP_SECONDS * HISTORY_BUCKET_HOPS))
+        self._partial = np.empty((0, 3), dtype=np.float32)
+        self._buckets = []
+        self._totals = np.zeros(3)
+        self.goniometer = np.zeros((bins, bins), dtype=np.int64)
+
+    def process(self, block):
+        left = block[:, 0]
+        right = block[:, 1]
+        # float32 per-frame products, float64 only once they are summed
+        products = np.empty((len(block), 3), dtype=np.float32)
+        np.multiply(left, right, out=products[:, 0])
+        np.multiply(left, left, out=products[:, 1])
+        np.multiply(right, right, out=products[:, 2])
+        self._totals += products.sum(axis=0, dtype=np.float64)
+        products = np.concatenate([self._partial, products])
+        buckets = len(products) // self._bucket
+        if buckets:
+            self._buckets.append(
+                products[:buckets * self._bucket].reshape(buckets, self._bucket, 3).sum(axis=1, dtype=np.float64))
+        self._partial = products[buckets * self._bucket:]
+
+        half = np.float32(self.bins / 2)
+        scale = np.float32(np.sqrt(0.5)) * half
+        x = np.clip((left - right) * scale + half, 0, self.bins - 1).astype(np.intp)
+        y = np.clip((left + right) * scale + half, 0, self.bins - 1).astype(np.intp)
+        y *= self.bins
+        y += x
+        self.goniometer += np.bincount(y, minlength=self.bins * self.bins).reshape(self.bins, self.bins)
+
+    @staticmethod
+    def _correlation(sums):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return sums[..., 0] / np.sqrt(sums[..., 1] * sums[..., 2])
+
+    def summary(self):
+        """Correlation series (NaN where silent), overall correlation and the goniometer counts."""
+        buckets = self._buckets + ([self._partial.sum(axis=0, keepdims=True, dtype=np.float64)] if len(self._partial) else [])
+        sums = np.concatenate(buckets) if buckets else np.empty((0, 3))
+        return {
+            'correlation': self._correlation(sums),
+            'correlation_overall': float(self._correlation(self._totals)),
+            'goniometer': self.goniometer,
+            'goniometer_extent': 1.0,
+        }
+
+class _LoudnessHistogram:
+    """
+    Fixed-size histogram of block loudness (0.01 LU bins from the absolute gate up to +10 LUFS).
+
+    Each bin keeps its block count and summed energy, so gated means stay exact and only the
+    bin that straddles a relative gate is classified at 0.01 LU resolution.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        self.energy = np.zeros(HISTOGRAM_BINS)
+
+    def add(self, block_energy):
+        loudness = _energy_to_lufs(block_energy)
+        keep = loudness > ABSOLUTE_GATE_LUFS
+        if not keep.any():
+            return
+        index = np.minimum(((loudness[keep] - ABSOLUTE_GATE_LUFS) / HISTOGRAM_STEP_LU).astype(np.int64),
+                           HISTOGRAM_BINS - 1)
+        self.counts += np.bincount(index, minlength=HISTOGRAM_BINS)
+        self.energy += np.bincount(index, weights=block_energy[keep], minlength=HISTOGRAM_BINS)
+
+    def gated(self, relative_gate_lu):
+        """(bin mean energy, bin counts, relative gate) of the blocks passing the relative gate."""
+        used = self.counts > 0
+        if not used.any():
+            return np.empty(0), np.empty(0, dtype=np.int64), -np.inf
+        counts = self.counts[used]
+        bin_energy = self.energy[used] / counts
+        relative_gate = _energy_to_lufs(self.energy[used].sum() / counts.sum()) + relative_gate_lu
+        passing = _energy_to_lufs(bin_energy) > relative_gate
+        return bin_energy[passing], counts[passing], relative_gate
+
+class AudioAnalyzer:
+    """
+    Single-pass analyzer for every mastering metric: one traversal, one block in flight.
+
+    Feed (frames, channels) blocks of any size to process(); each block goes through every meter
+    while it is hot in cache. K-weighting filter state and the sub-400 ms remainder are carried
+    across blocks; 400 ms momentary and 3 s short-term blocks (100 ms hop) are accumulated into
+    fixed histograms, from which integrated loudness, the relative gate and LRA are derived.
+    True peak, unweighted levels (LevelMeter) and stereo image (StereoMeter) are metered
+    alongside. A new metric is a new component in process(), never another pass.
+
+    The meters and histograms are fixed-size. The time series behind history() are not: the
+    momentary/short-term energies (two float32 per 100 ms hop) and StereoMeter's correlation
+    buckets (three float64 per 500 ms) grow linearly with duration, roughly 0.5 MB per hour.
+    """
+
+    def __init__(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = 0
+        self._sos = k_weighting_sos(sample_rate)
+        self._zi = np.zeros((self._sos.shape[0], 2, channels))
+        self._weights = channel_weights(channels)
+        self._hop = int(round(sample_rate * HOP_SECONDS))
+        self._partial = np.empty(0)
+        self._recent_hops = np.empty(0)
+        self._momentary = _LoudnessHistogram()
+        self._short_term = _LoudnessHistogram()
+        self._hops = 0
+        self._momentary_energy = []
+        self._short_term_energy = []
+        self._true_peak = TruePeakMeter(channels)
+        self._levels = LevelMeter(channels)
+        self._stereo = StereoMeter(sample_rate) if channels >= 2 else None
+
+    def process(self, block):
+        block = np.asarray(block).reshape(len(block), -1)
+        if not len(block):
+            return
+        filtered, self._zi = sosfilt(self._sos, block, axis=0, zi=self._zi)
+        energy = np.concatenate([self._partial, np.square(filtered, out=filtered) @ self._weights])
+        hops = len(energy) // self._hop
+        self._partial = energy[hops * self._hop:]
+        if hops:
+            hop_energy = energy[:hops * self._hop].reshape(hops, self._hop).mean(axis=1)
+            history = np.concatenate([self._recent_hops, hop_energy])
+            momentary = _sliding_mean(history[-(hops + MOMENTARY_HOPS - 1):], MOMENTARY_HOPS)
+            short_term = _sliding_mean(history[-(hops + SHORT_TERM_HOPS - 1):], SHORT_TERM_HOPS)
+            self._momentary.add(momentary)
+            self._short_term.add(short_term)
+            # 10 values/s per series as float32: ~150 KB per series per hour, grows with duration
+            self._momentary_energy.append(momentary.astype(np.float32))
+            self._short_term_energy.append(short_term.astype(np.float32))
+            self._recent_hops = history[-(SHORT_TERM_HOPS - 1):]
+            self._hops += hops
+        self._true_peak.process(block)
+        self._levels.process(block)
+        if self._stereo:
+            self._stereo.process(block)
+        self.frames += len(block)
+
+    def integrated_loudness(self):
+        """Gated integrated loudness (LUFS) and its relative gate."""
+        bin_energy, counts, relative_gate = self._momentary.gated(RELATIVE_GATE_LU)
+        if not counts.sum():
+            return -np.inf, float(relative_gate)
+        return float(_energy_to_lufs((bin_energy * counts).sum() / counts.sum())), float(relative_gate)
+
+    def loudness_range(self):
+        """EBU Tech 3342 loudness range (LU) from the gated short-term distribution."""
+        bin_energy, counts, _ = self._short_term.gated(LRA_RELATIVE_GATE_LU)
+        loudness = _energy_to_lufs(bin_energy)
+        total = counts.sum()
+        if not total:
+            return 0.0
+        cumulative = np.cumsum(counts)
+        low, high = (loudness[np.searchsorted(cumulative, q * (total - 1), side='right')] for q in (0.10, 0.95))
+        return float(high - low)
+
+    def _series(self, chunks, bucket_hops):
+        # Pad the front so value i belongs to the window ending at hop i, then keep each bucket's max
+        energy = np.zeros(-(-self._hops // bucket_hops) * bucket_hops, dtype=np.float32)
+        values = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.float32)
+        energy[self._hops - len(values):self._hops] = values
+        return _energy_to_lufs(energy.reshape(-1, bucket_hops).max(axis=1))
+
+    def history(self, bucket_hops=HISTORY_BUCKET_HOPS):
+        """
+        Momentary and short-term loudness over time (LUFS, the loudest block per bucket) plus their
+        maxima. Windows that have not filled yet at the start of the programme read -inf.
+        'stereo' holds the StereoMeter summary on the same time grid (None for mono).
+        """
+        momentary = self._series(self._momentary_energy, bucket_hops)
+        short_term = self._series(self._short_term_energy, bucket_hops)
+        return {
+            'seconds_per_point': bucket_hops * HOP_SECONDS,
+            'momentary': momentary,
+            'short_term': short_term,
+            'max_momentary': float(momentary.max()) if len(momentary) else -np.inf,
+            'max_short_term': float(short_term.max()) if len(short_term) else -np.inf,
+            'stereo': self._stereo.summary() if self._stereo else None,
+        }
+
+    @property
+    def true_peak_db(self):
+        return self._true_peak.true_peak_db
+
+    @property
+    def duration_seconds(self):
+        return self.frames / self.sample_rate
+
+    def result(self):
+        """The finished measurements as an AnalysisResult, detached from the meters' running state."""
+        integrated, relative_gate = self.integrated_loudness()
+        return AnalysisResult(
+            integrated_lufs=integrated,
+            relative_gate=relative_gate,
+            loudness_range=self.loudness_range(),
+            true_peak_db=float(self.true_peak_db),
+            sample_peak_db=float(self._levels.sample_peak_db),
+            rms_db=float(self._levels.rms_db),
+            dc_offset=[float(value) for value in self._levels.dc_offset],
+            clipped_samples=self._levels.clipped_samples(),
+            clip_histogram=self._levels.clip_histogram.copy(),
+            duration_seconds=self.duration_seconds,
+            history=self.history(),
+        )
+
+    def metrics(self, gain_db=0.0):
+        return self.result().metrics(gain_db)
+
+    def loudnorm_stats(self):
+        return self.result().loudnorm_stats()
+
+class AnalysisResult:
+    """
+    Everything an AudioAnalyzer pass measured, without the meters: small enough to cache next to
+    the original and reuse instead of analyzing the same audio again.
+    """
+
+    def __init__(self, integrated_lufs, relative_gate, loudness_range, true_peak_db, sample_peak_db, rms_db,
+                 dc_offset, clipped_samples, clip_histogram, duration_seconds, history):
+        self.integrated_lufs = integrated_lufs
+        self.relative_gate = relative_gate
+        self.loudness_range = loudness_range
+        self.true_peak_db = true_peak_db
+        self.sample_peak_db = sample_peak_db
+        self.rms_db = rms_db
+        self.dc_offset = dc_offset
+        self.clipped_samples = clipped_samples
+        self.clip_histogram = clip_histogram
+        self.duration_seconds = duration_seconds
+        self.history = history
+
+    @property
+    def crest_factor_db(self):
+        """Sample peak over RMS; 0 for silence."""
+        return self.sample_peak_db - self.rms_db if np.isfinite(self.rms_db) else 0.0
+
+    def metrics(self, gain_db=0.0):
+        """
+        Every metric, for the programme as it would be after a plain gain of `gain_db`.
+
+        Loudness and levels move by gain_db, DC offset and the goniometer scale with it, LRA,
+        crest factor and correlation do not change, and clipping is read from LevelMeter's
+        histogram - so a gain stage never needs the audio measured again.
+        """
+        stereo = self.history['stereo']
+        return {
+            'integrated_lufs': self.integrated_lufs + gain_db,
+            'loudness_range': self.loudness_range,
+            'true_peak_db': self.true_peak_db + gain_db,
+            'sample_peak_db': self.sample_peak_db + gain_db,
+            'rms_db': self.rms_db + gain_db,
+            'crest_factor_db': float(self.crest_factor_db),
+            'dc_offset': [value * 10 ** (gain_db / 20) for value in self.dc_offset],
+            'clipped_samples': _clipped_after_gain(self.clipped_samples, self.clip_histogram, gain_db),
+            'correlation': stereo['correlation_overall'] if stereo else None,
+            'duration_seconds': self.duration_seconds,
+            'history': shift_history(self.history, gain_db) if gain_db else self.history,
+        }
+
+    def loudnorm_stats(self):
+        """Results keyed like ffmpeg loudnorm's JSON report."""
+        return {
+            'input_i': self.integrated_lufs,
+            'input_lra': self.loudness_range,
+            'input_tp': self.true_peak_db,
+            'input_thresh': self.relative_gate,
+        }
+
+def shift_history(history, gain_db):
+    """
+    The history of the same programme after a plain gain change: loudness moves by gain_db and
+    the goniometer's axes scale with it (correlation is gain-independent).
+    """
+    shifted = dict(history)
+    for key in ('momentary', 'short_term', 'max_momentary', 'max_short_term'):
+        shifted[key] = history[key] + gain_db
+    if history.get('stereo'):
+        shifted['stereo'] = dict(history['stereo'])
+        shifted['stereo']['goniometer_extent'] = history['stereo']['goniometer_extent'] * 10 ** (gain_db / 20)
+    return shifted
+
+def analyze_audio(samples, sample_rate, block_frames=ANALYSIS_BLOCK_FRAMES):
+    """Run a float (frames, channels) buffer through one AudioAnalyzer pass and return it."""
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    analyzer = AudioAnalyzer(sample_rate, samples.shape[1])
+    for start in range(0, len(samples), block_frames):
+        analyzer.process(samples[start:start + block_frames])
+    return analyzer
+
+def analyze_file(filepath, format_info=None, progress=None):
+    """
+    AudioAnalyzer over a file of any length, streamed through the decode pipe one block at a time.
+    The decoded audio is never held whole; only the history series grow (see AudioAnalyzer).
+    """
+    sample_rate, channels = get_stream_layout(filepath, format_info)
+    analyzer = AudioAnalyzer(sample_rate, channels)
+    for block in iter_audio_blocks(filepath, sample_rate, channels, progress=progress):
+        analyzer.process(block)
+    return analyzer
+
+def measure_loudness(samples, sample_rate, block_frames=ANALYSIS_BLOCK_FRAMES):
+    """
+    Measure a float (frames, channels) buffer in-process the way ffmpeg's loudnorm first pass does.
+
+    Returns a dict keyed like loudnorm's JSON report (input_i, input_lra, input_tp,
+    input_thresh) so the values can be handed straight to a single loudnorm encode.
+    """
+    return analyze_audio(samples, sample_rate, block_frames).loudnorm_stats()
+
+def measure_file_loudness(filepath, format_info=None):
+    """Loudnorm-style stats of a file plus 'duration_seconds', streamed through analyze_file()."""
+    analyzer = analyze_file(filepath, format_info)
+    stats = analyzer.loudnorm_stats()
+    stats['duration_seconds'] = analyzer.duration_seconds
+    return stats
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+import secrets
+from collections import OrderedDict
+from app.services.storage import ORIGINALS_DIR, UPLOAD_CHUNK_BYTES, original_path_for
+from app.services.probe import check_header
+
+UPLOAD_SESSION_TTL_SECONDS = 24 * 3600  # an upload not resumed for a day is abandoned
+CLIENT_CHUNK_BYTES = 8 * 1024 * 1024  # what clients are told to send per PATCH
+# Extensions whose container check_header() recognizes; ADTS .aac and .wma are left to ffmpeg
+HEADER_CHECKED_EXTENSIONS = ('.wav', '.aiff', '.flac', '.mp3', '.ogg', '.opus', '.m4a')
+_PREFIX = '.chunked-'
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+DIGEST_CACHE_SIZE = 64
+# upload id -> (offset, sha256, last used) of the bytes this process wrote, so appends keep
+# hashing where the previous chunk stopped. Only a per-worker shortcut: a miss (another worker
+# took the last chunk, or the entry was evicted) re-reads the file once. Entries go when the
+# upload completes or is dropped, after UPLOAD_SESSION_TTL_SECONDS idle, or past DIGEST_CACHE_SIZE.
+_digests = OrderedDict()
+
+class UploadError(ValueError):
+    """A chunked upload request that cannot be applied; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _paths(upload_folder, user_id, upload_id):
+    directory = os.path.join(upload_folder, ORIGINALS_DIR, str(user_id))
+    data_path = os.path.join(directory, f"{_PREFIX}{upload_id}")
+    return data_path, f"{data_path}.json"
+
+def _write_meta(meta_path, meta):
+    temp_path = f"{meta_path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temp_path, meta_path)
+
+def _discard(data_path, meta_path, upload_id):
+    _digests.pop(upload_id, None)
+    for path in (data_path, meta_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+def purge_stale_uploads(upload_folder, user_id, max_age=UPLOAD_SESSION_TTL_SECONDS, now=None):
+    """Remove the user's uploads that have not received a chunk for `max_age` seconds; returns how many."""
+    directory = os.path.join(upload_folder, ORIGINALS_DIR, str(user_id))
+    cutoff = (now if now is not None else time.time()) - max_age
+    purged = 0
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if not (name.startswith(_PREFIX) and name.endswith('.json')):
+            continue
+        upload_id = name[len(_PREFIX):-len('.json')]
+        data_path, meta_path = _paths(upload_folder, user_id, upload_id)
+        last_activity = max(os.path.getmtime(path) for path in (data_path, meta_path) if os.path.exists(path))
+        if last_activity < cutoff:
+            _discard(data_path, meta_path, upload_id)
+            purged += 1
+    return purged
+
+def create_upload(upload_folder, user_id, filename, extension, length, options):
+    """
+    Open a resumable upload of `length` bytes. The data file sits in the user's originals
+    directory, next to where complete_upload() files it, so finishing is a rename and never a
+    copy. Returns the upload id.
+    """
+    purge_stale_uploads(upload_folder, user_id)
+    upload_id = secrets.token_hex(16)
+    data_path, meta_path = _paths(upload_folder, user_id, upload_id)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    open(data_path, 'xb').close()
+    _write_meta(meta_path, {
+        'filename': filename,
+        'extension': extension.lower(),
+        'length': int(length),
+        'options': options,
+        'container': None,
+    })
+    return upload_id
+
+def read_upload(upload_folder, user_id, upload_id):
+    """The upload's metadata plus its 'offset' (bytes on disk), or None if the user has no such upload."""
+    if not isinstance(upload_id, str) or not _UPLOAD_ID.match(upload_id):
+        return None
+    data_path, meta_path = _paths(upload_folder, user_id, upload_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['offset'] = os.path.getsize(data_path)
+    except (OSError, ValueError):
+        return None
+    return meta
+
+def _remember_digest(upload_id, offset, digest, now=None):
+    now = time.monotonic() if now is None else now
+    _digests[upload_id] = (offset, digest, now)
+    _digests.move_to_end(upload_id)
+    while len(_digests) > DIGEST_CACHE_SIZE or next(iter(_digests.values()))[2] < now - UPLOAD_SESSION_TTL_SECONDS:
+        _digests.popitem(last=False)
+
+def _digest_at(data_path, upload_id, offset):
+    cached = _digests.pop(upload_id, None)
+    if cached and cached[0] == offset:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(data_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest
+
+def append_chunk(upload_folder, user_id, upload_id, offset, stream, chunk_bytes=UPLOAD_CHUNK_BYTES):
+    """
+    Append the body `stream` at `offset` and return the upload's metadata with the new offset.
+
+    Bytes go straight to the data file and into the running SHA-256; when the connection drops
+    mid-chunk, what arrived is kept and the client resumes from the offset read_upload()
+    reports. Once the first HEADER_CHECK_BYTES are in, the header is parsed and an upload that
+    is not audio we can read is deleted on the spot (UploadError 415). Raises UploadError 404
+    for unknown uploads, 409 when `offset` is not where the stored bytes end and 413 for bytes
+    past the declared length.
+    """
+    meta = read_upload(upload_folder, user_id, upload_id)
+    if meta is None:
+        raise UploadError("Upload not found", 404)
+    data_path, meta_path = _paths(upload_folder, user_id, upload_id)
+    with open(data_path, 'ab') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)  # one writer per upload, even across web workers
+        current = os.fstat(f.fileno()).st_size
+        if offset != current:
+            raise UploadError(f"Upload offset is {current}", 409)
+        digest = _digest_at(data_path, upload_id, current)
+        try:
+            while True:
+                chunk = stream.read(chunk_bytes)
+                if not chunk:
+                    break
+                if current + len(chunk) > meta['length']:
+                    raise UploadError("Chunk goes past the declared upload length", 413)
+                f.write(chunk)
+                digest.update(chunk)
+                current += len(chunk)
+        finally:
+            f.flush()
+            _remember_digest(upload_id, current, digest)
+        meta['offset'] = current
+        if meta['container'] is None and meta['extension'] in HEADER_CHECKED_EXTENSIONS:
+            try:
+                meta['container'] = check_header(data_path, complete=current == meta['length'])
+            except ValueError as e:
+                _discard(data_path, meta_path, upload_id)
+                raise UploadError(str(e), 415) from e
+            if meta['container']:
+                _write_meta(meta_path, {key: value for key, value in meta.items() if key != 'offset'})
+    return meta
+
+def complete_upload(upload_folder, user_id, upload_id):
+    """
+    File a fully received upload under its content hash, like storage.store_upload().
+
+    Returns (path, sha256 hex digest, size in bytes, created, metadata); created is False when
+    the user already had an original with the same content. Raises UploadError 404 for unknown
+    uploads and 409 while bytes are still missing.
+    """
+    meta = read_upload(upload_folder, user_id, upload_id)
+    if meta is None:
+        raise UploadError("Upload not found", 404)
+    if meta['offset'] != meta['length']:
+        raise UploadError(f"Upload is incomplete ({meta['offset']} of {meta['length']} bytes)", 409)
+    data_path, meta_path = _paths(upload_folder, user_id, upload_id)
+    if meta['container'] is None and meta['extension'] in HEADER_CHECKED_EXTENSIONS:
+        try:
+            check_header(data_path, complete=True)
+        except ValueError as e:
+            _discard(data_path, meta_path, upload_id)
+            raise UploadError(str(e), 415) from e
+    content_hash = _digest_at(data_path, upload_id, meta['offset']).hexdigest()
+    path = original_path_for(upload_folder, user_id, content_hash, meta['extension'])
+    created = not os.path.exists(path)
+    if created:
+        os.replace(data_path, path)
+    _discard(data_path, meta_path, upload_id)
+    return path, content_hash, meta['length'], created, meta
+
+def abort_upload(upload_folder, user_id, upload_id):
+    """Drop an upload and its bytes; returns False if there was no such upload."""
+    if read_upload(upload_folder, user_id, upload_id) is None:
+        return False
+    _discard(*_paths(upload_folder, user_id, upload_id), upload_id)
+    return True
@@ -0,0 +1,206 @@
+import os
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+import numpy as np
+import soundfile as sf
+
+DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_CHANNELS = 2
+PCM_DTYPE = np.float32
+
+def get_stream_layout(filepath, format_info=None):
+    """Return (sample_rate, channels) of the first audio stream, without forcing a layout."""
+    if format_info and format_info.get('sample_rate') and format_info.get('channels'):
+        return int(format_info['sample_rate']), int(format_info['channels'])
+    try:
+        info = sf.info(filepath)
+        return info.samplerate, info.channels
+    except Exception:
+        return DEFAULT_SAMPLE_RATE, DEFAULT_CHANNELS
+
+def _read_progress(read_fd, progress):
+    """Parse ffmpeg's -progress key=value blocks, calling progress(seconds of output) once per block."""
+    seconds = None
+    with os.fdopen(read_fd, 'r', errors='replace') as stream:
+        for line in stream:
+            key, _, value = line.strip().partition('=')
+            if key == 'out_time_us':
+                try:
+                    seconds = int(value) / 1e6
+                except ValueError:
+                    pass  # 'N/A' until the first frame is out
+            elif key == 'progress' and seconds is not None:
+                progress(seconds)
+
+@contextmanager
+def _progress_pipe(cmd, progress):
+    """
+    With a `progress` callback, have ffmpeg write -progress reports to a pipe of its own (stdout and
+    stderr are taken) and parse them on a reader thread while the caller runs the process.
+    Yields (cmd, pass_fds) for Popen.
+    """
+    if progress is None:
+        yield cmd, ()
+        return
+    read_fd, write_fd = os.pipe()
+    reader = threading.Thread(target=_read_progress, args=(read_fd, progress), daemon=True)
+    reader.start()
+    try:
+        yield [cmd[0], '-progress', f"pipe:{write_fd}"] + cmd[1:], (write_fd,)
+    finally:
+        os.close(write_fd)  # ffmpeg holds its own copy; once it exits the reader sees EOF
+        reader.join(timeout=5)
+
+def _decode_command(filepath, sample_rate, channels):
+    return [
+        'ffmpeg', '-nostdin', '-nostats', '-v', 'error', '-i', filepath,
+        '-map', '0:a:0', '-vn',
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ac', str(channels), '-ar', str(sample_rate),
+        'pipe:1'
+    ]
+
+def _read_pcm(cmd, channels, capacity_frames, progress=None):
+    """
+    Run `cmd` and read the float32 PCM it writes to stdout straight into one NumPy buffer.
+
+    The buffer starts at `capacity_frames` and only grows if ffmpeg writes more. Returns
+    ((frames, channels) array, ffmpeg's stderr); raises subprocess.CalledProcessError on failure.
+    """
+    frame_bytes = channels * np.dtype(PCM_DTYPE).itemsize
+    buffer = np.empty(max(capacity_frames, 1) * channels, dtype=PCM_DTYPE)
+    filled = 0
+    with tempfile.TemporaryFile() as stderr_file, _progress_pipe(cmd, progress) as (cmd, pass_fds):
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, pass_fds=pass_fds)
+        try:
+            view = memoryview(buffer).cast('B')
+            while True:
+                if filled == len(view):
+                    grown = np.empty(buffer.size * 2, dtype=PCM_DTYPE)
+                    grown[:buffer.size] = buffer
+                    buffer = grown
+                    view = memoryview(buffer).cast('B')
+                read = proc.stdout.readinto(view[filled:])
+                if not read:
+                    break
+                filled += read
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors='replace')
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+
+    frames = filled // frame_bytes
+    return buffer[:frames * channels].reshape(frames, channels), stderr
+
+def _capacity_frames(format_info, sample_rate):
+    duration = float((format_info or {}).get('duration') or 0)
+    return max(int(duration * sample_rate) + sample_rate, sample_rate)  # one second of slack
+
+def decode_audio(filepath, format_info=None, progress=None):
+    """
+    Decode any ffmpeg-readable file straight into a float32 array shaped (frames, channels).
+
+    ffmpeg writes raw PCM to stdout and the bytes are read directly into a NumPy buffer,
+    so nothing intermediate lands on disk. The buffer is pre-sized from the probed duration
+    and only grows if the probe under-reported it, so memory grows with duration; use
+    iter_audio_blocks() when the audio is only metered and drawn. `progress`, if given, is
+    called with the seconds decoded so far.
+    """
+    sample_rate, channels = get_stream_layout(filepath, format_info)
+    cmd = _decode_command(filepath, sample_rate, channels)
+    samples, _ = _read_pcm(cmd, channels, _capacity_frames(format_info, sample_rate), progress)
+    return samples, sample_rate
+
+def pcm_output_args(sample_rate, channels):
+    """ffmpeg output arguments that write float32 PCM to stdout."""
+    return ['-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', str(channels), '-ar', str(sample_rate), 'pipe:1']
+
+def _iter_pcm(cmd, channels, block_frames, progress=None, report=None):
+    """
+    Run `cmd` and yield the float32 PCM it writes to stdout as (frames, channels) blocks.
+
+    Once ffmpeg exits its stderr is appended to `report` (a list), if given; raises
+    subprocess.CalledProcessError (with the stderr) if it fails.
+    """
+    frame_bytes = channels * np.dtype(PCM_DTYPE).itemsize
+    with tempfile.TemporaryFile() as stderr_file, _progress_pipe(cmd, progress) as (cmd, pass_fds):
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, pass_fds=pass_fds)
+        try:
+            while True:
+                chunk = proc.stdout.read(block_frames * frame_bytes)
+                frames = len(chunk) // frame_bytes
+                if not frames:
+                    break
+                yield np.frombuffer(chunk, dtype=PCM_DTYPE, count=frames * channels).reshape(frames, channels)
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors='replace')
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    if report is not None:
+        report.append(stderr)
+
+def iter_ffmpeg_pcm(filepath, output_args, format_info=None, loglevel='error', progress=None, block_frames=65536,
+                    report=None):
+    """
+    Run one ffmpeg over `filepath` whose `output_args` write files and end with a float32 PCM
+    tap on stdout (see pcm_output_args) at the source rate and layout, yielding the tap as
+    (frames, channels) blocks.
+
+    This is the single-process render: ffmpeg decodes, filters and encodes every output while
+    the caller meters the tap one block at a time, so the programme is never held in memory.
+    ffmpeg's stderr (its filter reports) is appended to `report` once it exits; raises
+    subprocess.CalledProcessError if ffmpeg fails.
+    """
+    _, channels = get_stream_layout(filepath, format_info)
+    cmd = ['ffmpeg', '-nostdin', '-nostats', '-y', '-v', loglevel, '-i', filepath] + list(output_args)
+    return _iter_pcm(cmd, channels, block_frames, progress, report)
+
+def iter_audio_blocks(filepath, sample_rate, channels, block_frames=65536, progress=None):
+    """
+    Stream a file as float32 (frames, channels) blocks from the ffmpeg decode pipe.
+
+    Only one block of decoded audio is held at a time, unlike decode_audio(), which keeps the
+    whole programme in memory.
+    """
+    return _iter_pcm(_decode_command(filepath, sample_rate, channels), channels, block_frames, progress)
+
+def pcm_input_args(sample_rate, channels):
+    """ffmpeg input arguments for float32 PCM written to its stdin."""
+    return ['-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0']
+
+def run_ffmpeg_with_pcm(samples, sample_rate, output_args, block_frames=65536, loglevel='error', progress=None):
+    """
+    Run ffmpeg with a float32 (frames, channels) buffer piped to stdin in fixed-size blocks.
+
+    Returns ffmpeg's stderr so callers can pick up filter reports (raise loglevel to 'info' for
+    those). Raises subprocess.CalledProcessError (with the stderr) if the encode fails.
+    """
+    cmd = ['ffmpeg', '-nostats', '-y', '-v', loglevel] + pcm_input_args(sample_rate, samples.shape[1]) + list(output_args)
+    with tempfile.TemporaryFile() as stderr_file, _progress_pipe(cmd, progress) as (cmd, pass_fds):
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file,
+                                pass_fds=pass_fds)
+        try:
+            for start in range(0, len(samples), block_frames):
+                block = np.ascontiguousarray(samples[start:start + block_frames], dtype='<f4')
+                proc.stdin.write(memoryview(block).cast('B'))
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its return code and stderr say why
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = proc.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors='replace')
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    return stderr
@@ -0,0 +1,83 @@
+import os
+import re
+import hashlib
+import tempfile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+COVERS_DIR = 'covers'
+COVER_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+COVER_MAX_PIXELS = 40_000_000  # checked against the header before decoding; larger images are refused
+COVER_MAX_SIDE = 1400  # px; what the stores ask for, and plenty for an embedded tag
+COVER_JPEG_QUALITY = 90
+_CHUNK_BYTES = 1 << 16
+_COVER_ID = re.compile(r'^[0-9a-f]{64}$')
+
+def is_cover_art_id(value):
+    """Cover ids are SHA-256 hex digests; anything else never names a file."""
+    return isinstance(value, str) and bool(_COVER_ID.match(value))
+
+def cover_art_path_for(upload_folder, user_id, cover_id):
+    """Normalized covers live per user under the id of the image they were made from."""
+    return os.path.join(upload_folder, COVERS_DIR, str(user_id), f"{cover_id}.jpg")
+
+def _normalize(source, destination):
+    """Re-encode `source` as an upright, opaque RGB JPEG of at most COVER_MAX_SIDE px a side."""
+    try:
+        with Image.open(source) as image:
+            # Image.open() only reads the header, so this runs before any pixel is decoded
+            if image.width * image.height > COVER_MAX_PIXELS:
+                raise ValueError(f"Cover art is larger than {COVER_MAX_PIXELS // 1_000_000} megapixels")
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+            image.thumbnail((COVER_MAX_SIDE, COVER_MAX_SIDE), Image.Resampling.LANCZOS)
+            image.save(destination, 'JPEG', quality=COVER_JPEG_QUALITY, optimize=True)
+            return image.size
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ValueError(f"Unsupported or corrupt image: {e}") from e
+
+def store_cover_art(stream, upload_folder, user_id, max_bytes=COVER_MAX_UPLOAD_BYTES):
+    """
+    Store an uploaded cover once per batch: the bytes are hashed while they are spooled, then
+    decoded and re-encoded by _normalize() into the user's covers directory.
+
+    Returns (cover id, (width, height), created). Uploading the same image again reuses the
+    stored JPEG without decoding it. Raises ValueError for non-images, images over
+    COVER_MAX_PIXELS and uploads over `max_bytes`.
+    """
+    directory = os.path.join(upload_folder, COVERS_DIR, str(user_id))
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.SpooledTemporaryFile(max_size=1 << 20) as spool:
+        while True:
+            chunk = stream.read(_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"Cover art is larger than {max_bytes // (1024 * 1024)} MB")
+            digest.update(chunk)
+            spool.write(chunk)
+        if not size:
+            raise ValueError("Cover art file is empty")
+        cover_id = digest.hexdigest()
+        path = cover_art_path_for(upload_folder, user_id, cover_id)
+        if os.path.exists(path):
+            with Image.open(path) as existing:
+                return cover_id, existing.size, False
+        spool.seek(0)
+        temp = tempfile.NamedTemporaryFile(dir=directory, prefix='.cover-', suffix='.jpg', delete=False)
+        temp.close()
+        try:
+            dimensions = _normalize(spool, temp.name)
+        except BaseException:
+            os.remove(temp.name)
+            raise
+    os.replace(temp.name, path)
+    return cover_id, dimensions, True
@@ -0,0 +1,70 @@
+import numpy as np
+
+SILENCE_WINDOW_SECONDS = 0.01
+SILENCE_SCAN_SECONDS = 1.0
+SILENCE_PADDING_SECONDS = 0.1
+
+# In-place processing on float32 (frames, channels) buffers. Every function mutates `samples`
+# (or returns a view of it) so a task never holds more than one copy of the decoded audio.
+
+def db_to_gain(gain_db):
+    return 10 ** (gain_db / 20)
+
+def apply_gain(samples, gain_db):
+    """Scale the buffer by gain_db in place."""
+    if gain_db:
+        samples *= np.float32(db_to_gain(gain_db))
+    return samples
+
+def apply_fade_in(samples, sample_rate, seconds):
+    """Linear fade from silence over the first `seconds`, in place."""
+    frames = min(int(round(float(seconds) * sample_rate)), len(samples))
+    if frames > 0:
+        samples[:frames] *= np.linspace(0.0, 1.0, frames, endpoint=False, dtype=np.float32)[:, None]
+    return samples
+
+def apply_fade_out(samples, sample_rate, seconds):
+    """Linear fade to silence over the last `seconds`, in place."""
+    frames = min(int(round(float(seconds) * sample_rate)), len(samples))
+    if frames > 0:
+        samples[-frames:] *= np.linspace(1.0, 0.0, frames, endpoint=False, dtype=np.float32)[:, None]
+    return samples
+
+def _first_loud_window(block, window, threshold_power):
+    """Index of the first `window`-frame slice of `block` whose mean power exceeds the threshold."""
+    windows = len(block) // window
+    if not windows:
+        return None
+    # Splitting the frame axis is a strided view (also for the reversed tail scan), and einsum
+    # reduces it without materialising the squared samples.
+    frames = block[:windows * window].reshape(windows, window, -1)
+    power = np.einsum('ijk,ijk->i', frames, frames) / (window * frames.shape[2])
+    loud = np.flatnonzero(power > threshold_power)
+    return int(loud[0]) if len(loud) else None
+
+def _silent_edge_frames(samples, window, threshold_power, chunk):
+    """Frames of silence at the start of `samples`, scanned chunk by chunk; None if all silent."""
+    for offset in range(0, len(samples), chunk):
+        index = _first_loud_window(samples[offset:offset + chunk], window, threshold_power)
+        if index is not None:
+            return offset + index * window
+    return None
+
+def trim_silence(samples, sample_rate, silence_thresh=-50.0, padding=SILENCE_PADDING_SECONDS):
+    """
+    Trim leading and trailing silence, keeping `padding` seconds next to the audio.
+
+    Only the edges are scanned (10 ms RMS windows, one second at a time from each end), so the
+    cost follows the length of the silence rather than the track, and interior pauses are kept.
+    Returns a view of `samples`; an entirely silent buffer is returned unchanged.
+    """
+    window = max(int(sample_rate * SILENCE_WINDOW_SECONDS), 1)
+    chunk = max(int(sample_rate * SILENCE_SCAN_SECONDS) // window, 1) * window
+    threshold_power = 10 ** (silence_thresh / 10)
+
+    head = _silent_edge_frames(samples, window, threshold_power, chunk)
+    if head is None:
+        return samples
+    tail = _silent_edge_frames(samples[::-1], window, threshold_power, chunk)
+    pad = int(padding * sample_rate)
+    return samples[max(head - pad, 0):len(samples) - max(tail - pad, 0)]
@@ -0,0 +1,49 @@
+import struct
+import numpy as np
+
+HISTORY_MAGIC = b'WBLH'
+HISTORY_VERSION = 1
+HISTORY_SCALE = 100          # stored as centi-LU
+HISTORY_NO_VALUE = -32768    # -inf / window not filled yet
+
+# Layout (little endian):
+#   header  magic 4s | version u16 | series u16 | seconds_per_point f32 | points u32
+#   body    series x points x i16 (LUFS * 100), momentary first, then short-term
+_HEADER = struct.Struct('<4sHHfI')
+SERIES_ORDER = ('momentary', 'short_term')
+
+def _quantize(lufs):
+    values = np.round(np.asarray(lufs, dtype=np.float64) * HISTORY_SCALE)
+    quantized = np.where(np.isfinite(values), np.clip(values, HISTORY_NO_VALUE + 1, 32767), HISTORY_NO_VALUE)
+    return quantized.astype('<i2')
+
+def encode_history(history):
+    """Serialize AudioAnalyzer.history() series into 2 bytes per point and series."""
+    points = len(history['momentary'])
+    chunks = [_HEADER.pack(HISTORY_MAGIC, HISTORY_VERSION, len(SERIES_ORDER), history['seconds_per_point'], points)]
+    chunks.extend(_quantize(history[key]).tobytes() for key in SERIES_ORDER)
+    return b''.join(chunks)
+
+def decode_history(data):
+    """Inverse of encode_history: {'seconds_per_point', 'momentary', 'short_term'} with -inf restored."""
+    magic, version, series, seconds_per_point, points = _HEADER.unpack_from(data, 0)
+    if magic != HISTORY_MAGIC or version != HISTORY_VERSION:
+        raise ValueError("Not a loudness history file.")
+    history = {'seconds_per_point': seconds_per_point}
+    for index, key in enumerate(SERIES_ORDER[:series]):
+        raw = np.frombuffer(data, dtype='<i2', count=points, offset=_HEADER.size + index * points * 2)
+        values = raw / HISTORY_SCALE
+        values[raw == HISTORY_NO_VALUE] = -np.inf
+        history[key] = values
+    return history
+
+def history_path_for(processed_file_path):
+    """The history lives next to the processed file it describes."""
+    return f"{processed_file_path}.loudness"
+
+def write_history(history, path):
+    """Write encode_history(history) to `path`; returns the size in bytes."""
+    data = encode_history(history)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
@@ -0,0 +1,196 @@
+import os
+import json
+import subprocess
+import mutagen
+import soundfile as sf
+from mutagen.mp3 import MP3, BitrateMode
+from mutagen.mp4 import MP4
+
+LOSSLESS_FORMATS = ['wav', 'flac', 'aiff', 'alac']
+# format_name as ffprobe reports it, so probes from either path compare equal
+FORMAT_NAMES = {'wav': 'wav', 'aiff': 'aiff', 'flac': 'flac', 'mp3': 'mp3', 'ogg': 'ogg',
+                'mp4': 'mov,mp4,m4a,3gp,3g2,mj2'}
+CODEC_LONG_NAMES = {
+    'flac': 'FLAC (Free Lossless Audio Codec)',
+    'mp3': 'MP3 (MPEG audio layer 3)',
+    'vorbis': 'Vorbis',
+    'opus': 'Opus (Opus Interactive Audio Codec)',
+    'aac': 'AAC (Advanced Audio Coding)',
+    'alac': 'ALAC (Apple Lossless Audio Codec)',
+}
+# libsndfile PCM subtypes: (ffmpeg codec stem, bits per sample)
+_PCM_SUBTYPES = {'PCM_U8': ('u8', 8), 'PCM_S8': ('s8', 8), 'PCM_16': ('s16', 16), 'PCM_24': ('s24', 24),
+                 'PCM_32': ('s32', 32), 'FLOAT': ('f32', 32), 'DOUBLE': ('f64', 64)}
+_BITRATE_MODES = {BitrateMode.CBR: 'cbr', BitrateMode.VBR: 'vbr', BitrateMode.ABR: 'abr'}
+_SNIFF_BYTES = 12
+HEADER_CHECK_BYTES = 64 * 1024  # holds the header of every container check_header() parses
+OPUS_SAMPLE_RATE = 48000  # Opus always decodes at 48 kHz
+
+def _id3_size(header):
+    # ID3v2 size is four 7-bit bytes, plus the 10-byte header and an optional 10-byte footer
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    return size + 10 + (10 if header[5] & 0x10 else 0)
+
+def _sniff(header):
+    if header[:4] in (b'RIFF', b'RF64', b'BW64') and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:4] == b'FORM' and header[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if header[:4] == b'fLaC':
+        return 'flac'
+    if header[:4] == b'OggS':
+        return 'ogg'
+    if header[4:8] == b'ftyp':
+        return 'mp4'
+    # MPEG audio frame sync; layer bits 00 would be ADTS AAC, which is left to ffprobe
+    if len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0 and header[1] & 0x06:
+        return 'mp3'
+    return None
+
+def sniff_container(filepath):
+    """Container of `filepath` from its magic bytes ('wav', 'aiff', 'flac', 'mp3', 'ogg', 'mp4') or None."""
+    with open(filepath, 'rb') as f:
+        header = f.read(_SNIFF_BYTES)
+        if header[:3] == b'ID3' and len(header) >= 10:
+            # An ID3 tag is usually MP3, but FLAC files sometimes carry one too
+            f.seek(_id3_size(header))
+            after_tag = f.read(_SNIFF_BYTES)
+            return _sniff(after_tag) or 'mp3'
+    return _sniff(header)
+
+def _format_info(filepath, container, codec, sample_rate, channels, duration, bitrate=None,
+                 bits_per_sample=None, bitrate_mode=None):
+    format_name = FORMAT_NAMES[container]
+    return {
+        'codec': codec,
+        'codec_long_name': CODEC_LONG_NAMES.get(codec) or _pcm_long_name(codec),
+        'format_name': format_name,
+        'bitrate': int(bitrate) if bitrate else None,
+        'sample_rate': int(sample_rate) if sample_rate else None,
+        'channels': int(channels),
+        'duration': float(duration),
+        'bits_per_sample': int(bits_per_sample) if bits_per_sample else None,
+        'bitrate_mode': bitrate_mode,
+        'is_lossless': any(fmt in codec or fmt in format_name for fmt in LOSSLESS_FORMATS),
+        'file_extension': os.path.splitext(filepath)[1].lower(),
+    }
+
+def _pcm_long_name(codec):
+    kind = {'u': 'unsigned', 's': 'signed', 'f': 'floating point'}[codec[4]]
+    bits = ''.join(ch for ch in codec[5:] if ch.isdigit())
+    endian = {'le': ' little-endian', 'be': ' big-endian'}.get(codec[-2:], '')
+    return f"PCM {kind} {bits}-bit{endian}"
+
+def _probe_sndfile(filepath, container):
+    info = sf.info(filepath)
+    if container == 'flac':
+        return _format_info(filepath, container, 'flac', info.samplerate, info.channels, info.duration,
+                            bits_per_sample=_PCM_SUBTYPES.get(info.subtype, (None, None))[1])
+    if info.subtype not in _PCM_SUBTYPES:
+        return None  # ADPCM, u-law and friends: ffprobe names them properly
+    stem, bits = _PCM_SUBTYPES[info.subtype]
+    codec = f"pcm_{stem}" if bits == 8 else f"pcm_{stem}{'be' if container == 'aiff' else 'le'}"
+    return _format_info(filepath, container, codec, info.samplerate, info.channels, info.duration,
+                        bitrate=info.samplerate * info.channels * bits, bits_per_sample=bits)
+
+def _probe_mutagen(filepath, container):
+    audio = MP3(filepath) if container == 'mp3' else MP4(filepath) if container == 'mp4' else mutagen.File(filepath)
+    if audio is None:
+        return None
+    info = audio.info
+    if container == 'mp3':
+        codec = 'mp3'
+    elif container == 'mp4':
+        codec = {'mp4a': 'aac', 'alac': 'alac'}.get(info.codec.split('.')[0])
+    else:
+        codec = {'OggVorbis': 'vorbis', 'OggOpus': 'opus', 'OggFLAC': 'flac'}.get(type(audio).__name__)
+    if codec is None:
+        return None
+    sample_rate = OPUS_SAMPLE_RATE if codec == 'opus' else getattr(info, 'sample_rate', None)
+    bitrate = getattr(info, 'bitrate', None) if codec != 'flac' else None
+    return _format_info(filepath, container, codec, sample_rate, info.channels, info.length, bitrate=bitrate,
+                        bits_per_sample=getattr(info, 'bits_per_sample', None),
+                        bitrate_mode=_BITRATE_MODES.get(getattr(info, 'bitrate_mode', None)))
+
+def probe_header(filepath):
+    """
+    In-process probe of WAV/AIFF/FLAC (soundfile) and MP3/OGG/M4A (mutagen) headers, in the
+    shape of ffprobe_format(). Returns None for anything else - or anything unreadable - so
+    it is cheap and safe to call from a web request.
+    """
+    try:
+        container = sniff_container(filepath)
+        if container in ('wav', 'aiff', 'flac'):
+            return _probe_sndfile(filepath, container)
+        if container in ('mp3', 'ogg', 'mp4'):
+            return _probe_mutagen(filepath, container)
+    except (OSError, RuntimeError, ValueError, mutagen.MutagenError, sf.LibsndfileError):
+        pass
+    return None
+
+def check_header(filepath, complete=False):
+    """
+    Validate the start of a possibly still incomplete file, so an upload can be refused before
+    the rest of it arrives. Returns the container, or None while fewer than HEADER_CHECK_BYTES
+    (past any ID3 tag) are on disk and the file is not `complete`. Raises ValueError for bytes
+    that are not a supported container and for headers libsndfile/mutagen cannot parse.
+    MP4 is only sniffed: its moov atom may come after the media data.
+    """
+    with open(filepath, 'rb') as f:
+        header = f.read(_SNIFF_BYTES)
+    needed = HEADER_CHECK_BYTES + (_id3_size(header) if header[:3] == b'ID3' and len(header) >= 10 else 0)
+    if not complete and os.path.getsize(filepath) < needed:
+        return None
+    container = sniff_container(filepath)
+    if container is None:
+        raise ValueError("Unrecognized audio format")
+    try:
+        if container in ('wav', 'aiff', 'flac'):
+            sf.info(filepath)
+        elif container == 'mp3':
+            MP3(filepath)
+        elif container == 'ogg' and mutagen.File(filepath) is None:
+            raise ValueError("Unrecognized Ogg stream")
+    except (OSError, RuntimeError, mutagen.MutagenError) as e:
+        raise ValueError(f"Corrupt {container} header") from e
+    return container
+
+def ffprobe_format(filepath):
+    """Probe `filepath` with ffprobe; raises if ffprobe is missing or fails."""
+    cmd = [
+        'ffprobe', '-v', 'quiet', '-print_format', 'json',
+        '-show_format', '-show_streams', filepath
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout)
+
+    format_info = data.get('format', {})
+    stream_info = data.get('streams', [{}])[0]
+
+    # Determine if lossy or lossless
+    codec_name = stream_info.get('codec_name', '').lower()
+    format_name = format_info.get('format_name', '').lower()
+
+    is_lossless = any(fmt in codec_name or fmt in format_name
+                     for fmt in LOSSLESS_FORMATS)
+    bits = stream_info.get('bits_per_raw_sample') or stream_info.get('bits_per_sample')
+
+    return {
+        'codec': stream_info.get('codec_name', 'unknown'),
+        'codec_long_name': stream_info.get('codec_long_name', 'Unknown'),
+        'format_name': format_info.get('format_name', 'unknown'),
+        'bitrate': int(stream_info.get('bit_rate', 0)) if stream_info.get('bit_rate') else None,
+        'sample_rate': int(stream_info.get('sample_rate', 0)) if stream_info.get('sample_rate') else None,
+        'channels': stream_info.get('channels', 0),
+        'duration': float(format_info.get('duration', 0)),
+        'bits_per_sample': int(bits) if bits else None,
+        'bitrate_mode': None,
+        'is_lossless': is_lossless,
+        'file_extension': os.path.splitext(filepath)[1].lower()
+    }
+
+def probe_format(filepath):
+    """Format info of `filepath`: the in-process header probe, falling back to ffprobe for exotic inputs."""
+    return probe_header(filepath) or ffprobe_format(filepath)
@@ -0,0 +1,210 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+RENDER_CACHE_VERSION = 1  # bump when the render pipeline changes what a given key produces
+# Options that only end up in tags; renders differing in these alone share a cache entry
+METADATA_OPTION_KEYS = frozenset({'artist', 'album', 'title', 'track_number', 'isrc', 'cover_art_path',
+                                  'cover_art_id'})
+RENDER_CACHE_DIR = 'render_cache'
+_SUMMARY_FILE = 'summary.json'
+_STATS_FILE = 'stats.json'
+_LOCK_FILE = '.lock'
+_STATS_KEYS = ('hits', 'misses', 'stores', 'evictions')
+
+def _is_unset(value):
+    return value is None or value is False or value == ''
+
+def _canonical_value(value):
+    if isinstance(value, dict):
+        return {key: _canonical_value(item) for key, item in value.items() if not _is_unset(item)}
+    if isinstance(value, list):
+        return [_canonical_value(item) for item in value]
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value.strip().lower()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+def canonical_options(options):
+    """
+    The processing options that decide the rendered audio, in a stable form: metadata-only keys
+    and unset values (None, '', False) dropped, numbers and numeric strings as floats, other
+    strings lower-cased - so {'target_lufs': '-14'} and {'target_lufs': -14.0} render alike.
+    """
+    return _canonical_value({key: value for key, value in options.items() if key not in METADATA_OPTION_KEYS})
+
+def render_cache_key(content_hash, options):
+    """Cache key of rendering the original with SHA-256 `content_hash` using `options`."""
+    canonical = json.dumps(canonical_options(options), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{RENDER_CACHE_VERSION}\n{content_hash}\n{canonical}".encode()).hexdigest()
+
+def render_cache_root(upload_folder):
+    """Renders are cached under the upload folder, on the same filesystem as the outputs."""
+    return os.path.join(upload_folder, RENDER_CACHE_DIR)
+
+def _tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def _copy(source, destination):
+    if os.path.isdir(source):
+        if os.path.isdir(destination):
+            shutil.rmtree(destination)
+        shutil.copytree(source, destination)
+    else:
+        shutil.copyfile(source, destination)
+
+class RenderCache:
+    """
+    Disk-backed cache of finished renders: the encoded outputs and player artifacts of one job,
+    plus a JSON summary of its measurements, in one directory per key.
+
+    Entries are stored untagged, so a job that only differs in metadata copies them back and
+    re-tags the copies. Entries are evicted least recently used first once the cache grows
+    past max_bytes (recency is the entry directory's mtime, refreshed on every hit). Hit, miss,
+    store and eviction counts are kept in stats.json; a file lock serializes updates between
+    worker processes.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, _LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_stats(self):
+        try:
+            with open(os.path.join(self.root, _STATS_FILE)) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+        return {key: int(stats.get(key, 0)) for key in _STATS_KEYS}
+
+    def _count(self, key, amount=1):
+        with self._locked():
+            stats = self._read_stats()
+            stats[key] += amount
+            with open(os.path.join(self.root, _STATS_FILE), 'w') as f:
+                json.dump(stats, f)
+
+    def stats(self):
+        """Counters plus the current number of entries and their total size."""
+        stats = self._read_stats()
+        entries = self._entries()
+        stats.update({
+            'entries': len(entries),
+            'size_bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        })
+        return stats
+
+    def restore(self, key, files):
+        """
+        Copy a cached render back: `files` maps the names used at store() time to destination
+        paths. Returns the stored summary, or None (a miss) if the entry is absent or incomplete.
+        """
+        if not self.enabled:
+            return None
+        entry = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry, _SUMMARY_FILE)) as f:
+                summary = json.load(f)
+            for name in summary['files']:
+                if name not in files:
+                    raise KeyError(name)
+            for name in summary['files']:
+                _copy(os.path.join(entry, name), files[name])
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            self._count('misses')
+            return None
+        self._count('hits')
+        return summary['summary']
+
+    def store(self, key, files, summary):
+        """
+        Add a render: `files` maps names to existing paths (files or directories) to copy in.
+        The entry is assembled in a temporary directory and renamed into place, so readers never
+        see half an entry; if another worker stored the same key first, that entry is kept.
+        """
+        if not self.enabled:
+            return False
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+        try:
+            present = {name: path for name, path in files.items() if os.path.exists(path)}
+            for name, path in present.items():
+                _copy(path, os.path.join(staging, name))
+            with open(os.path.join(staging, _SUMMARY_FILE), 'w') as f:
+                json.dump({'files': sorted(present), 'summary': summary}, f)
+            try:
+                os.rename(staging, self._entry_dir(key))
+            except OSError:
+                return False
+        finally:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging, ignore_errors=True)
+        self._count('stores')
+        self.evict()
+        return True
+
+    def _entries(self):
+        """(mtime, size, path) of every complete entry."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), _tree_size(path), path))
+            except OSError:
+                continue  # evicted by another worker meanwhile
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes; returns how many."""
+        with self._locked():
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                evicted += 1
+        if evicted:
+            self._count('evictions', evicted)
+        return evicted
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        with self._locked():
+            for _, _, path in self._entries():
+                shutil.rmtree(path, ignore_errors=True)
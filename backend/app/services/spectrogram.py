@@ -0,0 +1,181 @@
+import os
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import rfft
+
+SPECTROGRAM_FFT_SIZE = 1024
+SPECTROGRAM_HOP = 256         # frames between columns at the finest zoom
+SPECTROGRAM_ZOOM_FACTOR = 4   # each coarser zoom merges this many columns
+SPECTROGRAM_MAX_ZOOMS = 4
+SPECTROGRAM_TILE_COLUMNS = 256
+SPECTROGRAM_BATCH_COLUMNS = 2048
+SPECTROGRAM_DB_RANGE = (-120.0, 0.0)
+SPECTROGRAM_BINS = SPECTROGRAM_FFT_SIZE // 2  # Nyquist bin dropped so tiles are a power of two tall
+
+# Tiles are raw uint8, column-major: each time column holds SPECTROGRAM_BINS bytes from 0 Hz up,
+# 0 = SPECTROGRAM_DB_RANGE[0] and 255 = SPECTROGRAM_DB_RANGE[1] (dBFS of a full-scale sine).
+
+def _quantize_db(magnitude, out):
+    low, high = SPECTROGRAM_DB_RANGE
+    with np.errstate(divide='ignore'):
+        db = 20 * np.log10(magnitude)
+    np.clip((db - low) * (255 / (high - low)), 0, 255, out=db)
+    out[:] = db  # float -> uint8 truncation, values already clipped
+
+def _spectrum_columns(mono, out, fft_size=SPECTROGRAM_FFT_SIZE, hop=SPECTROGRAM_HOP):
+    # One batch: len(out) windows of `mono`, `hop` apart, quantized straight into `out`
+    frames = sliding_window_view(mono, fft_size)[::hop][:len(out)]
+    window = np.hanning(fft_size).astype(np.float32)
+    scale = np.float32(2 / window.sum())  # full-scale sine -> 1.0
+    spectrum = rfft(frames * window, axis=1)[:, :fft_size // 2]
+    _quantize_db(np.abs(spectrum) * scale, out)
+
+def compute_spectrogram(samples, fft_size=SPECTROGRAM_FFT_SIZE, hop=SPECTROGRAM_HOP,
+                        batch_columns=SPECTROGRAM_BATCH_COLUMNS):
+    """
+    8-bit magnitude spectrogram (columns, bins) of a (frames, channels) buffer, mixed to mono.
+
+    Frames are strided views of the signal (no framing copy); they are windowed and
+    transformed a batch of columns at a time with a float32 rfft, and each batch is quantized
+    straight into the uint8 result, so peak extra memory is one batch of complex spectra.
+    """
+    mono = samples.mean(axis=1, dtype=np.float32) if samples.ndim == 2 else samples.astype(np.float32)
+    if len(mono) < fft_size:
+        mono = np.pad(mono, (0, fft_size - len(mono)))
+    columns = (len(mono) - fft_size) // hop + 1
+    result = np.empty((columns, fft_size // 2), dtype=np.uint8)
+    for start in range(0, columns, batch_columns):
+        batch = result[start:start + batch_columns]
+        _spectrum_columns(mono[start * hop:(start + len(batch) - 1) * hop + fft_size], batch, fft_size, hop)
+    return result
+
+def build_zoom_levels(columns, factor=SPECTROGRAM_ZOOM_FACTOR, max_zooms=SPECTROGRAM_MAX_ZOOMS,
+                      tile_columns=SPECTROGRAM_TILE_COLUMNS):
+    """[finest, ...] column arrays; coarser zooms keep the loudest of each `factor` columns."""
+    levels = [columns]
+    while len(levels) < max_zooms and len(levels[-1]) // factor >= tile_columns:
+        fine = levels[-1]
+        padded = -(-len(fine) // factor) * factor
+        if padded != len(fine):
+            fine = np.concatenate([fine, np.repeat(fine[-1:], padded - len(fine), axis=0)])
+        levels.append(fine.reshape(-1, factor, fine.shape[1]).max(axis=1))
+    return levels
+
+def spectrogram_dir_for(processed_file_path):
+    """Tiles live in a directory next to the processed file they describe."""
+    return f"{processed_file_path}.spectrogram"
+
+def tile_path(directory, zoom, tile):
+    return os.path.join(directory, str(zoom), f"{tile}.bin")
+
+class SpectrogramBuilder:
+    """
+    write_spectrogram_tiles() fed (frames, channels) blocks of any size as they are decoded.
+
+    The mono tail that does not fill a window yet is carried to the next block; columns are
+    computed a batch at a time and cascade into the coarser zooms (the loudest of every
+    SPECTROGRAM_ZOOM_FACTOR columns). A tile is written as soon as it is full, so only the
+    unfilled tile of each zoom is held - never the audio or the whole spectrogram. finish()
+    writes the last tiles and the index; zooms the final length does not call for (see
+    build_zoom_levels) never reach the disk.
+    """
+
+    def __init__(self, sample_rate, directory, batch_columns=SPECTROGRAM_BATCH_COLUMNS):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.batch_columns = batch_columns
+        self.frames = 0
+        self._tail = np.empty(0, dtype=np.float32)
+        empty = np.empty((0, SPECTROGRAM_BINS), dtype=np.uint8)
+        self._columns = [0] * SPECTROGRAM_MAX_ZOOMS     # columns produced per zoom
+        self._tiles = [0] * SPECTROGRAM_MAX_ZOOMS       # tiles written per zoom
+        self._pending = [empty] * SPECTROGRAM_MAX_ZOOMS  # columns not in a written tile yet
+        self._groups = [empty] * SPECTROGRAM_MAX_ZOOMS   # columns waiting to fill the next zoom's column
+
+    def process(self, block):
+        mono = block.mean(axis=1, dtype=np.float32) if block.ndim == 2 else block.astype(np.float32)
+        self.frames += len(mono)
+        mono = np.concatenate([self._tail, mono])
+        columns = (len(mono) - SPECTROGRAM_FFT_SIZE) // SPECTROGRAM_HOP + 1 if len(mono) >= SPECTROGRAM_FFT_SIZE else 0
+        for start in range(0, columns, self.batch_columns):
+            batch = np.empty((min(self.batch_columns, columns - start), SPECTROGRAM_BINS), dtype=np.uint8)
+            _spectrum_columns(mono[start * SPECTROGRAM_HOP:(start + len(batch) - 1) * SPECTROGRAM_HOP + SPECTROGRAM_FFT_SIZE],
+                              batch)
+            self._add(0, batch)
+        self._tail = mono[columns * SPECTROGRAM_HOP:].copy()
+
+    def _add(self, zoom, columns, write=True):
+        self._columns[zoom] += len(columns)
+        self._pending[zoom] = np.concatenate([self._pending[zoom], columns])
+        if write:
+            self._write_tiles(zoom, full_only=True)
+        if zoom + 1 < SPECTROGRAM_MAX_ZOOMS:
+            group = np.concatenate([self._groups[zoom], columns])
+            merged = len(group) // SPECTROGRAM_ZOOM_FACTOR
+            if merged:
+                coarse = group[:merged * SPECTROGRAM_ZOOM_FACTOR].reshape(merged, SPECTROGRAM_ZOOM_FACTOR, -1).max(axis=1)
+                self._add(zoom + 1, coarse, write)
+            self._groups[zoom] = group[merged * SPECTROGRAM_ZOOM_FACTOR:]
+
+    def _write_tiles(self, zoom, full_only):
+        pending = self._pending[zoom]
+        count = len(pending) // SPECTROGRAM_TILE_COLUMNS if full_only else -(-len(pending) // SPECTROGRAM_TILE_COLUMNS)
+        if not count:
+            return
+        os.makedirs(os.path.join(self.directory, str(zoom)), exist_ok=True)
+        for index in range(count):
+            chunk = pending[index * SPECTROGRAM_TILE_COLUMNS:(index + 1) * SPECTROGRAM_TILE_COLUMNS]
+            with open(tile_path(self.directory, zoom, self._tiles[zoom]), 'wb') as f:
+                f.write(np.ascontiguousarray(chunk).tobytes())
+            self._tiles[zoom] += 1
+        self._pending[zoom] = pending[count * SPECTROGRAM_TILE_COLUMNS:]
+
+    def finish(self):
+        """Write the remaining tiles and index.json; returns the index."""
+        if not self._columns[0]:
+            # Shorter than one window: a single zero-padded column, like compute_spectrogram()
+            column = np.empty((1, SPECTROGRAM_BINS), dtype=np.uint8)
+            _spectrum_columns(np.pad(self._tail, (0, SPECTROGRAM_FFT_SIZE - len(self._tail))), column)
+            self._add(0, column, write=False)
+        # A trailing partial group still makes one (loudest-of) column of the next zoom
+        for zoom in range(SPECTROGRAM_MAX_ZOOMS - 1):
+            if len(self._groups[zoom]):
+                self._add(zoom + 1, self._groups[zoom].max(axis=0, keepdims=True), write=False)
+                self._groups[zoom] = self._groups[zoom][:0]
+        levels = 1
+        while (levels < SPECTROGRAM_MAX_ZOOMS
+               and self._columns[levels - 1] // SPECTROGRAM_ZOOM_FACTOR >= SPECTROGRAM_TILE_COLUMNS):
+            levels += 1
+        zooms = []
+        for zoom in range(levels):
+            self._write_tiles(zoom, full_only=False)
+            zooms.append({
+                'zoom': zoom,
+                'hop': SPECTROGRAM_HOP * SPECTROGRAM_ZOOM_FACTOR ** zoom,
+                'columns': self._columns[zoom],
+                'tiles': self._tiles[zoom],
+            })
+        index = {
+            'sample_rate': int(self.sample_rate),
+            'fft_size': SPECTROGRAM_FFT_SIZE,
+            'bins': SPECTROGRAM_BINS,
+            'tile_columns': SPECTROGRAM_TILE_COLUMNS,
+            'db_range': list(SPECTROGRAM_DB_RANGE),
+            'duration_seconds': self.frames / self.sample_rate,
+            'zooms': zooms,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'index.json'), 'w') as f:
+            json.dump(index, f)
+        return index
+
+def write_spectrogram_tiles(samples, sample_rate, directory):
+    """Compute the spectrogram, cut every zoom level into tiles and write them with an index.json."""
+    builder = SpectrogramBuilder(sample_rate, directory)
+    builder.process(samples)
+    return builder.finish()
+
+def read_spectrogram_index(directory):
+    with open(os.path.join(directory, 'index.json')) as f:
+        return json.load(f)
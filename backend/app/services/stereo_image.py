@@ -0,0 +1,61 @@
+import struct
+import numpy as np
+
+STEREO_MAGIC = b'WBST'
+STEREO_VERSION = 1
+CORRELATION_SCALE = 127
+CORRELATION_NO_VALUE = -128  # silent bucket
+
+# Layout (little endian):
+#   header  magic 4s | version u16 | bins u16 | seconds_per_point f32 | points u32
+#           | correlation_overall f32 (NaN if silent) | goniometer_extent f32
+#   body    points x i8 correlation * 127, then bins x bins u8 goniometer density (row 0 = mid -extent)
+_HEADER = struct.Struct('<4sHHfIff')
+
+def _quantize_correlation(correlation):
+    values = np.round(np.asarray(correlation, dtype=np.float64) * CORRELATION_SCALE)
+    return np.where(np.isfinite(values), np.clip(values, -CORRELATION_SCALE, CORRELATION_SCALE),
+                    CORRELATION_NO_VALUE).astype(np.int8)
+
+def _quantize_density(counts):
+    # Log density so quiet spread stays visible next to the dense centre
+    density = np.log1p(counts.astype(np.float64))
+    peak = density.max()
+    return np.zeros(counts.shape, dtype=np.uint8) if peak == 0 else np.round(density * (255 / peak)).astype(np.uint8)
+
+def encode_stereo(history):
+    """Serialize the 'stereo' part of AudioAnalyzer.history(): fixed-size goniometer plus the series."""
+    stereo = history['stereo']
+    correlation = _quantize_correlation(stereo['correlation'])
+    goniometer = _quantize_density(stereo['goniometer'])
+    header = _HEADER.pack(STEREO_MAGIC, STEREO_VERSION, goniometer.shape[0], history['seconds_per_point'],
+                          len(correlation), stereo['correlation_overall'], stereo['goniometer_extent'])
+    return header + correlation.tobytes() + goniometer.tobytes()
+
+def decode_stereo(data):
+    """Inverse of encode_stereo; silent buckets come back as NaN and the density as 0..1."""
+    magic, version, bins, seconds_per_point, points, overall, extent = _HEADER.unpack_from(data, 0)
+    if magic != STEREO_MAGIC or version != STEREO_VERSION:
+        raise ValueError("Not a stereo image file.")
+    raw = np.frombuffer(data, dtype=np.int8, count=points, offset=_HEADER.size)
+    correlation = raw / CORRELATION_SCALE
+    correlation[raw == CORRELATION_NO_VALUE] = np.nan
+    goniometer = np.frombuffer(data, dtype=np.uint8, count=bins * bins, offset=_HEADER.size + points)
+    return {
+        'seconds_per_point': seconds_per_point,
+        'correlation': correlation,
+        'correlation_overall': overall,
+        'goniometer': goniometer.reshape(bins, bins) / 255,
+        'goniometer_extent': extent,
+    }
+
+def stereo_path_for(processed_file_path):
+    """Stereo data lives next to the processed file it describes."""
+    return f"{processed_file_path}.stereo"
+
+def write_stereo(history, path):
+    """Write encode_stereo(history) to `path`; returns the size in bytes."""
+    data = encode_stereo(history)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
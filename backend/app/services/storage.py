@@ -0,0 +1,93 @@
+import os
+import hashlib
+import tempfile
+
+UPLOAD_CHUNK_BYTES = 1 << 20
+ORIGINALS_DIR = 'originals'
+
+def original_path_for(upload_folder, user_id, content_hash, extension):
+    """Originals are stored by content: one file per user and SHA-256, whatever it was called."""
+    return os.path.join(upload_folder, ORIGINALS_DIR, str(user_id), f"{content_hash}{extension.lower()}")
+
+def _originals_starting_with(directory, extension, chunk):
+    # one original open at a time while scanning, so a large library never exhausts descriptors
+    matching = []
+    for name in os.listdir(directory):
+        if name.startswith('.') or not name.endswith(extension):
+            continue
+        f = open(os.path.join(directory, name), 'rb')
+        if f.read(len(chunk)) == chunk:
+            matching.append(f)
+        else:
+            f.close()
+    return matching
+
+def _copy_prefix(source, target, length, chunk_bytes):
+    source.seek(0)
+    while length:
+        chunk = source.read(min(chunk_bytes, length))
+        target.write(chunk)
+        length -= len(chunk)
+
+def store_upload(stream, upload_folder, user_id, extension, chunk_bytes=UPLOAD_CHUNK_BYTES):
+    """
+    Stream an upload to disk, hashing it on the way, and file it under its content hash.
+
+    Returns (path, sha256 hex digest, size in bytes, created). The upload is read exactly once.
+    While its bytes still match one of the user's originals with the same extension nothing is
+    written; only once the last candidate diverges is the shared prefix copied from it into a
+    temporary file and the rest streamed after it. An identical re-upload is therefore never
+    written at all and returns the existing path with created=False.
+    """
+    extension = extension.lower()
+    directory = os.path.join(upload_folder, ORIGINALS_DIR, str(user_id))
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    candidates = []
+    temp = None
+    try:
+        while True:
+            chunk = stream.read(chunk_bytes)
+            if not chunk:
+                break
+            digest.update(chunk)
+            if temp is None:
+                if size:
+                    matching = [f for f in candidates if f.read(len(chunk)) == chunk]
+                else:
+                    matching = candidates = _originals_starting_with(directory, extension, chunk)
+                if not matching:
+                    temp = tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False)
+                    if candidates:
+                        _copy_prefix(candidates[0], temp, size, chunk_bytes)
+                for f in candidates:
+                    if f not in matching:
+                        f.close()
+                candidates = matching
+            if temp is not None:
+                temp.write(chunk)
+            size += len(chunk)
+        content_hash = digest.hexdigest()
+        path = original_path_for(upload_folder, user_id, content_hash, extension)
+        if temp is None:
+            if any(f.read(1) == b'' and f.name == path for f in candidates):
+                return path, content_hash, size, False
+            # the upload is a prefix of an original (or the user has none): write it out now
+            temp = tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False)
+            if candidates:
+                _copy_prefix(candidates[0], temp, size, chunk_bytes)
+        temp.close()
+        if os.path.exists(path):
+            os.remove(temp.name)
+            return path, content_hash, size, False
+        os.replace(temp.name, path)
+        return path, content_hash, size, True
+    except BaseException:
+        if temp is not None:
+            temp.close()
+            os.remove(temp.name)
+        raise
+    finally:
+        for f in candidates:
+            f.close()
@@ -0,0 +1,112 @@
+import json
+import time
+import threading
+import redis
+from flask import current_app
+
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+HEARTBEAT_SECONDS = 15  # SSE comment lines keep proxies from closing an idle stream
+_REDIS_EXTENSION = 'redis'
+_STREAM_SLOTS_EXTENSION = 'task-event-stream-slots'
+
+def redis_client():
+    """The app's shared Redis connection pool (REDIS_URL), created on first use."""
+    client = current_app.extensions.get(_REDIS_EXTENSION)
+    if client is None:
+        client = redis.Redis.from_url(current_app.config['REDIS_URL'], decode_responses=True,
+                                      socket_connect_timeout=2, health_check_interval=30)
+        current_app.extensions[_REDIS_EXTENSION] = client
+    return client
+
+def task_events_channel(user_id):
+    """Pub/sub channel of one user's task status changes."""
+    return f"task-events:{user_id}"
+
+def task_event(task_entry):
+    """A ProcessingTask as a status event: the body of /task-status/<id> plus the task id."""
+    return {"task_id": task_entry.id, "status": task_entry.status, "result": task_entry.result_json}
+
+def publish_task_event(task_entry):
+    """
+    Push a status change to the owner's open streams. Best effort: the status is already committed,
+    and clients that miss the event catch up by polling, so a Redis outage never fails a task.
+    """
+    try:
+        redis_client().publish(task_events_channel(task_entry.user_id), json.dumps(task_event(task_entry)))
+        return True
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not publish task event for task {task_entry.id}: {e}")
+        return False
+
+def task_event_streams_key(user_id):
+    """Counter of one user's open SSE streams across every web worker."""
+    return f"task-events:streams:{user_id}"
+
+def acquire_stream_slot(user_id):
+    """
+    Reserve a web worker thread for one SSE stream of `user_id`. A stream holds its gthread
+    thread until it ends, so each worker process serves at most TASK_EVENTS_MAX_STREAMS of them
+    and leaves the rest of its threads to ordinary requests; a user gets at most
+    TASK_EVENTS_MAX_STREAMS_PER_USER across all workers (counted in Redis). Returns the function
+    that gives the slot back, or None when a limit is reached and the client should poll.
+    """
+    config = current_app.config
+    slots = current_app.extensions.setdefault(
+        _STREAM_SLOTS_EXTENSION, threading.BoundedSemaphore(config['TASK_EVENTS_MAX_STREAMS']))
+    if not slots.acquire(blocking=False):
+        return None
+    key = task_event_streams_key(user_id)
+    try:
+        client = redis_client()
+        pipe = client.pipeline()
+        pipe.incr(key)
+        # counts of a worker that died mid-stream expire with the longest possible stream
+        pipe.expire(key, config['TASK_EVENTS_STREAM_SECONDS'] + 60)
+        count, _ = pipe.execute()
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not count task event streams of user {user_id}: {e}")
+        client, count = None, 0
+    released = []
+
+    def release():
+        if released:
+            return
+        released.append(True)
+        slots.release()
+        if client is not None:
+            try:
+                client.decr(key)
+            except redis.RedisError:
+                pass  # the key expires on its own
+
+    if count > config['TASK_EVENTS_MAX_STREAMS_PER_USER']:
+        release()
+        return None
+    return release
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_task_events(user_id, snapshot=None, max_seconds=300, heartbeat=HEARTBEAT_SECONDS, clock=time.monotonic):
+    """
+    Server-Sent Events for one user's tasks. The channel is subscribed before `snapshot()` (the
+    current events of the tasks the client is waiting for) is sent, so no change is lost between
+    the two. After `max_seconds` an 'end' event tells the client to reconnect, which keeps a
+    stream from pinning a web worker thread indefinitely.
+    """
+    pubsub = redis_client().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(task_events_channel(user_id))
+    try:
+        yield "retry: 3000\n\n"
+        for event in (snapshot() if snapshot else []):
+            yield _sse('task', event)
+        deadline = clock() + max_seconds
+        while clock() < deadline:
+            message = pubsub.get_message(timeout=min(heartbeat, max(deadline - clock(), 0)))
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: task\ndata: {message['data']}\n\n"
+        yield _sse('end', {"reconnect": True})
+    finally:
+        pubsub.close()
@@ -0,0 +1,136 @@
+import json
+import time
+import threading
+import redis
+from flask import current_app
+from app.services.task_events import redis_client, task_events_channel
+
+PROGRESS_TTL_SECONDS = 3600  # a worker that dies mid-task leaves no stale progress behind for long
+PROGRESS_MIN_INTERVAL = 1.0  # seconds between Redis writes of one task
+# Relative cost of each stage of a render, for the overall percentage
+STAGE_WEIGHTS = {'copy': 1, 'decode': 3, 'analyze': 2, 'render': 8, 'encode': 5, 'artifacts': 1, 'verify': 3,
+                 'tagging': 1}
+_ETA_MIN_FRACTION = 0.02
+
+def task_progress_key(task_id):
+    """Redis key of a task's live progress."""
+    return f"task-progress:{task_id}"
+
+def read_task_progress(task_ids):
+    """
+    Live progress of `task_ids` in one MGET: {task_id: {'percent', 'stage', 'eta_seconds'}} for the
+    tasks that have any. Returns {} when Redis is unavailable; progress is only ever a nicety.
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return {}
+    try:
+        values = redis_client().mget([task_progress_key(task_id) for task_id in task_ids])
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not read task progress: {e}")
+        return {}
+    progress = {}
+    for task_id, value in zip(task_ids, values):
+        try:
+            if value:
+                progress[task_id] = json.loads(value)
+        except ValueError:
+            continue
+    return progress
+
+class TaskProgress:
+    """
+    Live progress of one running task, kept in Redis (never in the database) and pushed to the
+    owner's task event stream.
+
+    The render declares its stages up front (start()); each stage() call returns a callback that
+    takes seconds of media processed - the shape of ffmpeg's -progress out_time - and turns it into
+    an overall percentage weighted by STAGE_WEIGHTS, with an ETA extrapolated from the time spent
+    so far. Writes are throttled to one per PROGRESS_MIN_INTERVAL and best effort: after the first
+    Redis error the task keeps running without progress. Callbacks may come from ffmpeg reader
+    threads, so the state is guarded by a lock and nothing here needs an app context.
+    """
+
+    def __init__(self, task_id, user_id, client=None, logger=None, clock=time.monotonic,
+                 min_interval=PROGRESS_MIN_INTERVAL, ttl=PROGRESS_TTL_SECONDS):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.client = client if client is not None else redis_client()
+        self.logger = logger if logger is not None else current_app.logger
+        self.clock = clock
+        self.min_interval = min_interval
+        self.ttl = ttl
+        self.stages = []
+        self.started = clock()
+        self.current = None
+        self.fraction = 0.0
+        self.last_write = None
+        self.enabled = True
+        self._lock = threading.Lock()
+
+    def start(self, stages):
+        """Declare the stages this task will go through, in order."""
+        with self._lock:
+            self.stages = [stage for stage in stages if stage in STAGE_WEIGHTS]
+
+    def stage(self, name, duration=None):
+        """
+        Enter stage `name` and return its callback: progress(seconds) for `duration` seconds of
+        media, or a callback that ignores its argument when the duration is unknown.
+        """
+        self._set(name, 0.0, force=True)
+
+        def progress(seconds):
+            if duration:
+                self._set(name, min(max(seconds / duration, 0.0), 1.0))
+        return progress
+
+    def snapshot(self):
+        """{'percent', 'stage', 'eta_seconds'} as it would be written now."""
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        if self.current not in self.stages:
+            return {'percent': None, 'stage': self.current, 'eta_seconds': None}
+        total = sum(STAGE_WEIGHTS[stage] for stage in self.stages)
+        index = self.stages.index(self.current)
+        done = sum(STAGE_WEIGHTS[stage] for stage in self.stages[:index]) + STAGE_WEIGHTS[self.current] * self.fraction
+        overall = done / total
+        elapsed = self.clock() - self.started
+        eta = elapsed * (1 - overall) / overall if overall >= _ETA_MIN_FRACTION else None
+        return {
+            'percent': round(overall * 100, 1),
+            'stage': self.current,
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+        }
+
+    def _set(self, stage, fraction, force=False):
+        with self._lock:
+            self.current, self.fraction = stage, fraction
+            now = self.clock()
+            if not self.enabled or (not force and self.last_write is not None and now - self.last_write < self.min_interval):
+                return
+            self.last_write = now
+            snapshot = self._snapshot()
+        self._write(snapshot)
+
+    def _write(self, snapshot):
+        event = {'task_id': self.task_id, 'status': 'PROCESSING', 'result': None, 'progress': snapshot}
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(task_progress_key(self.task_id), json.dumps(snapshot), ex=self.ttl)
+            pipe.publish(task_events_channel(self.user_id), json.dumps(event))
+            pipe.execute()
+        except redis.RedisError as e:
+            self.enabled = False
+            self.logger.warning(f"Task {self.task_id} progress disabled, Redis unavailable: {e}")
+
+    def clear(self):
+        """Drop the live progress once the task's final status is committed."""
+        if not self.enabled:
+            return
+        try:
+            self.client.delete(task_progress_key(self.task_id))
+        except redis.RedisError:
+            pass
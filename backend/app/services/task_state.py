@@ -0,0 +1,236 @@
+import json
+from datetime import datetime, UTC
+import redis
+from flask import current_app
+from sqlalchemy import update
+from app.models import db, AudioFile, AudioOutput, ProcessingTask
+from app.services.task_events import redis_client, TERMINAL_STATUSES
+
+TASK_STATE_TTL_SECONDS = 24 * 3600  # unflushed state outlives any realistic Redis/DB outage window
+FLUSHED_STATE_TTL_SECONDS = 600  # once persisted, readers may still hit Redis for a while
+FLUSH_QUEUE = 'task-state:flush'
+FLUSH_SCHEDULED = 'task-state:flush-scheduled'
+FLUSH_BATCH_SIZE = 500
+_INT_FIELDS = ('user_id', 'audio_file_id')
+
+def task_state_key(task_id):
+    """Redis hash holding a task's hot state."""
+    return f"task-state:{task_id}"
+
+def _decode_state(values):
+    state = dict(values)
+    for field in _INT_FIELDS:
+        if state.get(field):
+            state[field] = int(state[field])
+    return state
+
+def read_task_states(task_ids):
+    """
+    Hot state of `task_ids` in one pipelined round trip: {task_id: {'status', 'user_id',
+    'result_json', ...}} for the tasks Redis knows. Returns {} when Redis is unavailable, so
+    callers fall back to the database.
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return {}
+    try:
+        pipe = redis_client().pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hgetall(task_state_key(task_id))
+        values = pipe.execute()
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not read task states: {e}")
+        return {}
+    return {task_id: _decode_state(state) for task_id, state in zip(task_ids, values) if state}
+
+def pending_task_states(task_entries):
+    """
+    Newer state of ProcessingTask rows that are not terminal in the database yet - running, or
+    finished but not flushed: {task_id: state} with 'audio_file' decoded to the render result
+    (or None). Rows whose hot state Redis does not hold are left out.
+    """
+    open_ids = [task_entry.id for task_entry in task_entries if task_entry.status not in TERMINAL_STATUSES]
+    pending = {}
+    for task_id, state in read_task_states(open_ids).items():
+        if state.get('status'):
+            state['audio_file'] = json.loads(state['audio_file']) if state.get('audio_file') else None
+            pending[task_id] = state
+    return pending
+
+class _Overlay:
+    """Read-only view of a row: the given fields first, every other attribute from the row."""
+
+    def __init__(self, row, fields):
+        self._row = row
+        self._fields = fields
+
+    def __getattr__(self, name):
+        fields = self.__dict__['_fields']
+        return fields[name] if name in fields else getattr(self.__dict__['_row'], name)
+
+def overlay_task_state(task_entry, audio_file, pending):
+    """
+    (task, audio_file) as pages should show them, with the task's pending_task_states() entry
+    from `pending` laid over the rows. The views never touch the session, so nothing is written
+    ahead of the flush; rows without pending state come back as they are.
+    """
+    state = pending.get(task_entry.id) if task_entry is not None else None
+    if not state:
+        return task_entry, audio_file
+    task_fields = {'status': state['status']}
+    if 'result_json' in state:
+        task_fields['result_json'] = state['result_json']
+    if state.get('completed_at'):
+        task_fields['completed_at'] = datetime.fromisoformat(state['completed_at'])
+    update = state['audio_file']
+    if update and audio_file is not None:
+        outputs = [AudioOutput(audio_file_id=audio_file.id, **output) for output in update['outputs']]
+        audio_file = _Overlay(audio_file, dict(update, outputs=outputs))
+    return _Overlay(task_entry, task_fields), audio_file
+
+def _write_state(client, task_entry, fields, flush=False):
+    key = task_state_key(task_entry.id)
+    pipe = client.pipeline()
+    pipe.hset(key, mapping=dict({'user_id': task_entry.user_id, 'audio_file_id': task_entry.audio_file_id}, **fields))
+    pipe.expire(key, TASK_STATE_TTL_SECONDS)
+    if flush:
+        pipe.rpush(FLUSH_QUEUE, task_entry.id)
+    pipe.execute()
+
+def record_queued(task_entry, celery_task_id):
+    """
+    Remember the Celery id of a freshly queued task. Hot state only; without Redis it is
+    committed to the row as before. Returns True if Redis took it. The status is left alone:
+    a fast worker may already have moved the task on.
+    """
+    try:
+        _write_state(redis_client(), task_entry, {'celery_task_id': celery_task_id})
+        return True
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Task {task_entry.id} state falls back to the database: {e}")
+    task_entry.celery_task_id = celery_task_id
+    db.session.commit()
+    return False
+
+def start_task(task_entry, celery_task_id):
+    """The PROCESSING transition: Redis only, or a commit when Redis is unavailable."""
+    task_entry.status, task_entry.celery_task_id = 'PROCESSING', celery_task_id
+    try:
+        _write_state(redis_client(), task_entry, {'status': 'PROCESSING', 'celery_task_id': celery_task_id})
+        db.session.expunge(task_entry)  # the row is not written until the terminal flush
+        return True
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Task {task_entry.id} state falls back to the database: {e}")
+    db.session.commit()
+    return False
+
+def _apply_audio_file_update(audio_file, audio_file_update):
+    for column in ('processed_filename', 'processed_file_path', 'loudness_lufs', 'duration_seconds', 'true_peak_db'):
+        setattr(audio_file, column, audio_file_update[column])
+    audio_file.outputs = [AudioOutput(**output) for output in audio_file_update['outputs']]
+
+def finish_task(task_entry, status, result_json, audio_file_update=None):
+    """
+    A terminal transition (COMPLETED/FAILED). The final state goes to the Redis hash and the
+    task joins the write-behind queue that flush_task_states() persists in batches; the
+    AudioFile columns and outputs of a completed render (`audio_file_update`) travel with it.
+    Without Redis the row and the AudioFile are committed right away. Returns True if the
+    write was deferred - the caller then makes sure a flush is scheduled.
+    """
+    completed_at = datetime.now(UTC)
+    try:
+        fields = {'status': status, 'result_json': result_json, 'completed_at': completed_at.isoformat()}
+        if audio_file_update is not None:
+            fields['audio_file'] = json.dumps(audio_file_update)
+        _write_state(redis_client(), task_entry, fields, flush=True)
+        return True
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Task {task_entry.id} state falls back to the database: {e}")
+    task_entry = db.session.merge(task_entry)
+    task_entry.status, task_entry.result_json, task_entry.completed_at = status, result_json, completed_at
+    if audio_file_update is not None:
+        audio_file = db.session.get(AudioFile, task_entry.audio_file_id)
+        if audio_file:
+            _apply_audio_file_update(audio_file, audio_file_update)
+    db.session.commit()
+    return False
+
+def claim_flush(interval):
+    """
+    True for the one caller per `interval` seconds that should schedule a flush, so a burst
+    of finishing tasks across every worker shares a single batched write.
+    """
+    try:
+        return bool(redis_client().set(FLUSH_SCHEDULED, 1, nx=True, ex=max(int(interval), 1)))
+    except redis.RedisError:
+        return False
+
+def release_flush():
+    """
+    Drop the flush claim once a flush has drained the queue, and report whether states are
+    queued again. A finisher that pushed before the claim was dropped is seen here; one that
+    pushes after it wins claim_flush() itself, so no state waits for an unrelated task to end.
+    """
+    try:
+        client = redis_client()
+        client.delete(FLUSH_SCHEDULED)
+        return client.llen(FLUSH_QUEUE) > 0
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not check the task state queue: {e}")
+        return False
+
+def flush_task_states(batch_size=FLUSH_BATCH_SIZE):
+    """
+    Persist queued terminal states: up to `batch_size` tasks per round, each round one bulk
+    UPDATE of processing_task plus the AudioFile results, in a single commit. Returns how many
+    tasks were written. On a database error the batch goes back on the queue.
+    """
+    client = redis_client()
+    written = 0
+    while True:
+        try:
+            task_ids = [int(task_id) for task_id in (client.lpop(FLUSH_QUEUE, batch_size) or [])]
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Could not flush task states: {e}")
+            return written
+        if not task_ids:
+            return written
+        states = read_task_states(task_ids)
+        try:
+            _persist(states)
+        except Exception:
+            db.session.rollback()
+            client.rpush(FLUSH_QUEUE, *task_ids)
+            raise
+        pipe = client.pipeline(transaction=False)
+        for task_id in states:
+            pipe.expire(task_state_key(task_id), FLUSHED_STATE_TTL_SECONDS)
+        pipe.execute()
+        written += len(states)
+
+def _persist(states):
+    rows = {True: [], False: []}
+    audio_file_updates = {}
+    # Rows deleted while their state waited in Redis are simply skipped
+    existing = {task_id for task_id, in db.session.query(ProcessingTask.id).filter(ProcessingTask.id.in_(states))}
+    for task_id, state in states.items():
+        if task_id not in existing or state.get('status') not in TERMINAL_STATUSES:
+            continue
+        row = {
+            'id': task_id,
+            'status': state['status'],
+            'result_json': state.get('result_json'),
+            'completed_at': datetime.fromisoformat(state['completed_at']) if state.get('completed_at') else None,
+        }
+        if state.get('celery_task_id'):
+            row['celery_task_id'] = state['celery_task_id']
+        rows['celery_task_id' in row].append(row)
+        if state.get('audio_file'):
+            audio_file_updates[state['audio_file_id']] = json.loads(state['audio_file'])
+    for group in rows.values():
+        if group:
+            db.session.execute(update(ProcessingTask), group)  # executemany by primary key
+    if audio_file_updates:
+        for audio_file in AudioFile.query.filter(AudioFile.id.in_(audio_file_updates)).all():
+            _apply_audio_file_update(audio_file, audio_file_updates[audio_file.id])
+    db.session.commit()
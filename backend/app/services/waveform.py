@@ -0,0 +1,119 @@
+import struct
+import numpy as np
+
+PEAKS_MAGIC = b'WBPK'
+PEAKS_VERSION = 1
+PEAKS_BASE_FRAMES = 256      # frames per min/max pair at the finest level
+PEAKS_LEVEL_FACTOR = 4       # each coarser level merges this many pairs
+PEAKS_MIN_PAIRS = 512        # stop once a level would drop below this many pairs
+PEAKS_SCALE = 127
+
+# Layout (little endian):
+#   header  magic 4s | version u16 | levels u16 | sample_rate u32 | frames u64
+#   level   frames_per_peak u32 | pairs u32 | pairs x (min i8, max i8)
+_HEADER = struct.Struct('<4sHHIQ')
+_LEVEL = struct.Struct('<II')
+
+def _quantize(values):
+    return np.clip(np.round(values * PEAKS_SCALE), -PEAKS_SCALE, PEAKS_SCALE).astype(np.int8)
+
+class PeakBuilder:
+    """
+    The finest min/max level, fed (frames, channels) blocks of any size as they are decoded.
+
+    Frames that do not fill a pair yet are carried to the next block, so the result is the same
+    however the audio is split; only the pairs are kept (8 bytes per `base_frames` frames),
+    never the audio itself. levels() derives the coarser zooms once the last block is in.
+    """
+
+    def __init__(self, base_frames=PEAKS_BASE_FRAMES):
+        self.base_frames = base_frames
+        self.frames = 0
+        self._partial = None
+        self._mins = []
+        self._maxs = []
+
+    def process(self, block):
+        if block.ndim == 1:
+            block = block[:, None]
+        self.frames += len(block)
+        if self._partial is not None:
+            block = np.concatenate([self._partial, block])
+        full = len(block) // self.base_frames
+        if full:
+            pairs = block[:full * self.base_frames].reshape(full, -1)  # view: frames x channels per pair
+            self._mins.append(pairs.min(axis=1))
+            self._maxs.append(pairs.max(axis=1))
+        self._partial = block[full * self.base_frames:].copy() if len(block) > full * self.base_frames else None
+
+    def levels(self, factor=PEAKS_LEVEL_FACTOR, min_pairs=PEAKS_MIN_PAIRS):
+        """[(frames_per_peak, mins, maxs), ...] from the finest level up; see build_peak_levels()."""
+        mins, maxs = list(self._mins), list(self._maxs)
+        if self._partial is not None:
+            mins.append(self._partial.min(keepdims=True).ravel())
+            maxs.append(self._partial.max(keepdims=True).ravel())
+        mins = np.concatenate(mins).astype(np.float32) if mins else np.empty(0, dtype=np.float32)
+        maxs = np.concatenate(maxs).astype(np.float32) if maxs else np.empty(0, dtype=np.float32)
+        levels = [(self.base_frames, mins, maxs)]
+        while len(mins) // factor >= min_pairs:
+            padded = -(-len(mins) // factor) * factor
+            mins = np.pad(mins, (0, padded - len(mins)), mode='edge').reshape(-1, factor).min(axis=1)
+            maxs = np.pad(maxs, (0, padded - len(maxs)), mode='edge').reshape(-1, factor).max(axis=1)
+            levels.append((levels[-1][0] * factor, mins, maxs))
+        return levels
+
+    def write(self, sample_rate, path):
+        """Write the pyramid of everything processed to `path`; returns the encoded size in bytes."""
+        data = encode_peaks(self.levels(), sample_rate, self.frames)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+def build_peak_levels(samples, base_frames=PEAKS_BASE_FRAMES, factor=PEAKS_LEVEL_FACTOR,
+                      min_pairs=PEAKS_MIN_PAIRS):
+    """
+    Min/max envelope of a (frames, channels) buffer at several zoom levels.
+
+    Channels are folded together (the player draws one envelope). The finest level is reduced
+    from the samples once; every coarser level is reduced from the level below it, so the whole
+    pyramid costs about one pass over the audio. Returns [(frames_per_peak, mins, maxs), ...].
+    """
+    builder = PeakBuilder(base_frames)
+    builder.process(samples)
+    return builder.levels(factor, min_pairs)
+
+def encode_peaks(levels, sample_rate, frames):
+    """Serialize build_peak_levels() output into the compact 8-bit binary format."""
+    chunks = [_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(levels), int(sample_rate), int(frames))]
+    for frames_per_peak, mins, maxs in levels:
+        interleaved = np.empty(len(mins) * 2, dtype=np.int8)
+        interleaved[0::2] = _quantize(mins)
+        interleaved[1::2] = _quantize(maxs)
+        chunks.append(_LEVEL.pack(frames_per_peak, len(mins)))
+        chunks.append(interleaved.tobytes())
+    return b''.join(chunks)
+
+def decode_peaks(data):
+    """Inverse of encode_peaks: (sample_rate, frames, [(frames_per_peak, mins, maxs), ...])."""
+    magic, version, level_count, sample_rate, frames = _HEADER.unpack_from(data, 0)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError("Not a peaks file.")
+    offset = _HEADER.size
+    levels = []
+    for _ in range(level_count):
+        frames_per_peak, pairs = _LEVEL.unpack_from(data, offset)
+        offset += _LEVEL.size
+        interleaved = np.frombuffer(data, dtype=np.int8, count=pairs * 2, offset=offset)
+        offset += pairs * 2
+        levels.append((frames_per_peak, interleaved[0::2] / PEAKS_SCALE, interleaved[1::2] / PEAKS_SCALE))
+    return sample_rate, frames, levels
+
+def peaks_path_for(processed_file_path):
+    """Peaks live next to the processed file they describe."""
+    return f"{processed_file_path}.peaks"
+
+def write_peaks(samples, sample_rate, path):
+    """Build the pyramid for `samples` and write it to `path`; returns the encoded size in bytes."""
+    builder = PeakBuilder()
+    builder.process(samples)
+    return builder.write(sample_rate, path)
@@ -23,6 +23,145 @@ document.addEventListener('DOMContentLoaded', function() {
         return;
     }
 
+    // Precomputed min/max peaks (served by /audio/file/<id>/peaks) - when present the waveform is
+    // drawn from them and the audio streams through a media element instead of being decoded up front
+    const peaksUrl = document.getElementById('waveform').dataset.peaksUrl;
+    let peaksPromise = null;
+
+    // ============================================
+    // WAVEFORM PEAKS
+    // ============================================
+
+    // Binary layout mirrors app/services/waveform.py:
+    // header: magic(4) version(u16) levels(u16) sampleRate(u32) frames(u64)
+    // level:  framesPerPeak(u32) pairs(u32) pairs x (min i8, max i8)
+    function parsePeaks(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== 'WBPK' || view.getUint16(4, true) !== 1) {
+            throw new Error('Unsupported peaks format');
+        }
+        const levelCount = view.getUint16(6, true);
+        const sampleRate = view.getUint32(8, true);
+        const frames = Number(view.getBigUint64(12, true));
+        const levels = [];
+        let offset = 20;
+        for (let i = 0; i < levelCount; i++) {
+            const framesPerPeak = view.getUint32(offset, true);
+            const pairs = view.getUint32(offset + 4, true);
+            const data = new Int8Array(buffer, offset + 8, pairs * 2);
+            const mins = new Float32Array(pairs);
+            const maxs = new Float32Array(pairs);
+            for (let j = 0; j < pairs; j++) {
+                mins[j] = data[2 * j] / 127;
+                maxs[j] = data[2 * j + 1] / 127;
+            }
+            levels.push({ framesPerPeak, mins, maxs });
+            offset += 8 + pairs * 2;
+        }
+        return { duration: frames / sampleRate, levels };
+    }
+
+    function loadPeaks() {
+        if (!peaksPromise) {
+            peaksPromise = fetch(peaksUrl, { credentials: 'same-origin' })
+                .then(response => {
+                    if (!response.ok) throw new Error(`Peaks request failed: ${response.status}`);
+                    return response.arrayBuffer();
+                })
+                .then(parsePeaks);
+        }
+        return peaksPromise;
+    }
+
+    // Coarsest level that still gives every pixel of the container its own min/max pair
+    function pickPeakLevel(pyramid, container) {
+        const pixels = (container?.clientWidth || 1000) * (window.devicePixelRatio || 1);
+        const levels = pyramid.levels;
+        for (let i = levels.length - 1; i >= 0; i--) {
+            if (levels[i].mins.length >= pixels) return levels[i];
+        }
+        return levels[0];
+    }
+
+    // Load from peaks when the server has them, otherwise fall back to decoding the file
+    function loadWaveform(ws, containerSelector) {
+        if (!peaksUrl) {
+            ws.load(audioUrl);
+            return;
+        }
+        loadPeaks()
+            .then(pyramid => {
+                const level = pickPeakLevel(pyramid, document.querySelector(containerSelector));
+                ws.load(audioUrl, [level.maxs, level.mins], pyramid.duration);
+            })
+            .catch(error => {
+                console.error('[PEAKS] Falling back to full decode:', error);
+                ws.load(audioUrl);
+            });
+    }
+
+    // ============================================
+    // SPECTROGRAM TILES
+    // ============================================
+
+    // 256-entry palette for the 8-bit tiles (dark blue -> purple -> orange -> pale yellow)
+    const SPECTROGRAM_PALETTE = (() => {
+        const stops = [[0, 0, 0, 4], [0.35, 120, 28, 109], [0.7, 237, 105, 37], [1, 252, 255, 164]];
+        const palette = new Uint8ClampedArray(256 * 3);
+        for (let i = 0; i < 256; i++) {
+            const t = i / 255;
+            const upper = stops.findIndex(stop => stop[0] >= t);
+            const [t0, ...c0] = stops[Math.max(upper - 1, 0)];
+            const [t1, ...c1] = stops[upper];
+            const mix = t1 === t0 ? 0 : (t - t0) / (t1 - t0);
+            for (let c = 0; c < 3; c++) palette[i * 3 + c] = c0[c] + (c1[c] - c0[c]) * mix;
+        }
+        return palette;
+    })();
+
+    // Tiles are column-major uint8 (app/services/spectrogram.py): bins bytes per column, 0 Hz first
+    function drawSpectrogramTile(ctx, bytes, x, bins) {
+        const columns = bytes.length / bins;
+        const image = ctx.createImageData(columns, bins);
+        for (let col = 0; col < columns; col++) {
+            for (let bin = 0; bin < bins; bin++) {
+                const value = bytes[col * bins + bin];
+                const pixel = ((bins - 1 - bin) * columns + col) * 4;
+                image.data[pixel] = SPECTROGRAM_PALETTE[value * 3];
+                image.data[pixel + 1] = SPECTROGRAM_PALETTE[value * 3 + 1];
+                image.data[pixel + 2] = SPECTROGRAM_PALETTE[value * 3 + 2];
+                image.data[pixel + 3] = 255;
+            }
+        }
+        ctx.putImageData(image, x, 0);
+    }
+
+    async function renderSpectrogramTiles(container, indexUrl) {
+        const index = await fetch(indexUrl, { credentials: 'same-origin' }).then(response => {
+            if (!response.ok) throw new Error(`Spectrogram request failed: ${response.status}`);
+            return response.json();
+        });
+        // Coarsest zoom that still has a column per device pixel
+        const pixels = (container.clientWidth || 1000) * (window.devicePixelRatio || 1);
+        const zoom = [...index.zooms].reverse().find(level => level.columns >= pixels) || index.zooms[0];
+
+        const canvas = document.createElement('canvas');
+        canvas.width = zoom.columns;
+        canvas.height = index.bins;
+        canvas.style.width = '100%';
+        canvas.style.height = '200px';
+        container.replaceChildren(canvas);
+        const ctx = canvas.getContext('2d');
+
+        await Promise.all(Array.from({ length: zoom.tiles }, (_, tile) => {
+            const url = index.tile_url.replace('{zoom}', zoom.zoom).replace('{tile}', tile);
+            return fetch(url, { credentials: 'same-origin' })
+                .then(response => response.arrayBuffer())
+                .then(buffer => drawSpectrogramTile(ctx, new Uint8Array(buffer), tile * index.tile_columns, index.bins));
+        }));
+    }
+
     // ============================================
     // WAVESURFER INSTANCES
     // ============================================
@@ -94,11 +233,12 @@ document.addEventListener('DOMContentLoaded', function() {
             barRadius: 2,
             height: 120,
             normalize: true,
-            backend: 'WebAudio',
+            // With peaks the audio streams via <audio>; WebAudio would download and decode it all first
+            backend: peaksUrl ? 'MediaElement' : 'WebAudio',
             plugins: plugins,
         });
 
-        wavesurfer.load(audioUrl);
+        loadWaveform(wavesurfer, '#waveform');
         
         // Setup Web Audio API analyzers when audio starts playing
         // Re-setup on each play because bufferNode changes
@@ -185,8 +325,8 @@ document.addEventListener('DOMContentLoaded', function() {
         });
 
         // Load files (in production, load different files)
-        wavesurferAfter.load(audioUrl);
-        wavesurferBefore.load(audioUrl); // This would be original file URL
+        loadWaveform(wavesurferAfter, '#waveform-after');
+        loadWaveform(wavesurferBefore, '#waveform-before'); // This would be original file URL
 
         // Sync playback
         wavesurferAfter.on('audioprocess', () => {
@@ -212,6 +352,14 @@ document.addEventListener('DOMContentLoaded', function() {
             } else if (ws.media && ws.media.bufferNode && ws.media.bufferNode.context) {
                 console.log('[SETUP] ✓ Using ws.media.bufferNode.context');
                 audioContext = ws.media.bufferNode.context;
+            } else if (ws.getMediaElement && ws.getMediaElement()) {
+                // MediaElement backend (peaks mode): tap the <audio> element once, it then plays through the graph
+                if (!window.mediaElementSource) {
+                    audioContext = audioContext || new (window.AudioContext || window.webkitAudioContext)();
+                    window.mediaElementSource = audioContext.createMediaElementSource(ws.getMediaElement());
+                    window.mediaElementSource.connect(audioContext.destination);
+                }
+                audioContext = window.mediaElementSource.context;
             } else {
                 console.error('[SETUP] ERROR: Cannot find WaveSurfer AudioContext!');
                 return;
@@ -233,7 +381,12 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // bufferNode only exists when audio is playing
             if (!window.audioSourceConnected) {
-                if (ws.media && ws.media.bufferNode) {
+                if (window.mediaElementSource) {
+                    window.mediaElementSource.connect(analyser);
+                    window.mediaElementSource.connect(phaseAnalyser);
+                    window.audioSourceConnected = true;
+                    console.log('[SETUP] ✓ Connected to media element source');
+                } else if (ws.media && ws.media.bufferNode) {
                     console.log('[SETUP] Connecting to bufferNode (audio is playing)');
                     ws.media.bufferNode.connect(analyser);
                     ws.media.bufferNode.connect(phaseAnalyser);
@@ -612,7 +765,15 @@ document.addEventListener('DOMContentLoaded', function() {
             this.classList.toggle('active');
             const isActive = this.classList.contains('active');
             
-            if (isActive && wavesurfer && !window.spectrogramPluginInstance) {
+            const spectrogramUrl = spectrogramContainer?.dataset.spectrogramUrl;
+            if (isActive && spectrogramUrl && !window.spectrogramTilesRendered) {
+                // Server-side tiles: no client decode needed
+                window.spectrogramTilesRendered = true;
+                renderSpectrogramTiles(spectrogramContainer, spectrogramUrl).catch(error => {
+                    console.error('[SPECTRO] Tile rendering failed:', error);
+                    window.spectrogramTilesRendered = false;
+                });
+            } else if (isActive && !spectrogramUrl && wavesurfer && !window.spectrogramPluginInstance) {
                 // Add spectrogram plugin dynamically
                 try {
                     window.spectrogramPluginInstance = WaveSurfer.Spectrogram.create({
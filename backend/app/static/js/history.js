@@ -4,17 +4,17 @@
  */
 
 document.addEventListener('DOMContentLoaded', function() {
-    const POLLING_INTERVAL = 3000; // ms
+    const POLLING_INTERVAL = 3000; // ms, only when the status stream is unavailable
     
-    // === SEKCJA POLLINGU ===
+    // === SEKCJA STATUSÓW (SSE, polling jako fallback) ===
+    const taskWatcher = new TaskStatusWatcher(POLLING_INTERVAL);
     const pendingRows = document.querySelectorAll('tr[data-status-url]');
-    if (pendingRows.length > 0) {
-        pendingRows.forEach(row => {
-            const statusUrl = row.dataset.statusUrl;
-            const taskId = row.id.split('-').pop();
-            startPolling(statusUrl, taskId);
-        });
-    }
+    pendingRows.forEach(row => {
+        const taskId = row.id.split('-').pop();
+        taskWatcher.watch(taskId)
+            .then(data => updateTableRow(taskId, data))
+            .catch(error => console.error(`Błąd podczas sprawdzania statusu dla zadania ${taskId}:`, error));
+    });
 
     // === OBSŁUGA FILTRÓW I WYSZUKIWANIA ===
     const searchInput = document.getElementById('search-input');
@@ -201,28 +201,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Funkcje pollingu (bez zmian)
-    function startPolling(statusUrl, taskId) {
-        const interval = setInterval(() => {
-            fetch(statusUrl)
-                .then(response => {
-                    if (!response.ok) {
-                        if (response.status === 404) clearInterval(interval);
-                        throw new Error(`Błąd HTTP ${response.status}`);
-                    }
-                    return response.json();
-                })
-                .then(data => {
-                    if (data.status === 'COMPLETED' || data.status === 'FAILED') {
-                        clearInterval(interval);
-                        updateTableRow(taskId, data);
-                    }
-                })
-                .catch(error => { 
-                    console.error(`Błąd podczas sprawdzania statusu dla zadania ${taskId}:`, error); 
-                });
-        }, POLLING_INTERVAL);
-    }
     function updateTableRow(taskId, taskData) {
         const statusCell = document.getElementById(`task-status-cell-${taskId}`);
         const actionsCell = document.getElementById(`task-actions-cell-${taskId}`);
@@ -0,0 +1,78 @@
+/**
+ * WaveBulk - Loudness history chart
+ * Draws momentary / short-term loudness from the compact binary written by the worker
+ * (app/services/loudness_history.py) - no audio decode, no recomputation.
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    const canvas = document.getElementById('loudness-history');
+    if (!canvas || !canvas.dataset.url) {
+        return;
+    }
+
+    const FLOOR_LUFS = -60;
+    const CEILING_LUFS = 0;
+    const NO_VALUE = -32768;
+
+    // header: magic(4) version(u16) series(u16) secondsPerPoint(f32) points(u32), then i16 series (LUFS * 100)
+    function parseHistory(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== 'WBLH' || view.getUint16(4, true) !== 1) {
+            throw new Error('Unsupported loudness history format');
+        }
+        const seriesCount = view.getUint16(6, true);
+        const points = view.getUint32(12, true);
+        const series = [];
+        for (let i = 0; i < seriesCount; i++) {
+            series.push(new Int16Array(buffer.slice(16 + i * points * 2, 16 + (i + 1) * points * 2)));
+        }
+        return { secondsPerPoint: view.getFloat32(8, true), momentary: series[0], shortTerm: series[1] };
+    }
+
+    function drawSeries(ctx, values, width, height, color, lineWidth) {
+        const y = value => height * (CEILING_LUFS - value / 100) / (CEILING_LUFS - FLOOR_LUFS);
+        ctx.strokeStyle = color;
+        ctx.lineWidth = lineWidth;
+        ctx.beginPath();
+        let drawing = false;
+        for (let i = 0; i < values.length; i++) {
+            if (values[i] === NO_VALUE) {
+                drawing = false;
+                continue;
+            }
+            const x = values.length > 1 ? (i / (values.length - 1)) * width : 0;
+            const py = Math.min(Math.max(y(values[i]), 0), height);
+            drawing ? ctx.lineTo(x, py) : ctx.moveTo(x, py);
+            drawing = true;
+        }
+        ctx.stroke();
+    }
+
+    fetch(canvas.dataset.url, { credentials: 'same-origin' })
+        .then(response => {
+            if (!response.ok) throw new Error(`Loudness history request failed: ${response.status}`);
+            return response.arrayBuffer();
+        })
+        .then(parseHistory)
+        .then(history => {
+            const ratio = window.devicePixelRatio || 1;
+            canvas.width = canvas.clientWidth * ratio;
+            canvas.height = canvas.clientHeight * ratio;
+            const ctx = canvas.getContext('2d');
+
+            // Reference lines every 10 LU
+            ctx.strokeStyle = 'rgba(255, 255, 255, 0.1)';
+            ctx.lineWidth = 1;
+            for (let lufs = CEILING_LUFS - 10; lufs > FLOOR_LUFS; lufs -= 10) {
+                const lineY = canvas.height * (CEILING_LUFS - lufs) / (CEILING_LUFS - FLOOR_LUFS);
+                ctx.beginPath();
+                ctx.moveTo(0, lineY);
+                ctx.lineTo(canvas.width, lineY);
+                ctx.stroke();
+            }
+            drawSeries(ctx, history.momentary, canvas.width, canvas.height, 'rgba(74, 158, 255, 0.5)', ratio);
+            drawSeries(ctx, history.shortTerm, canvas.width, canvas.height, '#f39c12', 2 * ratio);
+        })
+        .catch(error => console.error('[LOUDNESS] History chart failed:', error));
+});
@@ -0,0 +1,85 @@
+/**
+ * WaveBulk - Stereo image
+ * Goniometer heatmap and phase correlation over time from the worker's precomputed data
+ * (app/services/stereo_image.py) - one small fetch, no audio decode.
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    const goniometerCanvas = document.getElementById('goniometer');
+    const correlationCanvas = document.getElementById('correlation-history');
+    const url = goniometerCanvas?.dataset.url;
+    if (!url) {
+        return;
+    }
+
+    // header: magic(4) version(u16) bins(u16) secondsPerPoint(f32) points(u32) overall(f32) extent(f32)
+    // body: points x i8 correlation * 127 (-128 = silent), then bins x bins u8 density, row 0 = bottom
+    function parseStereo(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== 'WBST' || view.getUint16(4, true) !== 1) {
+            throw new Error('Unsupported stereo data format');
+        }
+        const bins = view.getUint16(6, true);
+        const points = view.getUint32(12, true);
+        return {
+            bins,
+            extent: view.getFloat32(20, true),
+            correlation: new Int8Array(buffer, 24, points),
+            density: new Uint8Array(buffer, 24 + points, bins * bins),
+        };
+    }
+
+    function drawGoniometer(canvas, stereo) {
+        const { bins, density } = stereo;
+        canvas.width = bins;
+        canvas.height = bins;
+        const ctx = canvas.getContext('2d');
+        const image = ctx.createImageData(bins, bins);
+        for (let row = 0; row < bins; row++) {
+            for (let col = 0; col < bins; col++) {
+                const value = density[row * bins + col];
+                const pixel = ((bins - 1 - row) * bins + col) * 4;  // mid points up
+                image.data[pixel] = value * 0.3;
+                image.data[pixel + 1] = value;
+                image.data[pixel + 2] = value * 0.6;
+                image.data[pixel + 3] = 255;
+            }
+        }
+        ctx.putImageData(image, 0, 0);
+    }
+
+    function drawCorrelation(canvas, correlation) {
+        const ratio = window.devicePixelRatio || 1;
+        canvas.width = canvas.clientWidth * ratio;
+        canvas.height = canvas.clientHeight * ratio;
+        const ctx = canvas.getContext('2d');
+        const middle = canvas.height / 2;
+        ctx.strokeStyle = 'rgba(255, 255, 255, 0.2)';
+        ctx.beginPath();
+        ctx.moveTo(0, middle);
+        ctx.lineTo(canvas.width, middle);
+        ctx.stroke();
+
+        const step = canvas.width / Math.max(correlation.length, 1);
+        for (let i = 0; i < correlation.length; i++) {
+            if (correlation[i] === -128) continue;
+            const value = correlation[i] / 127;
+            // green in phase, red when the channels cancel
+            ctx.fillStyle = value >= 0 ? '#2ecc71' : '#e74c3c';
+            ctx.fillRect(i * step, middle, Math.max(step, 1), -value * middle);
+        }
+    }
+
+    fetch(url, { credentials: 'same-origin' })
+        .then(response => {
+            if (!response.ok) throw new Error(`Stereo data request failed: ${response.status}`);
+            return response.arrayBuffer();
+        })
+        .then(parseStereo)
+        .then(stereo => {
+            drawGoniometer(goniometerCanvas, stereo);
+            if (correlationCanvas) drawCorrelation(correlationCanvas, stereo.correlation);
+        })
+        .catch(error => console.error('[STEREO] Stereo image failed:', error));
+});
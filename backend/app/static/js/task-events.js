@@ -0,0 +1,146 @@
+/**
+ * WaveBulk - Task status events
+ * One Server-Sent Events stream per page pushes status changes of the user's tasks;
+ * when the stream is unavailable, every watched task is polled with a single
+ * /audio/task-status?ids=... request per interval.
+ */
+
+const TERMINAL_TASK_STATUSES = ['COMPLETED', 'FAILED'];
+
+class TaskStatusWatcher {
+    constructor(pollInterval = 3000, eventsUrl = '/audio/task-events', statusUrl = '/audio/task-status') {
+        this.pollInterval = pollInterval;
+        this.eventsUrl = eventsUrl;
+        this.statusUrl = statusUrl;
+        this.waiters = new Map();  // taskId -> {resolve, reject, onProgress}
+        this.latest = new Map();   // taskId -> last event seen, for tasks watched after it arrived
+        this.source = null;
+        this.timer = null;
+        this.polling = typeof EventSource === 'undefined';
+        this.added = new Set();    // ids watched since the last (re)connect or catch-up
+        this.scheduled = false;
+    }
+
+    /**
+     * Resolves with {status, result} once the task is COMPLETED or FAILED; until then
+     * onProgress({percent, stage, eta_seconds}) is called with the live progress, if any.
+     */
+    watch(taskId, onProgress = null) {
+        taskId = String(taskId);
+        return new Promise((resolve, reject) => {
+            this.waiters.set(taskId, { resolve, reject, onProgress });
+            const seen = this.latest.get(taskId);
+            if (seen && TERMINAL_TASK_STATUSES.includes(seen.status)) {
+                this._finish(taskId, seen);
+            } else {
+                this.added.add(taskId);
+                this._schedule();
+            }
+        });
+    }
+
+    // Pages watch many ids in one loop: wait for the loop to end, so one connect (or one
+    // catch-up request) covers all of them
+    _schedule() {
+        if (this.scheduled) return;
+        this.scheduled = true;
+        queueMicrotask(() => {
+            this.scheduled = false;
+            const added = Array.from(this.added).filter(taskId => this.waiters.has(taskId));
+            this.added.clear();
+            if (!added.length) return;
+            if (this.polling) {
+                this._poll();
+            } else if (!this.source) {
+                this._connect();
+            } else {
+                // The open stream's snapshot predates these ids: anything that finished
+                // before they were watched is fetched once
+                this._fetchStatuses(added);
+            }
+        });
+    }
+
+    _connect() {
+        // The ids make the server send their current state right after subscribing,
+        // so nothing that finished while (re)connecting is missed
+        const ids = Array.from(this.waiters.keys()).join(',');
+        const source = new EventSource(ids ? `${this.eventsUrl}?ids=${ids}` : this.eventsUrl);
+        this.source = source;
+        source.addEventListener('task', event => this._handle(JSON.parse(event.data)));
+        source.addEventListener('end', () => {
+            source.close();
+            this.source = null;
+            if (this.waiters.size) this._connect();
+        });
+        source.onerror = () => {
+            if (this.source !== source) return;
+            source.close();
+            this.source = null;
+            this.polling = true;
+            this._poll();
+        };
+    }
+
+    _handle(event) {
+        const taskId = String(event.task_id);
+        this.latest.set(taskId, event);
+        const waiter = this.waiters.get(taskId);
+        if (!waiter) return;
+        if (TERMINAL_TASK_STATUSES.includes(event.status)) {
+            this._finish(taskId, event);
+        } else if (event.progress && waiter.onProgress) {
+            waiter.onProgress(event.progress);
+        }
+    }
+
+    _finish(taskId, data) {
+        const waiter = this.waiters.get(taskId);
+        this.waiters.delete(taskId);
+        if (!this.waiters.size) {
+            // Nothing left to wait for: free the server's stream (or stop polling) until the next watch()
+            if (this.source) this.source.close();
+            this.source = null;
+            clearInterval(this.timer);
+            this.timer = null;
+        }
+        waiter.resolve(data);
+    }
+
+    _poll() {
+        if (this.timer) return;
+        this.timer = setInterval(() => {
+            const ids = Array.from(this.waiters.keys());
+            if (ids.length) this._fetchStatuses(ids);
+        }, this.pollInterval);
+    }
+
+    _fetchStatuses(ids) {
+        return fetch(`${this.statusUrl}?ids=${ids.join(',')}`)
+            .then(response => response.ok ? response.json() : Promise.reject(new Error(`Błąd HTTP ${response.status}`)))
+            .then(data => {
+                Object.entries(data.tasks).forEach(([taskId, task]) => {
+                    // Same shape as a stream event: result is the (summarized) result JSON
+                    this._handle({
+                        task_id: taskId,
+                        status: task.status,
+                        result: JSON.stringify(task.summary),
+                        progress: task.stage ? { percent: task.progress, stage: task.stage, eta_seconds: task.eta_seconds } : null,
+                    });
+                });
+                data.missing.forEach(taskId => this._fail(String(taskId), new Error('Nie znaleziono zadania.')));
+            })
+            .catch(error => console.error('Błąd podczas sprawdzania statusu zadań:', error));
+    }
+
+    _fail(taskId, error) {
+        const waiter = this.waiters.get(taskId);
+        if (!waiter) return;
+        this.waiters.delete(taskId);
+        if (!this.waiters.size) {
+            clearInterval(this.timer);
+            this.timer = null;
+        }
+        waiter.reject(error);
+    }
+}
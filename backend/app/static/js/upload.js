@@ -72,7 +72,8 @@ document.addEventListener('DOMContentLoaded', function() {
     const ErrorIcon = `<svg style="width: 24px; height: 24px; color: #dc3545;" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="2" stroke="currentColor"><path stroke-linecap="round" stroke-linejoin="round" d="M9.75 9.75l4.5 4.5m0-4.5l-4.5 4.5M21 12a9 9 0 11-18 0 9 9 0 0118 0z" /></svg>`;
 
     // Configuration
-    const MAX_FILE_SIZE_MB = 100;
+    const MAX_FILE_SIZE_MB = 4096; // UPLOAD_MAX_BYTES on the server; large files go up in resumable chunks
+    const MAX_CHUNK_RETRIES = 5; // consecutive failed chunks before an upload is given up
     const ALLOWED_MIME_TYPES = [
         'audio/wav', 'audio/x-wav',          // WAV
         'audio/mpeg', 'audio/mp3',           // MP3
@@ -83,7 +84,12 @@ document.addEventListener('DOMContentLoaded', function() {
         'audio/x-ms-wma',                     // WMA
         'audio/aiff', 'audio/x-aiff'         // AIFF
     ];
-    const POLLING_INTERVAL = 2500; // ms
+    const POLLING_INTERVAL = 2500; // ms, only when the status stream is unavailable
+    const taskWatcher = new TaskStatusWatcher(POLLING_INTERVAL);
+    const STAGE_LABELS = {
+        copy: 'Kopiowanie', decode: 'Dekodowanie', analyze: 'Analiza', render: 'Przetwarzanie',
+        encode: 'Kodowanie', artifacts: 'Wizualizacje', verify: 'Weryfikacja', tagging: 'Tagowanie',
+    };
     
     // State
     let fileQueue = [];
@@ -210,6 +216,37 @@ document.addEventListener('DOMContentLoaded', function() {
             track_number: trackNumberInput.value,
             isrc: isrcInput.value,
         };
+        // Extra formats are rendered by the same job from one decode; the main format goes first
+        const extraTargets = Array.from(document.querySelectorAll('.extra-format:checked'))
+            .filter(input => input.dataset.format !== processingOptions.format)
+            .map(input => ({
+                format: input.dataset.format,
+                bitrate: input.dataset.bitrate || null,
+                bit_depth: input.dataset.bitDepth || null,
+            }));
+        if (extraTargets.length) {
+            processingOptions.targets = [{ format: processingOptions.format }, ...extraTargets];
+        }
+
+        // The cover is uploaded and normalized once for the whole batch; each file references it by ID
+        const coverArtFile = coverArtInput.files[0];
+        if (coverArtFile) {
+            try {
+                processingOptions.cover_art_id = await uploadCoverArt(coverArtFile);
+            } catch (error) {
+                fileQueue.forEach((item, i) => {
+                    const cardElement = document.getElementById(`file-item-${i}`);
+                    updateCardStatus(cardElement, 'failed', 'Błąd');
+                    displayError(error.message, cardElement);
+                });
+                isProcessingQueue = false;
+                updateQueueSummary(0, fileQueue.length, true);
+                submitButton.textContent = "Prześlij nowe pliki";
+                submitButton.disabled = false;
+                submitButton.onclick = () => location.reload();
+                return;
+            }
+        }
 
         for (let i = 0; i < fileQueue.length; i++) {
             updateQueueSummary(i + 1, fileQueue.length);
@@ -217,9 +254,9 @@ document.addEventListener('DOMContentLoaded', function() {
             const cardElement = document.getElementById(`file-item-${i}`);
             try {
                 updateCardStatus(cardElement, 'processing', 'Wysyłanie...');
-                const taskStatusUrl = await uploadFile(item.file, processingOptions, cardElement);
+                const task = await uploadFile(item.file, processingOptions, cardElement);
                 updateCardStatus(cardElement, 'processing', 'Przetwarzanie w tle...');
-                const finalData = await pollForTaskResult(taskStatusUrl);
+                const finalData = await waitForTaskResult(task, cardElement);
                 updateCardStatus(cardElement, 'completed', 'Ukończono');
                 displayResult(finalData.result, cardElement);
                 completedCount++;
@@ -236,63 +273,104 @@ document.addEventListener('DOMContentLoaded', function() {
         submitButton.onclick = () => location.reload();
     }
 
-    function uploadFile(file, options, uiElement) {
-        return new Promise((resolve, reject) => {
-            const progressBar = uiElement.querySelector('.progress-bar');
-            uiElement.querySelector('.progress').style.display = 'block';
-            const formData = new FormData();
-            formData.append('file', file);
-            formData.append('options', JSON.stringify(options));
-            const coverArtFile = coverArtInput.files[0];
-            if (coverArtFile) {
-                formData.append('cover_art', coverArtFile);
+    async function uploadCoverArt(coverArtFile) {
+        const formData = new FormData();
+        formData.append('cover_art', coverArtFile);
+        const response = await fetch('/audio/cover-art', { method: 'POST', body: formData });
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw new Error(`Okładka: ${data.error || `Błąd serwera ${response.status}`}`);
+        }
+        return data.cover_art_id;
+    }
+
+    // Files go up in resumable chunks: after a dropped connection only the missing bytes are resent
+    async function uploadFile(file, options, uiElement) {
+        const progressBar = uiElement.querySelector('.progress-bar');
+        uiElement.querySelector('.progress').style.display = 'block';
+        const upload = await uploadRequest('/audio/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, length: file.size, options }),
+        });
+        let offset = upload.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + upload.chunk_bytes);
+            try {
+                offset = await sendChunk(upload.upload_url, offset, chunk, loaded => {
+                    progressBar.style.width = Math.round(((offset + loaded) / file.size) * 100) + '%';
+                });
+                failures = 0;
+            } catch (error) {
+                // Network errors and offset conflicts are resumed; anything else (e.g. a rejected header) is final
+                if ((error.status && error.status !== 409) || ++failures > MAX_CHUNK_RETRIES) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** (failures - 1)));
+                offset = (await uploadRequest(upload.upload_url, { cache: 'no-store' })).offset;
             }
+        }
+        const data = await uploadRequest(`${upload.upload_url}/complete`, { method: 'POST' });
+        return { id: data.task_id };
+    }
+
+    async function uploadRequest(url, init = {}) {
+        let response;
+        try {
+            response = await fetch(url, init);
+        } catch (error) {
+            throw new Error('Błąd sieciowy.');
+        }
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) throw uploadError(response.status, data);
+        return data;
+    }
+
+    function sendChunk(uploadUrl, offset, chunk, onProgress) {
+        return new Promise((resolve, reject) => {
             const xhr = new XMLHttpRequest();
-            xhr.open('POST', '/audio/upload-and-process', true);
-            xhr.upload.addEventListener('progress', e => {
-                if (e.lengthComputable) progressBar.style.width = Math.round((e.loaded / e.total) * 100) + '%';
-            });
+            xhr.open('PATCH', uploadUrl, true);
+            xhr.setRequestHeader('Upload-Offset', String(offset));
+            xhr.setRequestHeader('Content-Type', 'application/offset+octet-stream');
+            xhr.upload.addEventListener('progress', e => onProgress(e.loaded));
             xhr.onload = function() {
-                if (xhr.status === 202) {
-                    resolve(JSON.parse(xhr.responseText).status_url);
-                } else if (xhr.status === 403) {
-                    // Limit reached
-                    const errorData = JSON.parse(xhr.responseText);
-                    if (errorData.limit_reached) {
-                        reject(new Error(`🚫 ${errorData.error}\n\nUżyłeś: ${errorData.used}/${errorData.limit} plików`));
-                    } else {
-                        reject(new Error(errorData.error || 'Brak dostępu'));
-                    }
-                } else {
-                    reject(new Error(JSON.parse(xhr.responseText)?.error || `Błąd serwera ${xhr.status}`));
-                }
+                let data = {};
+                try { data = JSON.parse(xhr.responseText); } catch (e) { /* puste ciało */ }
+                if (xhr.status === 200) resolve(data.offset);
+                else reject(uploadError(xhr.status, data));
             };
             xhr.onerror = () => reject(new Error('Błąd sieciowy.'));
-            xhr.send(formData);
+            xhr.send(chunk);
         });
     }
 
-    function pollForTaskResult(statusUrl) {
-         return new Promise((resolve, reject) => {
-            const interval = setInterval(() => {
-                fetch(statusUrl)
-                    .then(response => response.ok ? response.json() : Promise.reject(new Error(`Błąd HTTP ${response.status}`)))
-                    .then(data => {
-                        if (data.status === 'COMPLETED') {
-                            clearInterval(interval); 
-                            resolve(data);
-                        } else if (data.status === 'FAILED') {
-                            clearInterval(interval); 
-                            reject(new Error(JSON.parse(data.result)?.error || 'Nieznany błąd wykonania.'));
-                        }
-                        // Still processing - continue polling
-                    })
-                    .catch(error => { 
-                        clearInterval(interval); 
-                        reject(error); 
-                    });
-            }, POLLING_INTERVAL);
-        });
+    function uploadError(status, data) {
+        const error = data.limit_reached
+            ? new Error(`🚫 ${data.error}\n\nUżyłeś: ${data.used}/${data.limit} plików`)
+            : new Error(data.error || `Błąd serwera ${status}`);
+        error.status = status;
+        return error;
+    }
+
+    async function waitForTaskResult(task, cardElement) {
+        const data = await taskWatcher.watch(task.id, progress => showTaskProgress(progress, cardElement));
+        if (data.status === 'FAILED') {
+            throw new Error(JSON.parse(data.result)?.error || 'Nieznany błąd wykonania.');
+        }
+        return data;
+    }
+
+    function showTaskProgress(progress, uiElement) {
+        if (progress.percent === null || progress.percent === undefined) return;
+        const eta = progress.eta_seconds !== null && progress.eta_seconds !== undefined
+            ? ` · ~${formatEta(progress.eta_seconds)}` : '';
+        uiElement.querySelector('.file-card-status').textContent =
+            `${STAGE_LABELS[progress.stage] || 'Przetwarzanie'} ${Math.round(progress.percent)}%${eta}`;
+        uiElement.querySelector('.progress-bar').style.width = `${progress.percent}%`;
+    }
+
+    function formatEta(seconds) {
+        if (seconds < 60) return `${Math.ceil(seconds)} s`;
+        return `${Math.floor(seconds / 60)} min ${Math.ceil(seconds % 60)} s`;
     }
 
     function displayResult(resultJsonString, uiElement) {
@@ -1,19 +1,34 @@
 import os
 import json
+import base64
 import numpy as np
-import soundfile as sf
 import mutagen
+import shutil
+import tempfile
+import time
 import subprocess
-from mutagen.mp3 import MP3
 from mutagen.flac import FLAC, Picture
-from mutagen.id3 import APIC, TSRC
-from pydub import AudioSegment
-import pyloudnorm as pyln
-from datetime import datetime, UTC
+from mutagen.id3 import ID3, APIC, TALB, TIT2, TPE1, TRCK, TSRC
+from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
 from app import celery, db
 from app.models import AudioFile, ProcessingTask
+from app.services.audio_analyzer import AudioAnalyzer, analyze_audio, analyze_file
+from app.services.analysis_cache import analysis_path_for, read_analysis, write_analysis
+from app.services.converter import (decode_audio, get_stream_layout, iter_audio_blocks, iter_ffmpeg_pcm,
+                                    pcm_input_args, pcm_output_args, run_ffmpeg_with_pcm)
+from app.services.dsp import apply_gain, apply_fade_in, apply_fade_out, trim_silence
+from app.services.waveform import PeakBuilder, peaks_path_for, write_peaks
+from app.services.spectrogram import SpectrogramBuilder, spectrogram_dir_for, write_spectrogram_tiles
+from app.services.loudness_history import history_path_for, write_history
+from app.services.stereo_image import stereo_path_for, write_stereo
+from app.services.probe import LOSSLESS_FORMATS, probe_format
+from app.services.render_cache import RenderCache, render_cache_key, render_cache_root
+from app.services.cover_art import cover_art_path_for, is_cover_art_id
+from app.services.task_events import publish_task_event
+from app.services.task_progress import TaskProgress
+from app.services.task_state import claim_flush, finish_task, flush_task_states, release_flush, start_task
 from flask import current_app
-import tempfile
+from sqlalchemy.exc import SQLAlchemyError
 
 PRESET_LUFS = {
     'spotify': -14.0,
@@ -25,64 +40,33 @@ BIT_DEPTH_PARAMS = {
     '24': ['-acodec', 'pcm_s24le'],
     '32f': ['-acodec', 'pcm_f32le'],
 }
+FLAC_BIT_DEPTH_PARAMS = {
+    '16': ['-sample_fmt', 's16'],
+    '24': ['-sample_fmt', 's32', '-bits_per_raw_sample', '24'],
+    '32f': ['-sample_fmt', 's32', '-bits_per_raw_sample', '24'],  # FLAC has no float; keep 24-bit
+}
 BITRATE_PARAMS = {
     'v0': ['-q:a', '0'],  # VBR V0 (245 kbps avg)
     'v2': ['-q:a', '2'],  # VBR V2 (190 kbps avg)
 }
-LOSSLESS_FORMATS = ['wav', 'flac', 'aiff', 'alac']
 LOSSY_FORMATS = ['mp3', 'aac', 'm4a', 'ogg', 'wma', 'opus']
+OUTPUT_FORMATS = ['mp3', 'aac', 'wav', 'flac']
+MAX_OUTPUT_TARGETS = 4
+METADATA_FIELDS = ('artist', 'album', 'title', 'track_number', 'isrc')
+TAG_PADDING_BYTES = 16 * 1024  # room for later tag edits without rewriting the file
+TAG_PADDING_MAX_BYTES = 256 * 1024
+# Options a target in options['targets'] may override; everything else is shared by all outputs
+TARGET_OPTION_KEYS = ('format', 'bitrate', 'bit_depth', 'sample_rate', 'dither_method', 'resampler')
+FLUSH_RETRY_MAX_SECONDS = 300  # backoff cap while the database refuses task state batches
 
 def _detect_audio_format(filepath):
-    """Detect audio format using ffprobe and return detailed info"""
+    """Detect audio format (header probe in process, ffprobe for exotic inputs) and return detailed info"""
     try:
-        cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_format', '-show_streams', filepath
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        
-        format_info = data.get('format', {})
-        stream_info = data.get('streams', [{}])[0]
-        
-        # Determine if lossy or lossless
-        codec_name = stream_info.get('codec_name', '').lower()
-        format_name = format_info.get('format_name', '').lower()
-        
-        is_lossless = any(fmt in codec_name or fmt in format_name 
-                         for fmt in LOSSLESS_FORMATS)
-        
-        return {
-            'codec': stream_info.get('codec_name', 'unknown'),
-            'codec_long_name': stream_info.get('codec_long_name', 'Unknown'),
-            'format_name': format_info.get('format_name', 'unknown'),
-            'bitrate': int(stream_info.get('bit_rate', 0)) if stream_info.get('bit_rate') else None,
-            'sample_rate': int(stream_info.get('sample_rate', 0)) if stream_info.get('sample_rate') else None,
-            'channels': stream_info.get('channels', 0),
-            'duration': float(format_info.get('duration', 0)),
-            'is_lossless': is_lossless,
-            'file_extension': os.path.splitext(filepath)[1].lower()
-        }
+        return probe_format(filepath)
     except Exception as e:
         current_app.logger.error(f"Format detection failed: {e}")
         return None
 
-def _convert_to_wav(input_path, output_path):
-    """Convert any audio format to WAV using ffmpeg"""
-    try:
-        cmd = [
-            'ffmpeg', '-y', '-i', input_path,
-            '-acodec', 'pcm_s16le',  # 16-bit PCM
-            '-ar', '44100',  # 44.1kHz
-            '-ac', '2',  # Stereo
-            output_path
-        ]
-        subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return True
-    except Exception as e:
-        current_app.logger.error(f"Conversion to WAV failed: {e}")
-        return False
-
 def _get_quality_warning(input_format_info, output_format):
     """Generate quality warning message based on conversion"""
     if not input_format_info:
@@ -127,263 +111,820 @@ def _get_bitrate_param(format_type, bitrate):
         return ['-b:a', bitrate]
     return None
 
-def _run_ffmpeg_loudnorm(input_path, output_path, target_lufs, bit_depth_params, bitrate_param, options):
-    temp_output = None
+def _output_filters(options):
+    """Per-output filters (currently only the soxr resampler)"""
+    # soxr option deprecated in newer FFmpeg, so the resampler is selected through aresample
+    return ['aresample=resampler=soxr'] if options.get('resampler') == 'soxr' else []
+
+def _encoder_args(output_format, options, source_rate):
+    """ffmpeg dither, codec and rate arguments for one output"""
+    encoder_args = []
+    # Dither lives in ffmpeg's quantizer so it always follows any resampling
+    if options.get('dither_method') and options['dither_method'] != 'none' and options.get('bit_depth') == '16':
+        encoder_args.extend(['-dither_method', options['dither_method']])
+    
+    if output_format in ['mp3', 'aac']:
+        encoder_args.extend(_get_bitrate_param(output_format, options.get('bitrate') or '320k'))
+    elif output_format == 'flac':
+        encoder_args.extend(FLAC_BIT_DEPTH_PARAMS.get(options.get('bit_depth'), []))
+    else:
+        encoder_args.extend(BIT_DEPTH_PARAMS.get(options.get('bit_depth'), []))
+    
+    output_rate = options.get('sample_rate') or '44100'
+    if output_rate == 'original':
+        output_rate = source_rate
+    encoder_args.extend(['-ar', str(output_rate)])
+    return encoder_args
+
+def _output_args(output_format, options, source_rate, audio_filters=()):
+    """ffmpeg output arguments (filters, dither, codec, rate) shared by every export path"""
+    filters = list(audio_filters) + _output_filters(options)
+    output_args = ['-af', ','.join(filters)] if filters else []
+    return output_args + _encoder_args(output_format, options, source_rate)
+
+def _output_targets(options):
+    """Options of every output: options['targets'] entries layered over the shared options"""
+    shared = {key: value for key, value in options.items() if key != 'targets'}
+    targets = options.get('targets') or [{}]
+    return [{**shared, **{key: target[key] for key in TARGET_OPTION_KEYS if key in target}} for target in targets]
+
+def _output_filenames(original_filename, targets):
+    """One file name per target; a repeated extension gets the target's position as a suffix"""
+    stem = os.path.splitext(original_filename)[0]
+    filenames, extensions = [], set()
+    for position, target in enumerate(targets, start=1):
+        output_format = target.get('format', 'mp3').lower()
+        # Handle AAC -> m4a extension
+        extension = 'm4a' if output_format == 'aac' else output_format
+        filenames.append(f"{stem}-{position}.{extension}" if extension in extensions else f"{stem}.{extension}")
+        extensions.add(extension)
+    return filenames
+
+def render_outputs(options, original_filename, folder):
+    """(format, target options, path) of every output of a job in `folder`, the primary first"""
+    targets = _output_targets(options)
+    return [(target.get('format', 'mp3').lower(), target, os.path.join(folder, filename))
+            for target, filename in zip(targets, _output_filenames(original_filename, targets))]
+
+def _render_args(outputs, source_rate, audio_filters=()):
+    """
+    ffmpeg output arguments that write every (format, options, path) output from one PCM input.
+
+    Without shared filters each output simply gets its own -af chain. Shared filters (loudnorm)
+    run once in a filter_complex whose result asplit fans out to the per-output chains, so
+    normalizing for several formats costs one filter pass and one ffmpeg process.
+    """
+    if len(outputs) == 1 or not audio_filters:
+        render_args = []
+        for output_format, options, path in outputs:
+            render_args.extend(_output_args(output_format, options, source_rate, audio_filters))
+            render_args.append(path)
+        return render_args
+    split_labels = ''.join(f"[split{index}]" for index in range(len(outputs)))
+    graph = [f"[0:a]{','.join(audio_filters)},asplit={len(outputs)}{split_labels}"]
+    render_args = []
+    for index, (output_format, options, path) in enumerate(outputs):
+        graph.append(f"[split{index}]{','.join(_output_filters(options) or ['anull'])}[out{index}]")
+        render_args.extend(['-map', f"[out{index}]"] + _encoder_args(output_format, options, source_rate) + [path])
+    return ['-filter_complex', ';'.join(graph)] + render_args
+
+def _rounded_or_none(value):
+    """JSON-safe measurement: silence (-inf) and missing values become null"""
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), 2)
+
+def _file_size(path):
+    """Size of a rendered output, or None if it cannot be read"""
     try:
-        pass1_filter = f"loudnorm=I={target_lufs}:TP=-1.0:LRA=7:print_format=json"
-        
-        pass1_cmd = ['ffmpeg', '-y', '-i', input_path, '-af', pass1_filter, '-f', 'null', '-']
-        
-        result = subprocess.run(pass1_cmd, capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            raise subprocess.CalledProcessError(result.returncode, pass1_cmd, output=result.stdout, stderr=result.stderr)
-
-        stderr_output = result.stderr.strip()
-        start_index = stderr_output.rfind('{')
-        end_index = stderr_output.rfind('}')
-        if start_index == -1 or end_index == -1:
-            raise ValueError("Could not find JSON object in ffmpeg output.")
-        json_output = stderr_output[start_index:end_index+1]
-        loudnorm_stats = json.loads(json_output)
-        
-        measured_i = loudnorm_stats['input_i']
-        measured_tp = loudnorm_stats['input_tp']
-        target_offset = loudnorm_stats['target_offset']
-
-        if float(measured_i) == -float('inf'): measured_i = "-99.0"
-        if float(measured_tp) == -float('inf'): measured_tp = "-99.0"
-        if target_offset == 'inf': target_offset = "0.0"
-
-        pass2_filter = (f"loudnorm=I={target_lufs}:TP=-1.0:LRA=7:"
-                        f"measured_I={measured_i}:"
-                        f"measured_LRA={loudnorm_stats['input_lra']}:"
-                        f"measured_tp={measured_tp}:"
-                        f"measured_thresh={loudnorm_stats['input_thresh']}:"
-                        f"offset={target_offset}")
-        
-        # Add resampler to filter chain if requested (soxr option deprecated in newer FFmpeg)
-        if options.get('resampler') == 'soxr':
-            pass2_filter = f"{pass2_filter},aresample=resampler=soxr"
-        
-        # Use temp file if input == output (FFmpeg cannot overwrite in-place)
-        use_temp = (input_path == output_path)
-        if use_temp:
-            temp_output = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-            final_output = temp_output.name
-            temp_output.close()
-        else:
-            final_output = output_path
-        
-        pass2_cmd = ['ffmpeg', '-y', '-i', input_path, '-af', pass2_filter]
-        
-        if options.get('dither_method') and options['dither_method'] != 'none' and options.get('bit_depth') == '16':
-            pass2_cmd.extend(['-dither_method', options['dither_method']])
-        
-        if bit_depth_params: pass2_cmd.extend(bit_depth_params)
-        if bitrate_param: pass2_cmd.extend(bitrate_param)
-        
-        pass2_cmd.extend(['-ar', '44100'])
-        pass2_cmd.append(final_output)
-        
-        result = subprocess.run(pass2_cmd, capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            if use_temp and os.path.exists(final_output):
-                os.remove(final_output)
-            raise subprocess.CalledProcessError(result.returncode, pass2_cmd, output=result.stdout, stderr=result.stderr)
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+def _loudnorm_value(value):
+    """Format a measurement for the loudnorm filter; silence (-inf) is clamped like ffmpeg's own report"""
+    return f"{max(float(value), -99.0):.2f}"
+
+def _parse_loudnorm_report(stderr_output):
+    """Extract the JSON block loudnorm prints (print_format=json) at the end of an encode"""
+    start_index = stderr_output.rfind('{')
+    end_index = stderr_output.rfind('}')
+    if start_index == -1 or end_index == -1:
+        raise ValueError("Could not find JSON object in ffmpeg output.")
+    return json.loads(stderr_output[start_index:end_index+1])
+
+def _loudnorm_filter(target_lufs, stats=None):
+    """Single-pass loudnorm fed with the in-process measurement (placeholders when not measured yet)"""
+    def measured(key, value_format):
+        return value_format(stats[key]) if stats else '<measured>'
+    return (f"loudnorm=I={target_lufs}:TP=-1.0:LRA=7:"
+            f"measured_I={measured('input_i', _loudnorm_value)}:"
+            f"measured_LRA={measured('input_lra', lambda value: f'{value:.2f}')}:"
+            f"measured_tp={measured('input_tp', _loudnorm_value)}:"
+            f"measured_thresh={measured('input_thresh', _loudnorm_value)}:"
+            f"print_format=json")
+
+def _loudnorm_metrics(source, stats, stderr_output):
+    """Output metrics of a loudnorm render from ffmpeg's report and the source analysis"""
+    report = _parse_loudnorm_report(stderr_output)
+    output_i = float(report['output_i'])
+    gain_db = output_i - stats['input_i'] if np.isfinite(stats['input_i']) else 0.0
+    metrics = source.metrics(gain_db)
+    metrics.update({
+        'integrated_lufs': output_i,
+        'true_peak_db': float(report['output_tp']),
+        'loudness_range': float(report['output_lra']),
+    })
+    return metrics
+
+def _run_ffmpeg_loudnorm(samples, sample_rate, outputs, target_lufs, source, progress=None):
+    """
+    Loudness-normalize already-decoded PCM in a single ffmpeg encode writing every output.
+
+    The BS.1770 measurement that loudnorm's first pass used to produce is the in-process
+    AnalysisResult `source` of the buffer we hold, so the input is never decoded a second (or
+    third) time. Returns the metrics of the output, or None on failure: integrated loudness, true
+    peak and LRA come from loudnorm's own report, the rest is the input moved by the
+    integrated-loudness change - exact when loudnorm runs linear, an approximation when it has
+    to compress.
+    """
+    try:
+        stats = source.loudnorm_stats()
+        # loudnorm upsamples internally to 192 kHz; _encoder_args always sets the output rate explicitly
+        output_args = _render_args(outputs, sample_rate, [_loudnorm_filter(target_lufs, stats)])
         
-        # Move temp file to final location if needed
-        if use_temp:
-            import shutil
-            shutil.move(final_output, output_path)
-            
-        return True
+        stderr_output = run_ffmpeg_with_pcm(samples, sample_rate, output_args, loglevel='info', progress=progress)
+        return _loudnorm_metrics(source, stats, stderr_output)
     except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError, ValueError) as e:
-        current_app.logger.error(f"FFmpeg loudnorm failed for {input_path}: {e}")
+        current_app.logger.error(f"FFmpeg loudnorm failed for {outputs[0][2]}: {e}")
         if hasattr(e, 'stderr'):
             current_app.logger.error(f"FFmpeg stderr: {e.stderr}")
-        if temp_output and os.path.exists(temp_output):
-            os.remove(temp_output)
-        return False
+        return None
+
+def _tag_padding(info):
+    """mutagen padding policy: keep existing padding that fits, otherwise reserve TAG_PADDING_BYTES"""
+    return info.padding if 0 <= info.padding <= TAG_PADDING_MAX_BYTES else TAG_PADDING_BYTES
+
+def _image_mime(image_data):
+    return 'image/png' if image_data.startswith(b'\x89PNG') else 'image/jpeg'
+
+def _flac_picture(image_data):
+    picture = Picture()
+    picture.data = image_data; picture.mime = _image_mime(image_data); picture.type = 3
+    return picture
+
+def _track_number(value):
+    try:
+        return int(str(value).split('/')[0])
+    except ValueError:
+        return None
+
+def _set_id3_tags(tags, fields, image_data):
+    frames = {'artist': TPE1, 'album': TALB, 'title': TIT2, 'track_number': TRCK, 'isrc': TSRC}
+    for key, value in fields.items():
+        tags.setall(frames[key].__name__, [frames[key](encoding=3, text=str(value))])
+    if image_data:
+        tags.setall('APIC', [APIC(encoding=3, mime=_image_mime(image_data), type=3, desc='Cover', data=image_data)])
+
+def _set_vorbis_tags(audio, fields, image_data):
+    names = {'artist': 'artist', 'album': 'album', 'title': 'title', 'track_number': 'tracknumber', 'isrc': 'isrc'}
+    for key, value in fields.items():
+        audio.tags[names[key]] = [str(value)]
+    if image_data and isinstance(audio, FLAC):
+        audio.clear_pictures()
+        audio.add_picture(_flac_picture(image_data))
+    elif image_data:
+        # Ogg streams carry the FLAC picture block base64-encoded in a comment
+        audio.tags['metadata_block_picture'] = [base64.b64encode(_flac_picture(image_data).write()).decode('ascii')]
+
+def _set_mp4_tags(tags, fields, image_data):
+    names = {'artist': '\xa9ART', 'album': '\xa9alb', 'title': '\xa9nam'}
+    for key, value in fields.items():
+        if key in names:
+            tags[names[key]] = [str(value)]
+        elif key == 'track_number' and _track_number(value) is not None:
+            tags['trkn'] = [(_track_number(value), 0)]
+        elif key == 'isrc':
+            tags['----:com.apple.iTunes:ISRC'] = [MP4FreeForm(str(value).encode('utf-8'))]
+    if image_data:
+        image_format = MP4Cover.FORMAT_PNG if _image_mime(image_data) == 'image/png' else MP4Cover.FORMAT_JPEG
+        tags['covr'] = [MP4Cover(image_data, imageformat=image_format)]
 
 def _apply_metadata(filepath, options):
+    """
+    Tag an output in one open and one save: text tags, ISRC and cover art for ID3 (MP3/WAV/AIFF),
+    Vorbis comments (FLAC/Ogg Vorbis/Opus) and MP4. The save reserves TAG_PADDING_BYTES of
+    padding, so later tag edits fit in place instead of rewriting the audio behind the tag.
+    """
+    fields = {key: options[key] for key in METADATA_FIELDS if options.get(key)}
     cover_art_path = options.get('cover_art_path')
+    image_data = None
     try:
-        audio = mutagen.File(filepath, easy=True)
-        if audio is None: return
-        
-        if options.get('artist'): audio['artist'] = options['artist']
-        if options.get('album'): audio['album'] = options['album']
-        if options.get('title'): audio['title'] = options['title']
-        if options.get('track_number'): audio['tracknumber'] = options['track_number']
-        audio.save()
-
-        audio_low_level = mutagen.File(filepath)
-        if options.get('isrc'):
-            if isinstance(audio_low_level, MP3):
-                audio_low_level.tags.add(TSRC(encoding=3, text=options['isrc']))
-            else:
-                 audio_low_level['isrc'] = options['isrc']
-        
         if cover_art_path and os.path.exists(cover_art_path):
             with open(cover_art_path, 'rb') as art:
                 image_data = art.read()
-                mime = 'image/jpeg' if cover_art_path.lower().endswith(('.jpg', '.jpeg')) else 'image/png'
-                if isinstance(audio_low_level, MP3):
-                    audio_low_level.tags.add(APIC(encoding=3, mime=mime, type=3, desc='Cover', data=image_data))
-                elif isinstance(audio_low_level, FLAC):
-                    pic = Picture()
-                    pic.data = image_data; pic.mime = mime; pic.type = 3
-                    audio_low_level.add_picture(pic)
-        audio_low_level.save()
+        if not fields and not image_data:
+            return
+        audio = mutagen.File(filepath)
+        if audio is None: return
+        if audio.tags is None:
+            audio.add_tags()
+
+        if isinstance(audio.tags, ID3):
+            _set_id3_tags(audio.tags, fields, image_data)
+        elif isinstance(audio, MP4):
+            _set_mp4_tags(audio.tags, fields, image_data)
+        else:
+            _set_vorbis_tags(audio, fields, image_data)
+        audio.save(padding=_tag_padding)
     except Exception as e:
         current_app.logger.error(f"Error applying metadata to {filepath}: {e}")
+
+def _target_lufs(options):
+    """Integrated loudness the options normalize to, or None"""
+    lufs_preset = options.get('lufs_preset')
+    if lufs_preset in PRESET_LUFS:
+        return PRESET_LUFS[lufs_preset]
+    if lufs_preset == 'custom' and options.get('normalize'):
+        return float(options.get('target_lufs', -23.0))
+    return None
+
+def _fade_filters(options, duration):
+    """afade chain matching dsp.apply_fade_in/apply_fade_out (linear) on a track of `duration` seconds"""
+    filters = []
+    if options.get('fade_in'):
+        filters.append(f"afade=t=in:st=0:d={float(options['fade_in'])}")
+    if options.get('fade_out'):
+        fade_out = float(options['fade_out'])
+        filters.append(f"afade=t=out:st={max(duration - fade_out, 0.0):.6f}:d={fade_out}")
+    return filters
+
+def _copies_source(output_format, options, input_format_info):
+    """
+    True if encoding this output would only reproduce the source stream: same codec and container,
+    same sample rate, and the same bit depth (PCM/FLAC) or bitrate of a source known to be CBR
+    (MP3/AAC, within 2%).
+    """
+    info = input_format_info or {}
+    codec, container = info.get('codec'), info.get('format_name') or ''
+    output_rate = options.get('sample_rate') or '44100'
+    if output_rate != 'original' and str(info.get('sample_rate')) != str(output_rate):
+        return False
+    if output_format == 'wav':
+        # Without a bit depth ffmpeg's WAV muxer writes 16-bit PCM
+        return container == 'wav' and codec == BIT_DEPTH_PARAMS.get(options.get('bit_depth'), ['-acodec', 'pcm_s16le'])[1]
+    if output_format == 'flac':
+        bit_depth = options.get('bit_depth')
+        return (codec == 'flac' and container == 'flac'
+                and (not bit_depth or info.get('bits_per_sample') == (16 if bit_depth == '16' else 24)))
+    if output_format == 'mp3' and codec != 'mp3':
+        return False
+    if output_format == 'aac' and (codec != 'aac' or 'mp4' not in container.split(',')):
+        return False
+    # An unknown mode (ffprobe, mutagen's UNKNOWN, any AAC probe) may be VBR near the target
+    if output_format in ('mp3', 'aac') and info.get('bitrate_mode') != 'cbr':
+        return False
+    bitrate = options.get('bitrate') or '320k'
+    if output_format not in ('mp3', 'aac') or not bitrate.endswith('k') or not bitrate[:-1].isdigit() or not info.get('bitrate'):
+        return False  # VBR targets always re-encode
+    return abs(info['bitrate'] - int(bitrate[:-1]) * 1000) <= 0.02 * info['bitrate']
+
+def _is_passthrough(outputs, options, target_lufs, input_format_info):
+    """No gain, trim or fade and every output copies the source: the audio needs no re-encode"""
+    if target_lufs is not None or options.get('trim_silence') or options.get('fade_in') or options.get('fade_out'):
+        return False
+    return all(_copies_source(output_format, target_options, input_format_info)
+               for output_format, target_options, _ in outputs)
+
+def _source_artifacts(filepath):
+    """Player artifacts of the original itself, kept next to it once a passthrough job has drawn them"""
+    return peaks_path_for(filepath), spectrogram_dir_for(filepath)
+
+def _write_source_artifacts(blocks, sample_rate, filepath, analyzer=None):
+    """
+    Draw the original's player artifacts from decoded `blocks` (feeding `analyzer` the same
+    blocks, if given) in a staging directory and rename them into place: the original is shared
+    by every upload of its content, so readers and concurrent jobs only ever see complete files.
+    Tiles another job already put in place are kept.
+    """
+    source_peaks, source_tiles = _source_artifacts(filepath)
+    staging = tempfile.mkdtemp(dir=os.path.dirname(filepath), prefix='.artifacts-')
+    try:
+        staged_peaks, staged_tiles = os.path.join(staging, 'peaks'), os.path.join(staging, 'tiles')
+        peaks = PeakBuilder()
+        tiles = SpectrogramBuilder(sample_rate, staged_tiles)
+        for block in blocks:
+            if analyzer:
+                analyzer.process(block)
+            peaks.process(block)
+            tiles.process(block)
+        peaks.write(sample_rate, staged_peaks)
+        tiles.finish()
+        try:
+            os.rename(staged_tiles, source_tiles)
+        except OSError:
+            pass  # drawn by a concurrent job from the same audio
+        os.replace(staged_peaks, source_peaks)
     finally:
-        if cover_art_path and os.path.exists(cover_art_path):
-            os.remove(cover_art_path)
+        shutil.rmtree(staging, ignore_errors=True)
+
+def _fusion_blocker(options, target_lufs, source_analysis, duration):
+    """Why a job cannot run as one ffmpeg over the file, or None if it can"""
+    if options.get('trim_silence'):
+        return "trim_silence scans the decoded audio"
+    if target_lufs is not None and source_analysis is None:
+        return "the gain needs the source loudness, which is not analyzed yet"
+    if options.get('fade_out') and not duration:
+        return "fade_out needs the duration, which the probe did not report"
+    return None
+
+def plan_render(filepath, outputs, options, input_format_info=None, source_analysis=None, strategy=None):
+    """
+    Compile a job's options into the fewest ffmpeg invocations.
+
+    'passthrough' is a job whose audio needs no re-encode (same codec, rate and bitrate or bit
+    depth, no gain, fade or trim): the original is copied as every output and only re-tagged,
+    leaving the audio bit-identical. It takes one decode for the analysis and player artifacts,
+    or no process at all once those are stored next to the original.
+    'fused' runs one ffmpeg over the original: gain (volume), fades (afade) or loudnorm, the
+    per-output resampler, dither and codec all sit in one filter graph whose asplit also taps
+    float32 PCM to stdout for the analysis and player artifacts. 'pipe' decodes to memory and
+    encodes from a stdin pipe (two processes); it is needed when the audio must be looked at
+    before the graph can be written - silence trimming, or a gain whose source loudness is not
+    analyzed yet. `strategy` forces one ('fused' raises ValueError when it is not possible).
+
+    Returns a dict: strategy, reason (why not fused), stages (human-readable), commands (argv
+    lists, with placeholders for values only known after decoding), processes (estimated
+    ffmpeg/ffprobe processes, including the optional verify decode), and for the fused
+    strategy the ffmpeg output args and whether the graph runs loudnorm.
+    """
+    target_lufs = _target_lufs(options)
+    loudnorm = bool(options.get('limit_true_peak')) and target_lufs is not None
+    source_rate, channels = get_stream_layout(filepath, input_format_info)
+    duration = source_analysis.duration_seconds if source_analysis is not None else (input_format_info or {}).get('duration')
+    blocker = _fusion_blocker(options, target_lufs, source_analysis, duration)
+    if strategy == 'fused' and blocker:
+        raise ValueError(f"Cannot fuse this render: {blocker}.")
+    if strategy == 'passthrough' and not _is_passthrough(outputs, options, target_lufs, input_format_info):
+        raise ValueError("Cannot pass this render through: the audio has to be re-encoded.")
+    if strategy is None and _is_passthrough(outputs, options, target_lufs, input_format_info):
+        strategy = 'passthrough'
+    strategy = strategy or ('pipe' if blocker else 'fused')
+    output_names = ', '.join(f"{fmt} -> {os.path.basename(path)}" for fmt, _, path in outputs)
+    stages = ["analysis: cached" if source_analysis is not None else "analysis: in process, from the decoded PCM"]
+    plan = {'strategy': strategy, 'reason': blocker, 'loudnorm': loudnorm}
+
+    if strategy == 'passthrough':
+        source_peaks, source_tiles = _source_artifacts(filepath)
+        artifacts_stored = os.path.exists(source_peaks) and os.path.isdir(source_tiles)
+        stages.append(f"copy the original as {output_names}: no re-encode")
+        plan['commands'] = []
+        if source_analysis is None or not artifacts_stored:
+            stages.append("decode to PCM for the analysis and player artifacts: ffmpeg")
+            plan['commands'].append(['ffmpeg', '-nostdin', '-i', filepath, '-map', '0:a:0', '-vn']
+                                    + pcm_output_args(source_rate, channels))
+        else:
+            stages.append("player artifacts: stored with the original")
+    elif strategy == 'fused':
+        gain_db = 0.0
+        shared = []
+        if loudnorm:
+            stats = source_analysis.loudnorm_stats()
+            # The tap comes after loudnorm: its dynamic gain changes the envelope, and the player
+            # artifacts must show the file that is served
+            graph = [f"[0:a:0]{_loudnorm_filter(target_lufs, stats)},asplit={len(outputs) + 1}[tap]"
+                     + ''.join(f"[split{index}]" for index in range(len(outputs)))]
+            stages.append(f"loudnorm to {target_lufs} LUFS (filter graph; PCM tapped after it)")
+        else:
+            if target_lufs is not None and np.isfinite(source_analysis.integrated_lufs):
+                gain_db = target_lufs - source_analysis.integrated_lufs
+                shared.append(f"volume={gain_db:.6f}dB")
+                stages.append(f"gain {gain_db:+.2f} dB (filter graph)")
+            fades = _fade_filters(options, duration)
+            if fades:
+                shared.extend(fades)
+                stages.append("fades (filter graph)")
+            graph = [f"[0:a:0]{','.join(shared or ['anull'])},asplit={len(outputs) + 1}[tap]"
+                     + ''.join(f"[split{index}]" for index in range(len(outputs)))]
+        output_args = []
+        for index, (output_format, target_options, path) in enumerate(outputs):
+            graph.append(f"[split{index}]{','.join(_output_filters(target_options) or ['anull'])}[out{index}]")
+            output_args.extend(['-map', f"[out{index}]"] + _encoder_args(output_format, target_options, source_rate) + [path])
+        output_args = (['-filter_complex', ';'.join(graph)] + output_args
+                       + ['-map', '[tap]'] + pcm_output_args(source_rate, channels))
+        stages.append(f"decode + filter + encode {output_names} + PCM tap: one ffmpeg")
+        plan.update({
+            'output_args': output_args,
+            'gain_db': gain_db,
+            'fades': bool(options.get('fade_in') or options.get('fade_out')),
+            'commands': [['ffmpeg', '-nostdin', '-y', '-i', filepath] + output_args],
+        })
+    else:
+        stages.append("decode to PCM: ffmpeg")
+        if loudnorm:
+            render_args = _render_args(outputs, source_rate, [_loudnorm_filter(target_lufs, source_analysis.loudnorm_stats()
+                                                                               if source_analysis is not None else None)])
+            stages.append(f"loudnorm to {target_lufs} LUFS (filter graph)")
+        else:
+            render_args = _render_args(outputs, source_rate)
+            if target_lufs is not None:
+                stages.append(f"gain to {target_lufs} LUFS (in process)")
+            if options.get('trim_silence'):
+                stages.append("trim silence (in process)")
+            if options.get('fade_in') or options.get('fade_out'):
+                stages.append("fades (in process)")
+        stages.append(f"encode {output_names} from the PCM pipe: one ffmpeg")
+        plan['commands'] = [
+            ['ffmpeg', '-nostdin', '-i', filepath, '-map', '0:a:0', '-vn'] + pcm_output_args(source_rate, channels),
+            ['ffmpeg', '-y'] + pcm_input_args(source_rate, channels) + render_args,
+        ]
+    if options.get('verify_output'):
+        stages.append("verify: stream-decode the primary output: ffmpeg")
+    plan['stages'] = stages
+    plan['processes'] = len(plan['commands']) + (1 if options.get('verify_output') else 0)
+    return plan
+
+def _source_duration(input_format_info, source_analysis):
+    """Seconds of audio in the original, for ffmpeg progress: measured if analyzed, else as probed"""
+    if source_analysis is not None:
+        return source_analysis.duration_seconds
+    return (input_format_info or {}).get('duration')
+
+def _stage(progress, name, duration=None):
+    """Enter a progress stage; returns the ffmpeg progress callback, or None when not reporting"""
+    return progress.stage(name, duration) if progress else None
+
+def _progress_stages(plan, options, source_analysis):
+    """The TaskProgress stages a render goes through, in order - tagging last, in the task"""
+    analyze = ['analyze'] if source_analysis is None else []
+    if plan['strategy'] == 'passthrough':
+        stages = ['copy'] + (['decode'] if plan['commands'] else [])  # analyzed and drawn while decoding
+    elif plan['strategy'] == 'fused':
+        stages = ['render']  # the tap is analyzed and drawn while ffmpeg renders
+    else:
+        stages = ['decode'] + analyze + ['encode', 'artifacts']
+    if options.get('verify_output'):
+        stages.append('verify')
+    return stages + ['tagging']
+
+def _render_fused(filepath, output_filepath, options, input_format_info, source_analysis, plan, progress=None):
+    """
+    Run a fused plan; returns (final metrics, source analysis).
+
+    The tap is consumed block by block while ffmpeg renders: the analyzer (when the tap has to be
+    measured) and the primary output's peak pyramid and spectrogram tiles are all fed from the
+    same block, so the programme is never held in memory whatever its length.
+    """
+    source_rate, channels = get_stream_layout(filepath, input_format_info)
+    # With loudnorm the metrics come from its report; without gain or fades the tap is the source
+    analyzer = None
+    if not plan['loudnorm'] and (plan['fades'] or source_analysis is None):
+        analyzer = AudioAnalyzer(source_rate, channels)
+    peaks = PeakBuilder()
+    tiles = SpectrogramBuilder(source_rate, spectrogram_dir_for(output_filepath))
+    report = []
+    for block in iter_ffmpeg_pcm(filepath, plan['output_args'], input_format_info,
+                                 loglevel='info' if plan['loudnorm'] else 'error', report=report,
+                                 progress=_stage(progress, 'render', _source_duration(input_format_info, source_analysis))):
+        if analyzer:
+            analyzer.process(block)
+        peaks.process(block)
+        tiles.process(block)
+    peaks.write(source_rate, peaks_path_for(output_filepath))
+    tiles.finish()
+    if plan['loudnorm']:
+        return _loudnorm_metrics(source_analysis, source_analysis.loudnorm_stats(), report[0]), source_analysis
+    if plan['fades']:
+        # The tap is the faded audio: it was measured directly
+        return analyzer.metrics(), source_analysis
+    if source_analysis is None:
+        # No gain and no fades: the tap is the source itself, so its analysis is the cacheable one
+        source_analysis = analyzer.result()
+        write_analysis(source_analysis, analysis_path_for(filepath), input_format_info)
+    return source_analysis.metrics(plan['gain_db']), source_analysis
+
+def _render_piped(filepath, outputs, options, input_format_info, source_analysis, progress=None):
+    """Run a pipe plan: decode to memory, process in place, encode from stdin; returns (samples, rate, final metrics)"""
+    target_lufs = _target_lufs(options)
+    limit_true_peak = options.get('limit_true_peak', False)
+    
+    # Decode once, straight from ffmpeg's stdout at the source rate/layout - no temp WAV
+    samples, source_rate = decode_audio(
+        filepath, input_format_info, progress=_stage(progress, 'decode', _source_duration(input_format_info, source_analysis)))
+    if source_analysis is None:
+        # One analyzer pass gives every metric; the float32 chain then works in place
+        _stage(progress, 'analyze')
+        source_analysis = analyze_audio(samples, source_rate).result()
+        write_analysis(source_analysis, analysis_path_for(filepath), input_format_info)
+
+    if limit_true_peak and target_lufs is not None:
+        final_metrics = _run_ffmpeg_loudnorm(samples, source_rate, outputs, target_lufs, source_analysis,
+                                             _stage(progress, 'encode', len(samples) / source_rate))
+        if not final_metrics: raise Exception("FFmpeg loudnorm processing failed.")
+    else:
+        input_lufs = source_analysis.integrated_lufs
+        gain_db = 0.0
+        if target_lufs is not None and np.isfinite(input_lufs):
+            gain_db = target_lufs - input_lufs
+            apply_gain(samples, gain_db)
+        
+        # Trim silence
+        if options.get('trim_silence'):
+            samples = trim_silence(samples, source_rate, silence_thresh=-50)
+        
+        # Fade in/out
+        fade_in = options.get('fade_in')
+        fade_out = options.get('fade_out')
+        if fade_in:
+            apply_fade_in(samples, source_rate, fade_in)
+        if fade_out:
+            apply_fade_out(samples, source_rate, fade_out)
+        
+        run_ffmpeg_with_pcm(samples, source_rate, _render_args(outputs, source_rate),
+                            progress=_stage(progress, 'encode', len(samples) / source_rate))
+
+        # Final metrics come from the pre-encode audio: a plain gain is applied to the
+        # analyzer's results, while trims/fades need one in-memory re-analysis (never a decode)
+        if options.get('trim_silence') or fade_in or fade_out:
+            final_metrics = analyze_audio(samples, source_rate).metrics()
+        else:
+            final_metrics = source_analysis.metrics(gain_db)
+    return samples, source_rate, final_metrics
+
+def _render_passthrough(filepath, outputs, input_format_info, source_analysis, progress=None):
+    """
+    Run a passthrough plan: every output is a byte copy of the original (tags are rewritten by the
+    task afterwards), and the final metrics are the source's own. Returns (None, None, metrics):
+    the player artifacts are copied from the original's, which are drawn here on first use.
+    """
+    _stage(progress, 'copy')
+    for _, _, path in outputs:
+        shutil.copyfile(filepath, path)
+    source_peaks, source_tiles = _source_artifacts(filepath)
+    if source_analysis is None or not (os.path.exists(source_peaks) and os.path.isdir(source_tiles)):
+        # One streamed decode feeds the analysis and both artifacts, a block at a time
+        source_rate, channels = get_stream_layout(filepath, input_format_info)
+        analyzer = AudioAnalyzer(source_rate, channels) if source_analysis is None else None
+        blocks = iter_audio_blocks(filepath, source_rate, channels,
+                                   progress=_stage(progress, 'decode', _source_duration(input_format_info, source_analysis)))
+        _write_source_artifacts(blocks, source_rate, filepath, analyzer)
+        if analyzer:
+            source_analysis = analyzer.result()
+            write_analysis(source_analysis, analysis_path_for(filepath), input_format_info)
+    output_filepath = outputs[0][2]
+    shutil.copyfile(source_peaks, peaks_path_for(output_filepath))
+    output_tiles = spectrogram_dir_for(output_filepath)
+    if os.path.isdir(output_tiles):
+        shutil.rmtree(output_tiles)
+    shutil.copytree(source_tiles, output_tiles)
+    return None, None, source_analysis.metrics()
+
+def _render(filepath, outputs, options, input_format_info=None, strategy=None, progress=None):
+    """
+    Decode, process and encode every output (in as few ffmpeg runs as plan_render allows) and
+    write the primary output's player artifacts, reporting each stage to `progress` (a TaskProgress).
+
+    Returns the JSON-safe summary of the render (input format and final measurements) - the
+    part of the result a render cache hit can hand back without touching the audio.
+    """
+    output_filepath = outputs[0][2]
+    # Originals are content-addressed, so a re-upload of the same bytes finds the probe and
+    # analysis of its first run next to the file and skips both
+    cached_analysis = read_analysis(analysis_path_for(filepath))
+    source_analysis = None
+    if cached_analysis:
+        source_analysis, input_format_info = cached_analysis
+    elif not input_format_info:
+        # The upload request already ran the header probe when it could; this covers the rest
+        input_format_info = _detect_audio_format(filepath)
+    current_app.logger.info(f"Input format detected: {input_format_info}")
+    
+    plan = plan_render(filepath, outputs, options, input_format_info, source_analysis, strategy)
+    current_app.logger.info(f"Render plan: {plan['strategy']}, {plan['processes']} ffmpeg process(es)")
+    if progress:
+        progress.start(_progress_stages(plan, options, source_analysis))
+    if plan['strategy'] == 'passthrough':
+        samples, source_rate, final_metrics = _render_passthrough(filepath, outputs, input_format_info, source_analysis,
+                                                                  progress)
+    elif plan['strategy'] == 'fused':
+        samples, source_rate = None, None  # artifacts were drawn from the tap during the render
+        final_metrics, source_analysis = _render_fused(filepath, output_filepath, options, input_format_info,
+                                                       source_analysis, plan, progress)
+    else:
+        samples, source_rate, final_metrics = _render_piped(filepath, outputs, options, input_format_info, source_analysis,
+                                                            progress)
+
+    # Player waveform and spectrogram come from these, not from decoding the file in the browser
+    if samples is not None:
+        _stage(progress, 'artifacts')
+        write_peaks(samples, source_rate, peaks_path_for(output_filepath))
+        write_spectrogram_tiles(samples, source_rate, spectrogram_dir_for(output_filepath))
+    
+    if options.get('verify_output'):
+        # Optional ground truth: stream-decode what was actually encoded, one block at a time
+        final_metrics = analyze_file(output_filepath, progress=_stage(progress, 'verify', final_metrics['duration_seconds'])).metrics()
+    
+    # Series and the goniometer go to compact side files; result_json only gets the summary
+    history = final_metrics['history']
+    stereo = history['stereo']
+    write_history(history, history_path_for(output_filepath))
+    if stereo:
+        write_stereo(history, stereo_path_for(output_filepath))
+
+    return {
+        "loudness_lufs": round(float(final_metrics['integrated_lufs']), 2),
+        "true_peak_db": round(float(final_metrics['true_peak_db']), 2),
+        "duration_seconds": round(final_metrics['duration_seconds'], 2),
+        "loudness_range": _rounded_or_none(final_metrics['loudness_range']),
+        "max_momentary_lufs": _rounded_or_none(history['max_momentary']),
+        "max_short_term_lufs": _rounded_or_none(history['max_short_term']),
+        "sample_peak_db": _rounded_or_none(final_metrics['sample_peak_db']),
+        "rms_db": _rounded_or_none(final_metrics['rms_db']),
+        "crest_factor_db": _rounded_or_none(final_metrics['crest_factor_db']),
+        "dc_offset": [round(value, 6) for value in final_metrics['dc_offset']],
+        "clipped_samples": final_metrics['clipped_samples'],
+        "stereo_correlation": _rounded_or_none(final_metrics['correlation']),
+        "has_stereo": bool(stereo),
+        "input_format": input_format_info,
+    }
+
+def benchmark_render(filepath, options, runs=3):
+    """
+    Time one job with each render strategy (pipe, fused, passthrough), rendering a copy of `filepath` into a temporary
+    directory. The copy is analyzed by a first (untimed) pipe render, so both strategies see
+    the same warm analysis cache - the state every re-render of a stored original is in.
+
+    Returns {strategy: {'seconds': [per run], 'processes': n}} or {strategy: {'error': reason}}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        original = os.path.join(workdir, f"original{os.path.splitext(filepath)[1]}")
+        shutil.copyfile(filepath, original)
+        input_format_info = _detect_audio_format(original)
+        _render(original, render_outputs(options, 'warmup.wav', workdir), options, input_format_info, strategy='pipe')
+        for strategy in ('pipe', 'fused', 'passthrough'):
+            outputs = render_outputs(options, f"{strategy}.wav", workdir)
+            try:
+                plan = plan_render(original, outputs, options, input_format_info,
+                                   read_analysis(analysis_path_for(original))[0], strategy)
+            except ValueError as e:
+                results[strategy] = {'error': str(e)}
+                continue
+            seconds = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                _render(original, outputs, options, input_format_info, strategy=strategy)
+                seconds.append(time.perf_counter() - started)
+            results[strategy] = {'seconds': seconds, 'processes': plan['processes']}
+    return results
+
+def _tag_options(options, user_id):
+    """Options with a batch cover (cover_art_id) resolved to its stored JPEG; the asset is shared, never removed."""
+    cover_art_id = options.get('cover_art_id')
+    if not is_cover_art_id(cover_art_id):
+        return options
+    return dict(options, cover_art_path=cover_art_path_for(current_app.config['UPLOAD_FOLDER'], user_id, cover_art_id))
+
+def _render_cache():
+    return RenderCache(render_cache_root(current_app.config['UPLOAD_FOLDER']),
+                       current_app.config.get('RENDER_CACHE_MAX_BYTES', 0))
+
+def _render_files(outputs):
+    """Everything a render leaves on disk, by render cache name: every output plus the artifacts"""
+    output_filepath = outputs[0][2]
+    files = {f"output-{index}": path for index, (_, _, path) in enumerate(outputs)}
+    files.update({
+        'peaks': peaks_path_for(output_filepath),
+        'spectrogram': spectrogram_dir_for(output_filepath),
+        'loudness': history_path_for(output_filepath),
+        'stereo': stereo_path_for(output_filepath),
+    })
+    return files
+
+def _finish(task_entry, status, result_json, audio_file_update=None):
+    """Record a terminal status (see task_state.finish_task) and make sure a batched flush is coming"""
+    task_entry.status, task_entry.result_json = status, result_json
+    if finish_task(task_entry, status, result_json, audio_file_update):
+        interval = current_app.config['TASK_STATE_FLUSH_SECONDS']
+        if claim_flush(interval):
+            persist_task_states.apply_async(countdown=interval)
+    return task_entry
+
+@celery.task(bind=True, max_retries=None)
+def persist_task_states(self):
+    """
+    Write-behind of finished tasks: every state queued since the last run, in batched commits.
+    A database error puts the batch back and retries with backoff; states queued while this
+    run was draining get a follow-up run, so nothing depends on another task finishing.
+    """
+    with current_app.app_context():
+        interval = current_app.config['TASK_STATE_FLUSH_SECONDS']
+        try:
+            written = flush_task_states()
+        except SQLAlchemyError as e:
+            raise self.retry(exc=e, countdown=min(interval * 2 ** self.request.retries, FLUSH_RETRY_MAX_SECONDS))
+        if release_flush() and claim_flush(interval):
+            persist_task_states.apply_async(countdown=interval)
+        return written
 
 @celery.task(bind=True, throws=(Exception,))
-def process_audio_file(self, processing_task_id, filepath, original_filename, user_id, options):
+def process_audio_file(self, processing_task_id, filepath, original_filename, user_id, options, input_format_info=None):
     with current_app.app_context():
         task_entry = db.session.get(ProcessingTask, processing_task_id)
         if not task_entry:
             raise ValueError(f"Processing task with ID {processing_task_id} not found in database.")
 
-        task_entry.status = 'PROCESSING'; task_entry.celery_task_id = self.request.id
-        db.session.commit()
+        # In-flight state lives in Redis; the row is written once, in a batch, when the task ends
+        start_task(task_entry, self.request.id)
+        publish_task_event(task_entry)
+        # Live percent/stage/ETA goes to Redis only; the database sees the final status
+        progress = TaskProgress(processing_task_id, user_id)
 
         try:
-            # Detect input format
-            input_format_info = _detect_audio_format(filepath)
-            current_app.logger.info(f"Input format detected: {input_format_info}")
-            
-            # Convert to WAV if not already WAV
-            if not original_filename.lower().endswith('.wav'):
-                current_app.logger.info(f"Converting {original_filename} to WAV...")
-                temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-                temp_wav_path = temp_wav.name
-                temp_wav.close()
-                
-                if not _convert_to_wav(filepath, temp_wav_path):
-                    raise ValueError(f"Failed to convert {original_filename} to WAV format")
-                
-                # Replace filepath with converted WAV
-                os.remove(filepath)
-                filepath = temp_wav_path
-                current_app.logger.info(f"Conversion successful: {temp_wav_path}")
+            # Every target is rendered from the same decoded and processed buffer; the first is the
+            # primary output that the player, analysis artifacts and AudioFile columns describe
+            outputs = render_outputs(options, original_filename, current_app.config['UPLOAD_FOLDER'])
+            output_format, _, output_filepath = outputs[0]
+            output_filename = os.path.basename(output_filepath)
             
-            output_format = options.get('format', 'mp3').lower()
-            # Handle AAC -> m4a extension
-            file_extension = 'm4a' if output_format == 'aac' else output_format
-            output_filename = f"{os.path.splitext(original_filename)[0]}.{file_extension}"
-            output_filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], output_filename)
-            
-            target_lufs = None
-            lufs_preset = options.get('lufs_preset')
-            if lufs_preset in PRESET_LUFS:
-                target_lufs = PRESET_LUFS[lufs_preset]
-            elif lufs_preset == 'custom' and options.get('normalize'):
-                target_lufs = float(options.get('target_lufs', -23.0))
-
-            limit_true_peak = options.get('limit_true_peak', False)
-            
-            if limit_true_peak and target_lufs is not None:
-                bit_depth_params = BIT_DEPTH_PARAMS.get(options.get('bit_depth')) if output_format not in ['mp3', 'aac'] else None
-                bitrate_param = _get_bitrate_param(output_format, options.get('bitrate', '320k')) if output_format in ['mp3', 'aac'] else None
-                success = _run_ffmpeg_loudnorm(filepath, output_filepath, target_lufs, bit_depth_params, bitrate_param, options)
-                if not success: raise Exception("FFmpeg loudnorm processing failed.")
-            else:
-                audio = AudioSegment.from_wav(filepath)
-                if target_lufs is not None:
-                    initial_lufs = pyln.Meter(audio.frame_rate).integrated_loudness(audio.get_array_of_samples())
-                    loudness_difference = target_lufs - initial_lufs
-                    audio = audio.apply_gain(loudness_difference)
-                
-                # Sample rate
-                sample_rate = options.get('sample_rate', '44100')
-                if sample_rate == 'original':
-                    sample_rate = str(audio.frame_rate)
-                
-                export_params = {'format': output_format, 'parameters': ['-ar', sample_rate]}
-                if options.get('resampler') == 'soxr':
-                    export_params['parameters'].extend(['-swr_engine', 'soxr'])
-                if options.get('dither_method') and options['dither_method'] != 'none' and options.get('bit_depth') == '16':
-                    export_params['parameters'].extend(['-dither_method', options['dither_method']])
-                
-                # Trim silence
-                if options.get('trim_silence'):
-                    audio = audio.strip_silence(silence_thresh=-50, padding=100)
-                
-                # Fade in/out
-                fade_in = options.get('fade_in')
-                fade_out = options.get('fade_out')
-                if fade_in:
-                    audio = audio.fade_in(int(float(fade_in) * 1000))
-                if fade_out:
-                    audio = audio.fade_out(int(float(fade_out) * 1000))
-                
-                if output_format in ['mp3', 'aac']:
-                    bitrate = options.get('bitrate', '320k')
-                    if bitrate not in ['v0', 'v2']:
-                        export_params['bitrate'] = bitrate
-                    # For VBR, pydub doesn't support -q:a, use ffmpeg directly
-                else:
-                    bit_depth = options.get('bit_depth')
-                    if bit_depth in BIT_DEPTH_PARAMS:
-                        export_params['parameters'].extend(BIT_DEPTH_PARAMS[bit_depth])
-                audio.export(output_filepath, **export_params)
-
-            _apply_metadata(output_filepath, options)
-            
-            # Read final audio for LUFS analysis
-            # soundfile doesn't support M4A/AAC, so convert to WAV first if needed
-            if output_format in ['aac', 'm4a', 'mp3', 'ogg', 'opus', 'wma']:
-                # Decode to WAV for analysis
-                temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-                temp_wav_path = temp_wav.name
-                temp_wav.close()
-                
-                decode_cmd = ['ffmpeg', '-y', '-i', output_filepath, '-acodec', 'pcm_s16le', temp_wav_path]
-                result = subprocess.run(decode_cmd, capture_output=True, text=True, check=False)
-                if result.returncode != 0:
-                    raise RuntimeError(f"Failed to decode {output_format} for LUFS analysis")
-                
-                final_data, final_rate = sf.read(temp_wav_path)
-                os.remove(temp_wav_path)
-            else:
-                final_data, final_rate = sf.read(output_filepath)
-            
-            final_meter = pyln.Meter(final_rate)
-            final_lufs = final_meter.integrated_loudness(final_data)
-            final_peak_linear = np.max(np.abs(final_data))
-            final_peak_dbfs = 20 * np.log10(final_peak_linear) if final_peak_linear > 0 else -np.inf
-            duration_seconds = len(final_data) / final_rate
-
+            # Same original + same render options = same audio: a cached render is copied back and
+            # only re-tagged, since metadata is applied after the cache
             audio_file_entry = db.session.get(AudioFile, task_entry.audio_file_id)
-            if audio_file_entry:
-                audio_file_entry.processed_filename = output_filename
-                audio_file_entry.processed_file_path = output_filepath
-                audio_file_entry.loudness_lufs = round(float(final_lufs), 2)
-                audio_file_entry.duration_seconds = round(duration_seconds, 2)
-                audio_file_entry.true_peak_db = round(float(final_peak_dbfs), 2)
+            content_hash = audio_file_entry.content_hash if audio_file_entry else None
+            render_cache = _render_cache()
+            render_key = render_cache_key(content_hash, options) if content_hash and render_cache.enabled else None
+            render_files = _render_files(outputs)
+            if render_key:
+                progress.start(['copy', 'tagging'])  # a hit is a copy and a re-tag; _render re-plans on a miss
+                progress.stage('copy')
+            render = render_cache.restore(render_key, render_files) if render_key else None
+            render_cache_hit = render is not None
+            if not render_cache_hit:
+                render = _render(filepath, outputs, options, input_format_info,
+                                 strategy=None if current_app.config.get('RENDER_FUSE_GRAPH', True) else 'pipe',
+                                 progress=progress)
+                if render_key:
+                    render_cache.store(render_key, render_files, render)
+
+            progress.stage('tagging')
+            tag_options = _tag_options(options, user_id)
+            for _, _, path in outputs:
+                _apply_metadata(path, tag_options)
+            cover_art_path = options.get('cover_art_path')
+            if cover_art_path and os.path.exists(cover_art_path):
+                os.remove(cover_art_path)
+
+            audio_file_update = {
+                'processed_filename': output_filename,
+                'processed_file_path': output_filepath,
+                'loudness_lufs': render['loudness_lufs'],
+                'duration_seconds': render['duration_seconds'],
+                'true_peak_db': render['true_peak_db'],
+                'outputs': [{'format': fmt, 'filename': os.path.basename(path), 'file_path': path,
+                             'file_size_bytes': _file_size(path)} for fmt, _, path in outputs],
+            }
 
             # Generate quality warning
+            input_format_info = render['input_format']
             quality_warning = _get_quality_warning(input_format_info, output_format)
+            output_results = [{
+                "format": fmt,
+                "processed_filename": os.path.basename(path),
+                "processed_file_url": f"/uploads/{os.path.basename(path)}",
+                "file_size_bytes": _file_size(path),
+                "quality_warning": _get_quality_warning(input_format_info, fmt),
+            } for fmt, _, path in outputs]
             
-            task_entry.status = 'COMPLETED'
             result_data = {
-                "loudness_lufs": round(float(final_lufs), 2),
-                "true_peak_db": round(float(final_peak_dbfs), 2),
+                "loudness_lufs": render['loudness_lufs'],
+                "true_peak_db": render['true_peak_db'],
                 "processed_filename": output_filename,
-                "duration_seconds": round(duration_seconds, 2),
+                "duration_seconds": render['duration_seconds'],
                 "processed_file_url": f"/uploads/{output_filename}",
+                "peaks_url": f"/audio/file/{task_entry.audio_file_id}/peaks",
+                "spectrogram_url": f"/audio/file/{task_entry.audio_file_id}/spectrogram",
+                "loudness_range": render['loudness_range'],
+                "max_momentary_lufs": render['max_momentary_lufs'],
+                "max_short_term_lufs": render['max_short_term_lufs'],
+                "loudness_history_url": f"/audio/file/{task_entry.audio_file_id}/loudness-history",
+                "sample_peak_db": render['sample_peak_db'],
+                "rms_db": render['rms_db'],
+                "crest_factor_db": render['crest_factor_db'],
+                "dc_offset": render['dc_offset'],
+                "clipped_samples": render['clipped_samples'],
+                "stereo_correlation": render['stereo_correlation'],
+                "stereo_url": f"/audio/file/{task_entry.audio_file_id}/stereo" if render['has_stereo'] else None,
                 "input_format": input_format_info,
-                "quality_warning": quality_warning
+                "quality_warning": quality_warning,
+                "outputs": output_results,
+                "render_cache_hit": render_cache_hit,
             }
-            task_entry.result_json = json.dumps(result_data)
-            task_entry.completed_at = datetime.now(UTC)
-            db.session.commit()
+            task_entry = _finish(task_entry, 'COMPLETED', json.dumps(result_data),
+                                 audio_file_update if audio_file_entry else None)
+            progress.clear()
+            publish_task_event(task_entry)
 
-            if os.path.exists(filepath): os.remove(filepath)
+            # The content-addressed original stays for re-uploads; delete_files removes it with its last AudioFile
             return {"message": "File processed successfully"}
         except Exception as e:
             current_app.logger.error(f"Task failed with exception: {e}")
@@ -391,12 +932,9 @@ def process_audio_file(self, processing_task_id, filepath, original_filename, us
                 current_app.logger.error(f"FFMPEG STDERR:\n{e.stderr}")
 
             db.session.rollback()
-            task_entry_on_error = db.session.get(ProcessingTask, processing_task_id)
-            task_entry_on_error.status = 'FAILED'
-            task_entry_on_error.result_json = json.dumps({"error": str(e)})
-            task_entry_on_error.completed_at = datetime.now(UTC)
-            db.session.commit()
-            if os.path.exists(filepath): os.remove(filepath)
+            task_entry_on_error = _finish(task_entry, 'FAILED', json.dumps({"error": str(e)}))
+            progress.clear()
+            publish_task_event(task_entry_on_error)
             cover_art_path_on_error = options.get('cover_art_path')
             if cover_art_path_on_error and os.path.exists(cover_art_path_on_error):
                 os.remove(cover_art_path_on_error)
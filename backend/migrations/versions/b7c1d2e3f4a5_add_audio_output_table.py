@@ -0,0 +1,39 @@
+"""Add audio_output table for multi-target renders
+
+Revision ID: b7c1d2e3f4a5
+Revises: 0e74c6cc3b6c
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c1d2e3f4a5'
+down_revision = '0e74c6cc3b6c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Każdy format docelowy jednego zadania to osobny wiersz powiązany z tym samym AudioFile
+    op.create_table('audio_output',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('audio_file_id', sa.Integer(), nullable=False),
+        sa.Column('format', sa.String(length=16), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('file_path', sa.String(length=512), nullable=False),
+        sa.Column('file_size_bytes', sa.BigInteger(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['audio_file_id'], ['audio_file.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('audio_output', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_audio_output_audio_file_id'), ['audio_file_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('audio_output', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_audio_output_audio_file_id'))
+    op.drop_table('audio_output')
@@ -0,0 +1,29 @@
+"""Add content_hash to AudioFile
+
+Revision ID: c4d5e6f7a8b9
+Revises: b7c1d2e3f4a5
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d5e6f7a8b9'
+down_revision = 'b7c1d2e3f4a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SHA-256 oryginału; starsze rekordy zostają z NULL (nie biorą udziału w deduplikacji)
+    with op.batch_alter_table('audio_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_audio_file_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('audio_file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_audio_file_content_hash'))
+        batch_op.drop_column('content_hash')
@@ -9,4 +9,10 @@ echo "Seeding admin user..."
 flask seed-admin
 
 echo "Starting Gunicorn..."
-exec gunicorn --bind 0.0.0.0:5000 --workers 4 run:app
+# Wątki (gthread): otwarty strumień SSE /audio/task-events zajmuje wątek, a nie cały worker.
+# Budżet wątków: 4 workery x 16 wątków = 64. Strumienie SSE mogą zająć najwyżej
+# TASK_EVENTS_MAX_STREAMS (domyślnie 8) wątków na worker, czyli 32 w sumie; pozostałe 32
+# obsługują upload, polling i strony. Użytkownik ma najwyżej TASK_EVENTS_MAX_STREAMS_PER_USER
+# (domyślnie 4) otwartych strumieni. Kolejne karty dostają 503 i przechodzą na polling.
+# Zmieniając --workers/--threads, dostosuj te limity.
+exec gunicorn --bind 0.0.0.0:5000 --workers 4 --threads 16 run:app
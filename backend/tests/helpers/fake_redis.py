@@ -0,0 +1,85 @@
+"""
+In-memory stand-in for the few Redis commands the task state layer uses.
+Values are stored as strings, like a client created with decode_responses=True.
+"""
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+        self.published = []
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({field: str(value) for field, value in mapping.items()})
+        return len(mapping)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def expire(self, key, seconds):
+        if key not in self.data:
+            return False
+        self.ttl[key] = seconds
+        return True
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(str(value) for value in values)
+        return len(self.data[key])
+
+    def lpop(self, key, count=None):
+        values = self.data.get(key, [])
+        popped, self.data[key] = values[:count or 1], values[count or 1:]
+        if count is None:
+            return popped[0] if popped else None
+        return popped or None
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def decr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) - 1)
+        return int(self.data[key])
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        if ex is not None:
+            self.ttl[key] = ex
+        return True
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.calls.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        return [command(*args, **kwargs) for command, args, kwargs in calls]
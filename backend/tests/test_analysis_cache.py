@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from app.services.analysis_cache import analysis_path_for, decode_analysis, encode_analysis, read_analysis, write_analysis
+from app.services.audio_analyzer import analyze_audio
+
+def _programme(channels=2):
+    rng = np.random.default_rng(4)
+    return (rng.standard_normal((48000 * 4, channels)) * 0.3).astype(np.float32)
+
+@pytest.mark.parametrize("channels", [1, 2])
+def test_cached_analysis_gives_the_same_metrics(channels):
+    result = analyze_audio(_programme(channels), 48000).result()
+    cached, format_info = decode_analysis(encode_analysis(result, {'codec': 'pcm_s24le', 'sample_rate': 48000}))
+    assert format_info == {'codec': 'pcm_s24le', 'sample_rate': 48000}
+    assert cached.loudnorm_stats() == result.loudnorm_stats()
+    for gain_db in (0.0, 9.0):
+        expected, actual = result.metrics(gain_db), cached.metrics(gain_db)
+        history, cached_history = expected.pop('history'), actual.pop('history')
+        assert actual == expected
+        assert np.array_equal(cached_history['momentary'], history['momentary'])
+        if channels == 2:
+            assert np.array_equal(cached_history['stereo']['goniometer'], history['stereo']['goniometer'])
+        else:
+            assert cached_history['stereo'] is None
+
+def test_missing_or_corrupt_cache_reads_as_none(tmp_path):
+    path = analysis_path_for(str(tmp_path / 'original.wav'))
+    assert read_analysis(path) is None
+    with open(path, 'wb') as f:
+        f.write(b'not an archive')
+    assert read_analysis(path) is None
+    write_analysis(analyze_audio(_programme(), 48000).result(), path)
+    result, format_info = read_analysis(path)
+    assert format_info is None and result.duration_seconds == pytest.approx(4.0)
@@ -1,8 +1,10 @@
 import os
 import io
+import json
+import hashlib
 import pytest
 from flask import url_for
-from app.models import AudioFile, ProcessingTask, User
+from app.models import AudioFile, AudioOutput, ProcessingTask, User
 
 def test_upload_page_requires_login(client):
     response = client.get(url_for('audio_processing.upload_and_process_audio'), follow_redirects=True)
@@ -31,6 +33,9 @@ def test_upload_structure_failures(active_subscriber_client, data, expected_erro
 @pytest.mark.parametrize("file_tuple, options, expected_error_contains", [
     ((io.BytesIO(b'txt data'), 'test.txt'), '{}', 'Unsupported file format'),
     ((io.BytesIO(b'wav data'), 'test.wav'), 'invalid-json', 'Invalid options format'),
+    ((io.BytesIO(b'wav data'), 'test.wav'), '{"targets": []}', 'Targets must be a non-empty list'),
+    ((io.BytesIO(b'wav data'), 'test.wav'), '{"targets": [{"format": "mp3"}, {"format": "ogg"}]}', 'Unsupported output format: ogg'),
+    ((io.BytesIO(b'wav data'), 'test.wav'), '{"targets": [{"format": "mp3"}, {"format": "wav"}, {"format": "flac"}, {"format": "aac"}, {"format": "mp3"}]}', 'Too many output targets'),
 ])
 def test_upload_content_failures(active_subscriber_client, file_tuple, options, expected_error_contains):
     response = active_subscriber_client.post(
@@ -88,6 +93,243 @@ def test_upload_and_process_with_cover_art(active_subscriber_client, dummy_wav_f
     assert passed_options['cover_art_path'].startswith(app.config['UPLOAD_FOLDER'])
     assert passed_options['cover_art_path'].endswith('_cover.jpg')
     assert os.path.exists(passed_options['cover_art_path'])
+    # the header probe ran in the request and is handed to the task
+    assert kwargs['input_format_info']['codec'] == 'pcm_s16le'
+    assert response.get_json()['input_format']['sample_rate'] == 44100
+
+def test_cover_art_is_uploaded_once_and_referenced_by_id(active_subscriber_client, mocker, app):
+    """Okładka partii trafia na serwer raz; kolejne pliki podają tylko jej ID."""
+    from PIL import Image
+    mock_delay = mocker.patch('app.blueprints.audio.routes.process_audio_file.delay')
+    mock_delay.side_effect = [mocker.Mock(id='celery-1'), mocker.Mock(id='celery-2')]
+    image = io.BytesIO()
+    Image.new('RGB', (2000, 2000), (0, 0, 255)).save(image, 'PNG')
+
+    response = active_subscriber_client.post(
+        url_for('audio_processing.upload_cover_art'),
+        data={'cover_art': (io.BytesIO(image.getvalue()), 'cover.png')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    cover = response.get_json()
+    assert (cover['width'], cover['height']) == (1400, 1400)
+
+    for name in ('01.wav', '02.wav'):
+        response = active_subscriber_client.post(
+            url_for('audio_processing.upload_and_process_audio'),
+            data={'file': (io.BytesIO(name.encode()), name),
+                  'options': f'{{"cover_art_id": "{cover["cover_art_id"]}", "cover_art_path": "/etc/passwd"}}'},
+            content_type='multipart/form-data'
+        )
+        assert response.status_code == 202
+        passed_options = mock_delay.call_args.args[4]
+        assert passed_options['cover_art_id'] == cover['cover_art_id']
+        # ścieżki okładki z opcji klienta nie są przekazywane dalej
+        assert 'cover_art_path' not in passed_options
+    covers_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'covers')
+    assert sum(len(files) for _, _, files in os.walk(covers_dir)) == 1
+
+def test_chunked_upload_resumes_and_queues_like_a_single_upload(active_subscriber_client, dummy_wav_file, mocker, app):
+    """Upload w kawałkach: init, wznowienie od Upload-Offset, complete - wynik jak z /upload-and-process."""
+    mock_delay = mocker.patch('app.blueprints.audio.routes.process_audio_file.delay')
+    mock_delay.return_value.id = 'celery-chunked'
+    data = dummy_wav_file[0].read()
+    response = active_subscriber_client.post(url_for('audio_processing.create_chunked_upload'), json={
+        'filename': 'long mix.wav', 'length': len(data), 'options': {'format': 'flac'}})
+    assert response.status_code == 201
+    upload = response.get_json()
+    upload_url = response.headers['Location']
+    assert upload_url == upload['upload_url'] and upload['offset'] == 0 and upload['chunk_bytes'] > 0
+
+    def patch(offset, body):
+        return active_subscriber_client.patch(upload_url, data=body, headers={
+            'Upload-Offset': str(offset), 'Content-Type': 'application/offset+octet-stream'})
+
+    response = patch(0, data[:70000])
+    assert response.status_code == 200
+    assert response.get_json()['container'] == 'wav'
+    # klient po zerwaniu połączenia pyta, ile bajtów dotarło, i wysyła tylko resztę
+    assert patch(0, data).status_code == 409
+    response = active_subscriber_client.head(upload_url)
+    assert response.headers['Upload-Offset'] == '70000'
+    assert active_subscriber_client.post(f"{upload_url}/complete").status_code == 409
+    assert patch(70000, data[70000:]).status_code == 200
+
+    response = active_subscriber_client.post(f"{upload_url}/complete")
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body['input_format']['codec'] == 'pcm_s16le' and not body['deduplicated']
+    audio_file = AudioFile.query.one()
+    assert audio_file.original_filename == 'long_mix.wav'
+    assert audio_file.content_hash == hashlib.sha256(data).hexdigest()
+    assert audio_file.file_size_bytes == len(data)
+    args, kwargs = mock_delay.call_args
+    assert args[1] == audio_file.original_file_path and args[4] == {'format': 'flac'}
+    assert active_subscriber_client.get(upload_url).status_code == 404
+
+@pytest.mark.parametrize("payload, status, expected_error", [
+    ({'filename': 'notes.txt', 'length': 10}, 400, 'Unsupported file format'),
+    ({'filename': 'a.wav', 'length': 0}, 400, 'Upload length must be a positive number of bytes'),
+    ({'filename': 'a.wav', 'length': 10 ** 12}, 413, 'File is larger than'),
+    ({'filename': 'a.wav', 'length': 10, 'options': {'targets': []}}, 400, 'Targets must be a non-empty list'),
+])
+def test_chunked_upload_is_refused_before_any_bytes(active_subscriber_client, payload, status, expected_error):
+    response = active_subscriber_client.post(url_for('audio_processing.create_chunked_upload'), json=payload)
+    assert response.status_code == status
+    assert expected_error in response.get_json()['error']
+
+def test_chunked_upload_rejects_non_audio_on_first_chunk(active_subscriber_client, mocker):
+    mock_delay = mocker.patch('app.blueprints.audio.routes.process_audio_file.delay')
+    response = active_subscriber_client.post(url_for('audio_processing.create_chunked_upload'), json={
+        'filename': 'video.wav', 'length': 500 * 1024 * 1024})
+    upload_url = response.headers['Location']
+    response = active_subscriber_client.patch(upload_url, data=b'\x00\x00\x00\x18ftypisom' + bytes(100000),
+                                              headers={'Upload-Offset': '0'})
+    # plik MP4 udający WAV nie jest odrzucany - ffmpeg go zdekoduje; śmieci już tak
+    assert response.status_code == 200
+    assert active_subscriber_client.delete(upload_url).status_code == 204
+
+    response = active_subscriber_client.post(url_for('audio_processing.create_chunked_upload'), json={
+        'filename': 'fake.wav', 'length': 500 * 1024 * 1024})
+    upload_url = response.headers['Location']
+    response = active_subscriber_client.patch(upload_url, data=b'<html>' + bytes(100000), headers={'Upload-Offset': '0'})
+    assert response.status_code == 415
+    assert response.get_json()['error'] == 'Unrecognized audio format'
+    assert active_subscriber_client.get(upload_url).status_code == 404
+    assert active_subscriber_client.patch(upload_url, data=b'x', headers={'Upload-Offset': 'abc'}).status_code == 400
+    mock_delay.assert_not_called()
+
+@pytest.mark.parametrize("data, expected_error", [
+    ({}, 'No cover art in the request'),
+    ({'cover_art': (io.BytesIO(b'not an image'), 'cover.jpg')}, 'Unsupported or corrupt image'),
+])
+def test_cover_art_upload_failures(active_subscriber_client, data, expected_error):
+    response = active_subscriber_client.post(
+        url_for('audio_processing.upload_cover_art'), data=data, content_type='multipart/form-data'
+    )
+    assert response.status_code == 400
+    assert expected_error in response.get_json()['error']
+
+@pytest.mark.parametrize("cover_art_id", ['0' * 64, '../covers/1/x', 42])
+def test_upload_rejects_unknown_cover_art_id(active_subscriber_client, mocker, cover_art_id):
+    mock_delay = mocker.patch('app.blueprints.audio.routes.process_audio_file.delay')
+    response = active_subscriber_client.post(
+        url_for('audio_processing.upload_and_process_audio'),
+        data={'file': (io.BytesIO(b'wav data'), 'test.wav'),
+              'options': json.dumps({'cover_art_id': cover_art_id})},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Unknown cover art'
+    mock_delay.assert_not_called()
+
+def test_task_events_stream_sends_snapshot_of_own_tasks(logged_in_client, db, test_user, mocker):
+    """Strumień SSE: najpierw stan zadań z ?ids= (tylko własnych), potem zdarzenia z Redis."""
+    other = User(email='other@example.com')
+    other.set_password('password123')
+    db.session.add(other)
+    db.session.commit()
+    files = [AudioFile(user_id=user.id, original_filename='a.wav', original_file_path='a.wav') for user in (test_user, other)]
+    db.session.add_all(files)
+    db.session.commit()
+    own = ProcessingTask(user_id=test_user.id, audio_file_id=files[0].id, status='COMPLETED', result_json='{}')
+    foreign = ProcessingTask(user_id=other.id, audio_file_id=files[1].id, status='COMPLETED', result_json='{}')
+    db.session.add_all([own, foreign])
+    db.session.commit()
+    stream = mocker.patch('app.blueprints.audio.routes.stream_task_events',
+                          side_effect=lambda user_id, snapshot, max_seconds: (f"data: {event}\n\n" for event in snapshot()))
+
+    response = logged_in_client.get(url_for('audio_processing.task_events', ids=f"{own.id},{foreign.id}"))
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    body = response.get_data(as_text=True)
+    assert f"'task_id': {own.id}" in body and f"'task_id': {foreign.id}" not in body
+    assert stream.call_args.args[0] == test_user.id
+
+def test_bulk_task_status_returns_own_tasks_in_one_query(logged_in_client, db, test_user, app, mocker):
+    """Wiele zadań w jednym żądaniu: status, postęp i skrót wyniku; cudze i nieistniejące w 'missing'."""
+    from sqlalchemy import event
+    other = User(email='other@example.com')
+    other.set_password('password123')
+    db.session.add(other)
+    db.session.commit()
+    files = [AudioFile(user_id=user.id, original_filename='a.wav', original_file_path='a.wav') for user in (test_user, other)]
+    db.session.add_all(files)
+    db.session.commit()
+    done = ProcessingTask(user_id=test_user.id, audio_file_id=files[0].id, status='COMPLETED',
+                          result_json=json.dumps({'loudness_lufs': -14.0, 'processed_file_url': '/uploads/a.mp3',
+                                                  'outputs': [{'format': 'mp3'}]}))
+    queued = ProcessingTask(user_id=test_user.id, audio_file_id=files[0].id, status='QUEUED')
+    running = ProcessingTask(user_id=test_user.id, audio_file_id=files[0].id, status='PROCESSING')
+    foreign = ProcessingTask(user_id=other.id, audio_file_id=files[1].id, status='COMPLETED')
+    db.session.add_all([done, queued, running, foreign])
+    db.session.commit()
+    done_id, queued_id, running_id, foreign_id = done.id, queued.id, running.id, foreign.id
+    live = mocker.patch('app.blueprints.audio.routes.read_task_progress', side_effect=lambda ids: {
+        running_id: {'percent': 42.5, 'stage': 'encode', 'eta_seconds': 12.0}} if list(ids) else {})
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    response = logged_in_client.get(url_for('audio_processing.get_task_statuses',
+                                            ids=f"{done_id},{queued_id},{running_id},{foreign_id},{done_id},9999"))
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['tasks'] == {
+        str(done_id): {'status': 'COMPLETED', 'progress': 100, 'stage': None, 'eta_seconds': None,
+                       'summary': {'loudness_lufs': -14.0, 'processed_file_url': '/uploads/a.mp3'}},
+        str(queued_id): {'status': 'QUEUED', 'progress': 0, 'stage': None, 'eta_seconds': None, 'summary': None},
+        # postęp na żywo z Redis nadpisuje wartość wynikającą ze statusu
+        str(running_id): {'status': 'PROCESSING', 'progress': 42.5, 'stage': 'encode', 'eta_seconds': 12.0,
+                          'summary': None},
+    }
+    assert data['missing'] == [foreign_id, 9999]
+    live.assert_called_once()
+    assert len([sql for sql in statements if 'FROM processing_task' in sql]) == 1
+
+def test_task_status_reads_hot_state_from_redis_first(logged_in_client, db, test_user, mocker):
+    """Stan z hashy Redis wygrywa z (jeszcze nie zapisanym) wierszem; baza tylko dla zadań spoza Redis."""
+    from sqlalchemy import event
+    audio_file = AudioFile(user_id=test_user.id, original_filename='a.wav', original_file_path='a.wav')
+    db.session.add(audio_file)
+    db.session.commit()
+    hot = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id, status='QUEUED')
+    cold = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id, status='FAILED', result_json='{"error": "x"}')
+    db.session.add_all([hot, cold])
+    db.session.commit()
+    hot_id, cold_id = hot.id, cold.id
+    result = json.dumps({'loudness_lufs': -14.0})
+    mocker.patch('app.blueprints.audio.routes.read_task_states', side_effect=lambda ids: {
+        hot_id: {'status': 'COMPLETED', 'user_id': test_user.id, 'result_json': result}} if hot_id in list(ids) else {})
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    response = logged_in_client.get(url_for('audio_processing.get_task_status', task_id=hot_id))
+    assert response.get_json() == {'status': 'COMPLETED', 'result': result, 'progress': None}
+    assert not [sql for sql in statements if 'FROM processing_task' in sql]
+
+    response = logged_in_client.get(url_for('audio_processing.get_task_statuses', ids=f"{hot_id},{cold_id}"))
+    tasks = response.get_json()['tasks']
+    assert tasks[str(hot_id)]['summary'] == {'loudness_lufs': -14.0}
+    assert tasks[str(cold_id)]['status'] == 'FAILED'
+    # zapytanie do bazy tylko o zadanie, którego nie ma w Redis
+    assert len([sql for sql in statements if 'FROM processing_task' in sql]) == 1
+
+@pytest.mark.parametrize("ids, expected_error", [
+    ('', 'No task ids given'),
+    ('1,x', 'Invalid task ids'),
+    (','.join(str(i) for i in range(501)), 'Too many task ids'),
+])
+def test_bulk_task_status_rejects_bad_ids(logged_in_client, ids, expected_error):
+    response = logged_in_client.get(url_for('audio_processing.get_task_statuses', ids=ids))
+    assert response.status_code == 400
+    assert expected_error in response.get_json()['error']
+
+def test_task_events_rejects_bad_ids(logged_in_client):
+    response = logged_in_client.get(url_for('audio_processing.task_events', ids='1,abc'))
+    assert response.status_code == 400
 
 def test_history_shows_download_link(logged_in_client, processed_audio_file):
     response = logged_in_client.get(url_for('audio_processing.get_processing_history'))
@@ -144,3 +386,105 @@ def test_history_with_missing_file_on_disk(logged_in_client, db, test_user):
     response = logged_in_client.get(url_for('audio_processing.get_processing_history'))
     assert response.status_code == 200
     assert b'nonexistent.mp3' not in response.data
+
+def test_file_peaks_served_to_owner_only(logged_in_client, db, test_user, app):
+    processed_path = os.path.join(app.config['UPLOAD_FOLDER'], 'processed.mp3')
+    with open(processed_path, 'w') as f: f.write('proc')
+    with open(processed_path + '.peaks', 'wb') as f: f.write(b'WBPK-data')
+    other_user = User(email='other@example.com')
+    db.session.add(other_user)
+    db.session.commit()
+    own = AudioFile(user_id=test_user.id, original_filename='a.wav', original_file_path='/tmp/a.wav', processed_filename='processed.mp3', processed_file_path=processed_path)
+    foreign = AudioFile(user_id=other_user.id, original_filename='b.wav', original_file_path='/tmp/b.wav', processed_filename='processed.mp3', processed_file_path=processed_path)
+    db.session.add_all([own, foreign])
+    db.session.commit()
+    response = logged_in_client.get(url_for('audio_processing.file_peaks', file_id=own.id))
+    assert response.status_code == 200
+    assert response.data == b'WBPK-data'
+    assert response.mimetype == 'application/octet-stream'
+    assert response.headers.get('ETag')
+    assert logged_in_client.get(url_for('audio_processing.file_peaks', file_id=foreign.id)).status_code == 404
+    os.remove(processed_path + '.peaks')
+    assert logged_in_client.get(url_for('audio_processing.file_peaks', file_id=own.id)).status_code == 404
+
+def test_spectrogram_index_and_tiles_are_cacheable(logged_in_client, db, test_user, app):
+    import numpy as np
+    from app.services.spectrogram import spectrogram_dir_for, write_spectrogram_tiles
+    processed_path = os.path.join(app.config['UPLOAD_FOLDER'], 'processed.wav')
+    write_spectrogram_tiles(np.zeros((44100, 2), dtype=np.float32), 44100, spectrogram_dir_for(processed_path))
+    audio_file = AudioFile(user_id=test_user.id, original_filename='a.wav', original_file_path='/tmp/a.wav', processed_filename='processed.wav', processed_file_path=processed_path)
+    db.session.add(audio_file)
+    db.session.commit()
+    index = logged_in_client.get(url_for('audio_processing.file_spectrogram', file_id=audio_file.id)).get_json()
+    tile_url = index['tile_url'].format(zoom=0, tile=0)
+    assert tile_url.startswith(f'/audio/file/{audio_file.id}/spectrogram/0/0?v=')
+    response = logged_in_client.get(tile_url)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control'] and 'max-age=31536000' in response.headers['Cache-Control']
+    assert len(response.data) == index['zooms'][0]['columns'] * index['bins']
+    assert logged_in_client.get(f'/audio/file/{audio_file.id}/spectrogram/0/99').status_code == 404
+    logged_in_client.post(url_for('audio_processing.delete_files'), json={'ids': [audio_file.id]})
+    assert not os.path.exists(spectrogram_dir_for(processed_path))
+
+def test_file_details_links_loudness_history(logged_in_client, db, test_user, app):
+    import numpy as np
+    from app.services.loudness_history import history_path_for, write_history
+    processed_path = os.path.join(app.config['UPLOAD_FOLDER'], 'processed.flac')
+    with open(processed_path, 'w') as f: f.write('proc')
+    write_history({'seconds_per_point': 0.5, 'momentary': np.zeros(4), 'short_term': np.zeros(4)}, history_path_for(processed_path))
+    audio_file = AudioFile(user_id=test_user.id, original_filename='a.wav', original_file_path='/tmp/a.wav', processed_filename='processed.flac', processed_file_path=processed_path, loudness_lufs=-14.0, file_size_bytes=4)
+    db.session.add(audio_file)
+    db.session.commit()
+    history_url = url_for('audio_processing.file_loudness_history', file_id=audio_file.id)
+    page = logged_in_client.get(url_for('audio_processing.file_details', file_id=audio_file.id))
+    assert f'data-url="{history_url}"'.encode() in page.data
+    response = logged_in_client.get(history_url)
+    assert response.status_code == 200
+    assert response.data[:4] == b'WBLH' and len(response.data) == 16 + 4 * 2 * 2
+    assert logged_in_client.get(url_for('audio_processing.file_stereo', file_id=audio_file.id)).status_code == 404
+
+def test_all_outputs_are_downloaded_and_deleted_together(logged_in_client, db, test_user, app):
+    import zipfile
+    upload_folder = app.config['UPLOAD_FOLDER']
+    paths = {name: os.path.join(upload_folder, name) for name in ('song.mp3', 'song.flac')}
+    for path in paths.values():
+        with open(path, 'w') as f: f.write('proc')
+    audio_file = AudioFile(user_id=test_user.id, original_filename='song.wav', original_file_path='/tmp/song.wav',
+                           processed_filename='song.mp3', processed_file_path=paths['song.mp3'], file_size_bytes=4)
+    audio_file.outputs = [AudioOutput(format='mp3', filename='song.mp3', file_path=paths['song.mp3']),
+                          AudioOutput(format='flac', filename='song.flac', file_path=paths['song.flac'])]
+    db.session.add(audio_file)
+    db.session.commit()
+    file_id = audio_file.id
+
+    page = logged_in_client.get(url_for('audio_processing.file_details', file_id=file_id))
+    assert b'href="/uploads/song.flac"' in page.data
+    response = logged_in_client.post(url_for('audio_processing.download_multiple'), json={'ids': [file_id]})
+    assert sorted(zipfile.ZipFile(io.BytesIO(response.data)).namelist()) == ['song.flac', 'song.mp3']
+
+    response = logged_in_client.post(url_for('audio_processing.delete_files'), json={'ids': [file_id]})
+    assert response.status_code == 200
+    assert not any(os.path.exists(path) for path in paths.values())
+    assert AudioOutput.query.count() == 0
+
+def test_identical_reupload_shares_the_stored_original(active_subscriber_client, db, mocker, app):
+    mock_delay = mocker.patch('app.blueprints.audio.routes.process_audio_file.delay')
+    mock_delay.side_effect = [mocker.Mock(id='celery-1'), mocker.Mock(id='celery-2')]
+    responses = [
+        active_subscriber_client.post(
+            url_for('audio_processing.upload_and_process_audio'),
+            data={'file': (io.BytesIO(b'same master bytes'), name), 'options': '{}'},
+            content_type='multipart/form-data'
+        ) for name in ('master.wav', 'master (copy).wav')
+    ]
+    assert [response.get_json()['deduplicated'] for response in responses] == [False, True]
+    first, second = AudioFile.query.order_by(AudioFile.id).all()
+    assert first.content_hash == second.content_hash and len(first.content_hash) == 64
+    assert first.original_file_path == second.original_file_path
+    assert mock_delay.call_args_list[0].args[1] == mock_delay.call_args_list[1].args[1] == first.original_file_path
+
+    # the original survives until the last upload that uses it is deleted
+    active_subscriber_client.post(url_for('audio_processing.delete_files'), json={'ids': [first.id]})
+    assert os.path.exists(second.original_file_path)
+    active_subscriber_client.post(url_for('audio_processing.delete_files'), json={'ids': [second.id]})
+    assert not os.path.exists(second.original_file_path)
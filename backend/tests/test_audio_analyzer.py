@@ -0,0 +1,197 @@
+import numpy as np
+import pytest
+import soundfile as sf
+from app.services.audio_analyzer import (
+    CLIP_LEVEL, AudioAnalyzer, LevelMeter, TruePeakMeter, analyze_audio, k_weighting_sos, measure_file_loudness,
+    measure_loudness, measure_true_peak, shift_history,
+)
+
+def _sine(rate, seconds, amplitude, freq=997.0, channels=2):
+    t = np.arange(int(rate * seconds)) / rate
+    tone = amplitude * np.sin(2 * np.pi * freq * t)
+    return np.repeat(tone[:, None], channels, axis=1).astype(np.float32)
+
+@pytest.mark.parametrize("rate", [44100, 48000, 96000])
+def test_full_scale_sine_reads_minus_three_lufs_per_channel(rate):
+    # BS.1770 calibration: a 0 dBFS 997 Hz sine in one channel reads -3.01 LUFS
+    stats = measure_loudness(_sine(rate, 5, 1.0, channels=1), rate)
+    assert stats['input_i'] == pytest.approx(-3.01, abs=0.05)
+
+def test_stereo_sine_matches_reference_level():
+    stats = measure_loudness(_sine(48000, 5, 10 ** (-20 / 20)), 48000)
+    assert stats['input_i'] == pytest.approx(-20.0, abs=0.05)
+    assert stats['input_thresh'] == pytest.approx(stats['input_i'] - 10, abs=0.05)
+    assert stats['input_tp'] == pytest.approx(-20.0, abs=0.05)
+
+def test_relative_gate_ignores_quiet_passage():
+    rate = 48000
+    loud = _sine(rate, 10, 10 ** (-20 / 20))
+    quiet = _sine(rate, 10, 10 ** (-50 / 20))
+    stats = measure_loudness(np.concatenate([loud, quiet]), rate)
+    # Only the few blocks straddling the level change survive the gate alongside the loud part
+    assert stats['input_i'] == pytest.approx(-20.0, abs=0.1)
+
+def test_loudness_range_of_two_level_programme():
+    rate = 48000
+    programme = np.concatenate([_sine(rate, 20, 10 ** (-20 / 20)), _sine(rate, 20, 10 ** (-30 / 20))])
+    assert measure_loudness(programme, rate)['input_lra'] == pytest.approx(10.0, abs=0.2)
+
+def test_silence_is_minus_infinity():
+    stats = measure_loudness(np.zeros((48000, 2), dtype=np.float32), 48000)
+    assert stats['input_i'] == -np.inf
+    assert stats['input_tp'] == -np.inf
+    assert stats['input_lra'] == 0.0
+
+def test_true_peak_catches_inter_sample_overs():
+    # fs/4 sine at 45 degrees: every sample sits at +/-0.707 but the waveform reaches 1.0
+    rate = 48000
+    n = np.arange(rate)
+    tone = np.sin(2 * np.pi * (rate / 4) * n / rate + np.pi / 4).astype(np.float32)[:, None]
+    assert 20 * np.log10(np.abs(tone).max()) == pytest.approx(-3.01, abs=0.01)
+    assert measure_true_peak(tone) == pytest.approx(0.0, abs=0.2)
+
+def test_true_peak_is_independent_of_block_size():
+    rng = np.random.default_rng(7)
+    noise = (rng.standard_normal((50000, 2)) * 0.2).astype(np.float32)
+    whole = measure_true_peak(noise, block_frames=len(noise))
+    assert measure_true_peak(noise, block_frames=997) == pytest.approx(whole, abs=1e-6)
+
+def test_true_peak_includes_filter_tail_of_last_block():
+    # The overshoot between the last two samples only appears once the filter is flushed
+    signal = np.zeros((40, 1), dtype=np.float32)
+    signal[-2:] = 0.7
+    meter = TruePeakMeter(channels=1)
+    meter.process(signal)
+    padded = TruePeakMeter(channels=1)
+    padded.process(np.concatenate([signal, np.zeros((20, 1), dtype=np.float32)]))
+    assert meter.true_peak > 0.7
+    assert meter.true_peak == pytest.approx(padded.true_peak)
+    assert TruePeakMeter(channels=2).true_peak_db == -np.inf
+
+def test_streaming_meter_is_independent_of_block_size():
+    rate = 48000
+    rng = np.random.default_rng(3)
+    envelope = np.repeat(10 ** (rng.uniform(-30, 0, 30) / 20), rate)[:, None]
+    programme = (rng.standard_normal((rate * 30, 2)) * 0.1 * envelope).astype(np.float32)
+    whole = measure_loudness(programme, rate, block_frames=len(programme))
+    for block_frames in (1234, 4800, 65536):
+        streamed = measure_loudness(programme, rate, block_frames=block_frames)
+        assert streamed['input_i'] == pytest.approx(whole['input_i'], abs=1e-6)
+        assert streamed['input_lra'] == pytest.approx(whole['input_lra'], abs=1e-6)
+        assert streamed['input_thresh'] == pytest.approx(whole['input_thresh'], abs=1e-6)
+
+def test_meter_memory_does_not_grow_with_duration():
+    meter = AudioAnalyzer(48000, 2)
+    block = _sine(48000, 1, 0.1)
+    for _ in range(120):
+        meter.process(block)
+    assert meter.duration_seconds == 120
+    assert len(meter._recent_hops) < 30 and len(meter._partial) < 4800
+
+def test_measure_file_loudness_streams_from_decoder(tmp_path):
+    path = str(tmp_path / 'tone.flac')
+    sf.write(path, _sine(48000, 5, 10 ** (-20 / 20)), 48000, subtype='PCM_24')
+    stats = measure_file_loudness(path)
+    assert stats['input_i'] == pytest.approx(-20.0, abs=0.05)
+    assert stats['duration_seconds'] == pytest.approx(5.0)
+
+def test_history_series_follow_the_programme():
+    rate = 48000
+    programme = np.concatenate([_sine(rate, 10, 10 ** (-20 / 20)), _sine(rate, 10, 10 ** (-30 / 20))])
+    history = analyze_audio(programme, rate).history()
+    assert history['seconds_per_point'] == pytest.approx(0.5)
+    assert len(history['momentary']) == len(history['short_term']) == 40
+    # the first 3 s window ends in bucket 5; earlier short-term points read -inf rather than
+    # shifting the series in time
+    assert np.isfinite(history['momentary']).all()
+    assert np.isinf(history['short_term'][:5]).all() and np.isfinite(history['short_term'][5:]).all()
+    assert history['momentary'][10] == pytest.approx(-20.0, abs=0.05)
+    assert history['short_term'][-1] == pytest.approx(-30.0, abs=0.05)
+    assert history['max_momentary'] == pytest.approx(-20.0, abs=0.05)
+    assert history['max_short_term'] == pytest.approx(-20.0, abs=0.05)
+
+def test_history_is_independent_of_block_size():
+    rng = np.random.default_rng(11)
+    programme = (rng.standard_normal((48000 * 12, 2)) * 0.1).astype(np.float32)
+    whole = analyze_audio(programme, 48000, block_frames=len(programme)).history()
+    streamed = analyze_audio(programme, 48000, block_frames=3001).history()
+    assert np.allclose(whole['momentary'], streamed['momentary'], atol=1e-4)
+    assert np.allclose(whole['short_term'], streamed['short_term'], atol=1e-4)
+
+def test_shift_history_moves_every_value():
+    history = analyze_audio(_sine(48000, 4, 0.1), 48000).history()
+    shifted = shift_history(history, 3.0)
+    assert shifted['max_momentary'] == pytest.approx(history['max_momentary'] + 3.0)
+    assert np.array_equal(np.isinf(shifted['short_term']), np.isinf(history['short_term']))
+
+def test_stereo_correlation_and_goniometer():
+    rate = 48000
+    tone = _sine(rate, 4, 0.5)
+    anti = tone * np.array([1.0, -1.0], dtype=np.float32)
+    silence = np.zeros((rate, 2), dtype=np.float32)
+    stereo = analyze_audio(np.concatenate([tone, anti, silence]), rate).history()['stereo']
+    correlation = stereo['correlation']
+    assert len(correlation) == 18
+    assert np.allclose(correlation[:8], 1.0) and np.allclose(correlation[8:16], -1.0)
+    assert np.isnan(correlation[16:]).all()
+    assert stereo['correlation_overall'] == pytest.approx(0.0, abs=1e-6)
+    goniometer = stereo['goniometer']
+    bins = goniometer.shape[0]
+    # in-phase energy sits on the vertical (mid) axis, out-of-phase on the horizontal (side) axis
+    assert goniometer.sum() == rate * 9
+    assert goniometer[:, bins // 2].sum() + goniometer[bins // 2, :].sum() >= rate * 9
+
+def test_stereo_summary_is_independent_of_block_size():
+    rng = np.random.default_rng(2)
+    programme = (rng.standard_normal((48000 * 5 + 123, 2)) * 0.1).astype(np.float32)
+    programme[:, 1] += programme[:, 0]
+    whole = analyze_audio(programme, 48000, block_frames=len(programme)).history()['stereo']
+    streamed = analyze_audio(programme, 48000, block_frames=4097).history()['stereo']
+    assert np.allclose(whole['correlation'], streamed['correlation'])
+    assert np.array_equal(whole['goniometer'], streamed['goniometer'])
+
+def test_mono_has_no_stereo_image():
+    history = analyze_audio(_sine(48000, 1, 0.5, channels=1), 48000).history()
+    assert history['stereo'] is None
+    assert shift_history(history, 1.0)['stereo'] is None
+
+def test_k_weighting_filter_is_cached_per_rate():
+    assert k_weighting_sos(48000) is k_weighting_sos(48000)
+    assert k_weighting_sos(44100) is not k_weighting_sos(48000)
+
+def test_level_meter_peak_rms_crest_and_dc():
+    rate = 48000
+    tone = _sine(rate, 2, 0.5)
+    tone[:, 1] += 0.01
+    meter = LevelMeter(channels=2)
+    for start in range(0, len(tone), 7001):
+        meter.process(tone[start:start + 7001])
+    assert meter.sample_peak_db == pytest.approx(20 * np.log10(0.51), abs=0.01)
+    assert meter.rms_db == pytest.approx(20 * np.log10(0.5 / np.sqrt(2)), abs=0.01)
+    assert meter.crest_factor_db == pytest.approx(meter.sample_peak_db - meter.rms_db)
+    assert meter.dc_offset == pytest.approx([0.0, 0.01], abs=1e-5)
+    assert meter.clipped_samples() == 0
+
+def test_clipped_samples_follow_gain_without_re_measuring():
+    samples = np.array([[0.25], [0.5], [-0.5], [1.0], [-1.0]], dtype=np.float32)
+    meter = LevelMeter(channels=1)
+    meter.process(samples)
+    assert meter.clipped_samples() == 2
+    assert meter.clipped_samples(gain_db=6.03) == 4
+    assert meter.clipped_samples(gain_db=-1.0) == 0
+    assert LevelMeter(channels=1).clipped_samples() == 0
+    assert CLIP_LEVEL < 1.0
+
+def test_metrics_after_gain_match_measuring_the_gained_audio():
+    rng = np.random.default_rng(5)
+    programme = (rng.standard_normal((48000 * 6, 2)) * 0.2).astype(np.float32)
+    programme[:, 1] = 0.6 * programme[:, 1] + 0.4 * programme[:, 0]
+    predicted = analyze_audio(programme, 48000).metrics(gain_db=6.0)
+    measured = analyze_audio(programme * np.float32(10 ** (6.0 / 20)), 48000).metrics()
+    for key in ('integrated_lufs', 'loudness_range', 'true_peak_db', 'sample_peak_db', 'rms_db',
+                'crest_factor_db', 'correlation', 'duration_seconds'):
+        assert predicted[key] == pytest.approx(measured[key], abs=1e-3)
+    assert predicted['dc_offset'] == pytest.approx(measured['dc_offset'], abs=1e-6)
+    assert predicted['clipped_samples'] == pytest.approx(measured['clipped_samples'], rel=0.01)
+    assert predicted['clipped_samples'] > 0
+    assert np.allclose(predicted['history']['momentary'], measured['history']['momentary'], atol=1e-3)
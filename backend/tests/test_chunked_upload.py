@@ -0,0 +1,108 @@
+import io
+import os
+import hashlib
+import pytest
+import numpy as np
+import soundfile as sf
+from app.services import chunked_upload
+from app.services.chunked_upload import (UPLOAD_SESSION_TTL_SECONDS, UploadError, abort_upload, append_chunk,
+                                         complete_upload, create_upload, purge_stale_uploads, read_upload)
+from app.services.probe import HEADER_CHECK_BYTES
+from app.services.storage import original_path_for
+
+def _wav_bytes(seconds=2.0):
+    buffer = io.BytesIO()
+    sf.write(buffer, np.zeros((int(44100 * seconds), 2), dtype=np.int16), 44100, format='WAV', subtype='PCM_16')
+    return buffer.getvalue()
+
+class _DroppedConnection(io.BytesIO):
+    """A request body that breaks after `limit` bytes, like a client losing its connection."""
+
+    def __init__(self, data, limit):
+        super().__init__(data)
+        self.limit = limit
+
+    def read(self, size=-1):
+        if self.tell() >= self.limit:
+            raise ConnectionResetError("client went away")
+        return super().read(min(size, self.limit - self.tell()))
+
+def test_chunks_are_hashed_as_they_arrive_and_filed_by_content(tmp_path):
+    data = _wav_bytes()
+    upload_id = create_upload(str(tmp_path), 7, 'mix.wav', '.WAV', len(data), {'format': 'mp3'})
+    meta = append_chunk(str(tmp_path), 7, upload_id, 0, io.BytesIO(data[:HEADER_CHECK_BYTES]), chunk_bytes=4096)
+    # the header was checked on the first chunk
+    assert (meta['offset'], meta['container']) == (HEADER_CHECK_BYTES, 'wav')
+    with pytest.raises(UploadError) as conflict:
+        append_chunk(str(tmp_path), 7, upload_id, 0, io.BytesIO(data))
+    assert conflict.value.status == 409
+    append_chunk(str(tmp_path), 7, upload_id, HEADER_CHECK_BYTES, io.BytesIO(data[HEADER_CHECK_BYTES:]))
+
+    path, content_hash, size, created, meta = complete_upload(str(tmp_path), 7, upload_id)
+    assert content_hash == hashlib.sha256(data).hexdigest()
+    assert (size, created, meta['filename'], meta['options']) == (len(data), True, 'mix.wav', {'format': 'mp3'})
+    assert path == original_path_for(str(tmp_path), 7, content_hash, '.wav')
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    # nothing of the upload session is left next to the original
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+    assert read_upload(str(tmp_path), 7, upload_id) is None
+    assert upload_id not in chunked_upload._digests
+
+def test_dropped_chunk_resumes_from_the_stored_offset(tmp_path):
+    data = _wav_bytes()
+    upload_id = create_upload(str(tmp_path), 1, 'mix.wav', '.wav', len(data), {})
+    with pytest.raises(ConnectionResetError):
+        append_chunk(str(tmp_path), 1, upload_id, 0, _DroppedConnection(data, 100_000), chunk_bytes=4096)
+    offset = read_upload(str(tmp_path), 1, upload_id)['offset']
+    assert offset == 100_000
+    # the rest lands on another web worker, which has no running hash for this upload
+    chunked_upload._digests.clear()
+    append_chunk(str(tmp_path), 1, upload_id, offset, io.BytesIO(data[offset:]))
+    _, content_hash, _, _, _ = complete_upload(str(tmp_path), 1, upload_id)
+    assert content_hash == hashlib.sha256(data).hexdigest()
+
+@pytest.mark.parametrize("first_chunk", [
+    b'not audio at all' * 5000,
+    b'RIFF\x00\x00\x00\x00WAVEjunk' + bytes(HEADER_CHECK_BYTES),
+])
+def test_bad_header_is_rejected_before_the_rest_arrives(tmp_path, first_chunk):
+    upload_id = create_upload(str(tmp_path), 1, 'mix.wav', '.wav', 50 * 1024 * 1024, {})
+    with pytest.raises(UploadError) as rejected:
+        append_chunk(str(tmp_path), 1, upload_id, 0, io.BytesIO(first_chunk))
+    assert rejected.value.status == 415
+    assert read_upload(str(tmp_path), 1, upload_id) is None
+    assert os.listdir(os.path.join(str(tmp_path), 'originals', '1')) == []
+
+def test_file_shorter_than_the_header_check_is_checked_once_complete(tmp_path):
+    data = b'ID3' + bytes(200)
+    upload_id = create_upload(str(tmp_path), 1, 'tiny.mp3', '.mp3', len(data), {})
+    with pytest.raises(UploadError) as overflow:
+        append_chunk(str(tmp_path), 1, upload_id, 0, io.BytesIO(data + b'extra'))
+    assert overflow.value.status == 413
+    assert append_chunk(str(tmp_path), 1, upload_id, 0, io.BytesIO(data[:100]))['container'] is None
+    with pytest.raises(UploadError) as rejected:
+        append_chunk(str(tmp_path), 1, upload_id, 100, io.BytesIO(data[100:]))
+    assert rejected.value.status == 415
+
+def test_uploads_are_per_user_and_abandoned_ones_are_purged(tmp_path):
+    upload_id = create_upload(str(tmp_path), 1, 'a.wav', '.wav', 10, {})
+    assert read_upload(str(tmp_path), 2, upload_id) is None
+    assert read_upload(str(tmp_path), 1, '../../etc') is None
+    assert not abort_upload(str(tmp_path), 2, upload_id)
+    with pytest.raises(UploadError) as incomplete:
+        complete_upload(str(tmp_path), 1, upload_id)
+    assert incomplete.value.status == 409
+    assert purge_stale_uploads(str(tmp_path), 1) == 0
+    assert purge_stale_uploads(str(tmp_path), 1, max_age=60, now=os.path.getmtime(tmp_path) + 3600) == 1
+    assert read_upload(str(tmp_path), 1, upload_id) is None
+
+def test_running_hashes_are_evicted_when_idle_or_over_the_cap(mocker):
+    mocker.patch.object(chunked_upload, '_digests', type(chunked_upload._digests)())
+    chunked_upload._remember_digest('idle', 10, hashlib.sha256(), now=0)
+    for index in range(chunked_upload.DIGEST_CACHE_SIZE):
+        chunked_upload._remember_digest(f'busy{index}', 10, hashlib.sha256(), now=UPLOAD_SESSION_TTL_SECONDS + 1)
+    assert 'idle' not in chunked_upload._digests
+    chunked_upload._remember_digest('newest', 10, hashlib.sha256(), now=UPLOAD_SESSION_TTL_SECONDS + 2)
+    assert len(chunked_upload._digests) == chunked_upload.DIGEST_CACHE_SIZE
+    assert 'busy0' not in chunked_upload._digests and 'newest' in chunked_upload._digests
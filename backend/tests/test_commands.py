@@ -22,3 +22,23 @@ def test_seed_users_command(app, db):
 
     assert 'Created: 10 users' in result.output
     assert User.query.count() == initial_count + 10
+
+def test_render_cache_command(app):
+    """Testuje wyświetlanie statystyk cache renderów."""
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['render-cache'])
+
+    assert 'Entries: 0' in result.output
+    assert 'Hit rate: n/a' in result.output
+
+def test_render_plan_command_dry_run(app, tmp_path):
+    """Testuje podgląd planu renderowania bez uruchamiania ffmpeg."""
+    import numpy as np
+    import soundfile as sf
+    path = str(tmp_path / 'tone.wav')
+    sf.write(path, np.zeros((44100, 2)), 44100)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['render-plan', path, '--options', '{"format": "mp3"}'])
+
+    assert 'Strategy: fused' in result.output
+    assert 'Estimated processes: 1' in result.output
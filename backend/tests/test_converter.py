@@ -0,0 +1,71 @@
+import subprocess
+import pytest
+import numpy as np
+import soundfile as sf
+from app.services.converter import decode_audio, get_stream_layout, iter_ffmpeg_pcm, pcm_output_args
+
+def _write_tone(path, rate=48000, channels=1, seconds=0.5, subtype='PCM_24'):
+    t = np.arange(int(rate * seconds)) / rate
+    tone = 0.5 * np.sin(2 * np.pi * 440 * t)
+    data = np.repeat(tone[:, None], channels, axis=1)
+    sf.write(path, data, rate, subtype=subtype)
+    return data
+
+def test_get_stream_layout_prefers_probe_info(tmp_path):
+    assert get_stream_layout(str(tmp_path / 'missing.wav'), {'sample_rate': 96000, 'channels': 6}) == (96000, 6)
+
+def test_get_stream_layout_falls_back_to_soundfile(tmp_path):
+    path = str(tmp_path / 'tone.wav')
+    _write_tone(path, rate=48000, channels=1)
+    assert get_stream_layout(path, None) == (48000, 1)
+
+def test_decode_audio_keeps_source_rate_and_layout(tmp_path):
+    path = str(tmp_path / 'tone.wav')
+    expected = _write_tone(path, rate=48000, channels=1)
+    samples, rate = decode_audio(path, {'sample_rate': 48000, 'channels': 1, 'duration': 0.1})
+    assert rate == 48000
+    assert samples.dtype == np.float32
+    assert samples.shape == expected.shape
+    assert np.allclose(samples, expected, atol=1e-4)
+
+def test_decode_audio_raises_on_corrupt_input(tmp_path):
+    path = tmp_path / 'broken.wav'
+    path.write_bytes(b'not audio')
+    with pytest.raises(subprocess.CalledProcessError):
+        decode_audio(str(path))
+
+def test_progress_is_reported_from_a_pipe_of_its_own(tmp_path, mocker):
+    path = str(tmp_path / 'tone.wav')
+    _write_tone(path, rate=48000, channels=2, seconds=3.0)
+    popen = mocker.spy(subprocess, 'Popen')
+    seen = []
+    samples, rate = decode_audio(path, progress=seen.append)
+    cmd = popen.call_args.args[0]
+    assert '-nostats' in cmd and cmd[cmd.index('-progress') + 1].startswith('pipe:')
+    # the PCM on stdout is untouched by the progress reports
+    assert samples.shape == (3 * 48000, 2)
+    assert seen and seen[-1] == pytest.approx(3.0, abs=0.05)
+
+def test_progress_reports_are_parsed_per_block():
+    import os
+    from app.services.converter import _read_progress
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"out_time_us=N/A\nprogress=continue\nout_time_us=1500000\nspeed=40x\nprogress=continue\n"
+                       b"out_time_us=3000000\nprogress=end\n")
+    os.close(write_fd)
+    seen = []
+    _read_progress(read_fd, seen.append)
+    assert seen == [1.5, 3.0]
+
+def test_fused_tap_is_read_one_block_at_a_time(tmp_path):
+    path = str(tmp_path / 'tone.wav')
+    expected = _write_tone(path, rate=48000, channels=2, seconds=1.0)
+    output = str(tmp_path / 'out.flac')
+    report = []
+    blocks = list(iter_ffmpeg_pcm(path, ['-map', '0:a:0', output, '-map', '0:a:0'] + pcm_output_args(48000, 2),
+                                  loglevel='info', block_frames=10000, report=report))
+    # each block is a separate buffer of at most block_frames, and together they are the whole tap
+    assert [len(block) for block in blocks] == [10000] * 4 + [8000]
+    assert np.allclose(np.concatenate(blocks), expected, atol=1e-4)
+    assert len(sf.read(output)[0]) == 48000
+    assert report and 'Output #0' in report[0]
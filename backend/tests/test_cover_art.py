@@ -0,0 +1,68 @@
+import io
+import os
+import zlib
+import struct
+import pytest
+from PIL import Image
+from app.services.cover_art import COVER_MAX_PIXELS, COVER_MAX_SIDE, cover_art_path_for, is_cover_art_id, store_cover_art
+
+def _image_bytes(size, mode='RGB', image_format='PNG', exif=None):
+    buffer = io.BytesIO()
+    image = Image.new(mode, size, (200, 10, 10, 0) if mode == 'RGBA' else (200, 10, 10))
+    image.save(buffer, image_format, **({'exif': exif} if exif else {}))
+    return buffer.getvalue()
+
+def test_cover_is_normalized_to_a_bounded_jpeg(tmp_path):
+    cover_id, dimensions, created = store_cover_art(io.BytesIO(_image_bytes((3000, 1500), 'RGBA')), str(tmp_path), 7)
+    assert created and is_cover_art_id(cover_id)
+    assert dimensions == (COVER_MAX_SIDE, COVER_MAX_SIDE // 2)
+    with Image.open(cover_art_path_for(str(tmp_path), 7, cover_id)) as stored:
+        assert (stored.format, stored.mode, stored.size) == ('JPEG', 'RGB', dimensions)
+        # transparent pixels are flattened onto white, not black
+        assert min(stored.getpixel((10, 10))) > 240
+
+def test_exif_orientation_is_applied(tmp_path):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise when displayed
+    data = _image_bytes((400, 200), image_format='JPEG', exif=exif.tobytes())
+    _, dimensions, _ = store_cover_art(io.BytesIO(data), str(tmp_path), 7)
+    assert dimensions == (200, 400)
+
+def test_same_image_is_stored_once_per_user(tmp_path):
+    data = _image_bytes((64, 64))
+    first = store_cover_art(io.BytesIO(data), str(tmp_path), 7)
+    again = store_cover_art(io.BytesIO(data), str(tmp_path), 7)
+    assert first[0] == again[0] and (first[2], again[2]) == (True, False)
+    assert again[1] == (64, 64)
+    assert store_cover_art(io.BytesIO(data), str(tmp_path), 8)[2]
+
+@pytest.mark.parametrize("data, max_bytes, message", [
+    (b'not an image', 1 << 20, 'Unsupported or corrupt image'),
+    (b'', 1 << 20, 'empty'),
+    (b'x' * 2048, 1024, 'larger than'),
+])
+def test_invalid_covers_are_rejected_without_leftovers(tmp_path, data, max_bytes, message):
+    with pytest.raises(ValueError, match=message):
+        store_cover_art(io.BytesIO(data), str(tmp_path), 7, max_bytes=max_bytes)
+    assert os.listdir(tmp_path / 'covers' / '7') == []
+
+def _png_header(width, height):
+    """A PNG that only claims its size: enough for Image.open(), never decodable."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', b'') + chunk(b'IEND', b'')
+
+def test_oversized_cover_is_refused_from_its_header(tmp_path):
+    width = 8000
+    height = COVER_MAX_PIXELS // width + 1  # just over the limit, far below Pillow's own bomb check
+    with pytest.raises(ValueError, match="megapixels"):
+        store_cover_art(io.BytesIO(_png_header(width, height)), str(tmp_path), 1)
+    # the limit is ours; Pillow's process-wide setting is left alone
+    assert Image.MAX_IMAGE_PIXELS != COVER_MAX_PIXELS
+    assert os.listdir(os.path.join(str(tmp_path), 'covers', '1')) == []
+
+def test_cover_ids_are_plain_digests():
+    assert is_cover_art_id('0123456789abcdef' * 4)
+    assert not is_cover_art_id('../' + '0' * 61)
+    assert not is_cover_art_id(None)
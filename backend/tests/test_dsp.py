@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from app.services.dsp import apply_fade_in, apply_fade_out, apply_gain, trim_silence
+
+RATE = 1000
+
+def _tone(seconds, amplitude=0.5, channels=2):
+    return np.full((int(RATE * seconds), channels), amplitude, dtype=np.float32)
+
+def _silence(seconds, channels=2):
+    return np.zeros((int(RATE * seconds), channels), dtype=np.float32)
+
+def test_apply_gain_scales_in_place():
+    samples = _tone(1)
+    out = apply_gain(samples, -6.0206)
+    assert out is samples
+    assert samples.dtype == np.float32
+    assert samples[0, 0] == pytest.approx(0.25, rel=1e-4)
+
+def test_fades_ramp_the_edges():
+    samples = _tone(1, amplitude=1.0)
+    apply_fade_in(samples, RATE, 0.1)
+    apply_fade_out(samples, RATE, 0.1)
+    assert samples[0, 0] == 0.0
+    assert samples[50, 1] == pytest.approx(0.5)
+    assert samples[500, 0] == 1.0
+    assert samples[-1, 0] == pytest.approx(0.01)
+    assert np.all(np.diff(samples[:100, 0]) > 0)
+
+def test_fade_longer_than_audio_is_clamped():
+    samples = _tone(0.05, amplitude=1.0)
+    apply_fade_in(samples, RATE, 2.0)
+    assert samples[0, 0] == 0.0 and samples[-1, 0] < 1.0
+
+def test_trim_silence_cuts_edges_and_keeps_interior_pauses():
+    audio = np.concatenate([_silence(2), _tone(1), _silence(3), _tone(1), _silence(2.5)])
+    out = trim_silence(audio, RATE)
+    # 100 ms of padding stays at each edge; the 3 s break in the middle is untouched
+    assert len(out) == RATE // 10 + RATE * 5 + RATE // 10
+    assert np.shares_memory(out, audio)
+    assert out[0, 0] == 0.0 and out[RATE // 10, 0] == 0.5 and out[-RATE // 10 - 1, 0] == 0.5
+
+def test_trim_silence_scan_cost_follows_the_silent_edges(mocker):
+    import app.services.dsp as dsp
+    spy = mocker.spy(dsp, '_first_loud_window')
+    audio = np.concatenate([_silence(2.5), _tone(600), _silence(1.5)])
+    out = trim_silence(audio, RATE)
+    assert len(out) == RATE * 600 + 2 * RATE // 10
+    scanned = sum(len(call.args[0]) for call in spy.call_args_list)
+    assert scanned <= RATE * (2.5 + 1.5 + 2)
+
+def test_trim_silence_leaves_silent_and_unpadded_buffers_alone():
+    silent = _silence(3)
+    assert trim_silence(silent, RATE) is silent
+    audio = np.concatenate([_silence(0.05), _tone(1)])
+    assert len(trim_silence(audio, RATE)) == len(audio)
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from app.services.loudness_history import decode_history, encode_history, write_history
+
+def _history(points):
+    momentary = np.linspace(-40, -5, points)
+    momentary[0] = -np.inf
+    return {'seconds_per_point': 0.5, 'momentary': momentary, 'short_term': np.full(points, -18.234)}
+
+def test_round_trip_keeps_centi_lu_and_missing_values():
+    history = _history(100)
+    decoded = decode_history(encode_history(history))
+    assert decoded['seconds_per_point'] == pytest.approx(0.5)
+    assert decoded['momentary'][0] == -np.inf
+    assert np.allclose(decoded['momentary'][1:], history['momentary'][1:], atol=0.005)
+    assert np.allclose(decoded['short_term'], -18.23)
+
+def test_two_bytes_per_point_and_series(tmp_path):
+    # one hour at 2 points/s is ~29 KB, instead of a JSON list in result_json
+    size = write_history(_history(7200), str(tmp_path / 'a.loudness'))
+    assert size == 16 + 7200 * 2 * 2
+
+def test_decode_rejects_foreign_data():
+    with pytest.raises(ValueError):
+        decode_history(b'WBPK' + bytes(16))
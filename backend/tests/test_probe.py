@@ -0,0 +1,98 @@
+import os
+import subprocess
+import pytest
+import numpy as np
+import soundfile as sf
+from app.services import probe
+from app.services.probe import HEADER_CHECK_BYTES, check_header, probe_format, probe_header, sniff_container
+
+RATE = 44100
+
+def _tone(seconds=1.0, channels=2):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return np.tile(0.2 * np.sin(2 * np.pi * 440 * t)[:, None], (1, channels))
+
+@pytest.mark.parametrize("extension, sf_format, subtype, codec, bitrate", [
+    ('.wav', 'WAV', 'PCM_16', 'pcm_s16le', RATE * 2 * 16),
+    ('.wav', 'WAV', 'FLOAT', 'pcm_f32le', RATE * 2 * 32),
+    ('.aiff', 'AIFF', 'PCM_24', 'pcm_s24be', RATE * 2 * 24),
+    ('.flac', 'FLAC', 'PCM_16', 'flac', None),
+])
+def test_lossless_headers_are_read_in_process(tmp_path, extension, sf_format, subtype, codec, bitrate):
+    path = str(tmp_path / f"tone{extension}")
+    sf.write(path, _tone(1.5), RATE, format=sf_format, subtype=subtype)
+    info = probe_header(path)
+    assert info['codec'] == codec and info['is_lossless']
+    assert (info['sample_rate'], info['channels'], info['bitrate']) == (RATE, 2, bitrate)
+    assert info['duration'] == pytest.approx(1.5)
+    assert info['file_extension'] == extension
+
+@pytest.mark.parametrize("extension, codec, format_name", [
+    ('.mp3', 'mp3', 'mp3'),
+    ('.ogg', 'vorbis', 'ogg'),
+    ('.m4a', 'aac', 'mov,mp4,m4a,3gp,3g2,mj2'),
+])
+def test_lossy_headers_are_read_in_process(tmp_path, extension, codec, format_name):
+    path = str(tmp_path / f"tone{extension}")
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=d=2', '-ac', '2', '-y', path], check=True)
+    info = probe_header(path)
+    assert (info['codec'], info['format_name'], info['is_lossless']) == (codec, format_name, False)
+    assert info['channels'] == 2 and info['sample_rate'] == RATE
+    assert info['duration'] == pytest.approx(2.0, abs=0.1)
+    assert info['bitrate'] > 0
+
+def test_magic_bytes_beat_the_extension(tmp_path):
+    path = str(tmp_path / 'mislabelled.mp3')
+    sf.write(path, _tone(), RATE, format='FLAC')
+    assert sniff_container(path) == 'flac'
+    # a FLAC stream behind an ID3 tag is still FLAC
+    tagged = str(tmp_path / 'tagged.flac')
+    with open(path, 'rb') as f: flac = f.read()
+    with open(tagged, 'wb') as f: f.write(b'ID3\x04\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10 + flac)
+    assert sniff_container(tagged) == 'flac'
+    assert probe_header(tagged)['codec'] == 'flac'
+
+def test_unknown_input_falls_back_to_ffprobe(tmp_path, mocker):
+    path = str(tmp_path / 'track.wma')
+    with open(path, 'wb') as f: f.write(os.urandom(64))
+    assert probe_header(path) is None
+    fallback = mocker.patch.object(probe, 'ffprobe_format', return_value={'codec': 'wmav2'})
+    assert probe_format(path) == {'codec': 'wmav2'}
+    fallback.assert_called_once_with(path)
+
+    wav = str(tmp_path / 'tone.wav')
+    sf.write(wav, _tone(), RATE)
+    fallback.reset_mock()
+    assert probe_format(wav)['codec'] == 'pcm_s16le'
+    fallback.assert_not_called()
+
+def test_probe_reports_bit_depth_and_bitrate_mode(tmp_path):
+    flac = str(tmp_path / 'tone.flac')
+    sf.write(flac, _tone(), RATE, format='FLAC', subtype='PCM_24')
+    assert probe_header(flac)['bits_per_sample'] == 24
+    mp3 = str(tmp_path / 'tone.mp3')
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=d=1', '-b:a', '192k', '-y', mp3], check=True)
+    assert probe_header(mp3)['bitrate_mode'] == 'cbr'
+
+@pytest.mark.parametrize("extension, container", [
+    ('.wav', 'wav'), ('.flac', 'flac'), ('.mp3', 'mp3'), ('.ogg', 'ogg'), ('.m4a', 'mp4'),
+])
+def test_check_header_accepts_the_first_bytes_of_a_file(tmp_path, extension, container):
+    path = str(tmp_path / f"tone{extension}")
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=d=30', '-ac', '2', '-y', path], check=True)
+    partial = str(tmp_path / f"partial{extension}")
+    with open(path, 'rb') as source, open(partial, 'wb') as f:
+        f.write(source.read(2 * HEADER_CHECK_BYTES))
+    assert check_header(partial) == container
+
+def test_check_header_waits_for_enough_bytes_then_rejects_garbage(tmp_path):
+    path = str(tmp_path / "fake.wav")
+    with open(path, 'wb') as f:
+        f.write(b'<html>' + bytes(100))
+    assert check_header(path) is None
+    with pytest.raises(ValueError, match="Unrecognized audio format"):
+        check_header(path, complete=True)
+    with open(path, 'wb') as f:
+        f.write(b'RIFF\x00\x00\x00\x00WAVEjunk' + bytes(HEADER_CHECK_BYTES))
+    with pytest.raises(ValueError, match="Corrupt wav header"):
+        check_header(path)
@@ -13,6 +13,9 @@ def production_app(tmp_path_factory):
     from app import create_app
     
     uploads_path = tmp_path_factory.mktemp('uploads')
+    # Limiter z pamięcią w procesie - ustawiony przed init_app w create_app
+    limiter._storage_uri = 'memory://'
+    limiter.enabled = True
     app = create_app({
         'TESTING': False,  # Ważne: limiter będzie aktywny
         'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
@@ -24,10 +27,7 @@ def production_app(tmp_path_factory):
         'BABEL_DEFAULT_LOCALE': 'en',
         'RATELIMIT_STORAGE_URL': 'memory://',  # In-memory dla testów
     })
-    
-    # Reinitialize limiter with in-memory storage
-    limiter._storage_uri = 'memory://'
-    
+
     with app.app_context():
         _db.create_all()
         
@@ -36,6 +36,9 @@ def production_app(tmp_path_factory):
     with app.app_context():
         _db.session.remove()
         _db.drop_all()
+    # Limiter jest globalny - wyczyść liczniki i wyłącz go, żeby kolejne testy mogły się logować
+    limiter.reset()
+    limiter.enabled = False
 
 @pytest.fixture
 def prod_client(production_app):
@@ -0,0 +1,56 @@
+import os
+from app.services.render_cache import RenderCache, canonical_options, render_cache_key
+
+def _render(tmp_path, name, size=100):
+    output = tmp_path / f"{name}.mp3"
+    output.write_bytes(os.urandom(size))
+    tiles = tmp_path / f"{name}.mp3.spectrogram"
+    tiles.mkdir()
+    (tiles / 'tile-0.png').write_bytes(b'png')
+    return {'output-0': str(output), 'spectrogram': str(tiles), 'stereo': str(tmp_path / f"{name}.mp3.stereo")}
+
+def test_key_ignores_metadata_and_option_spelling():
+    options = {'format': 'MP3', 'lufs_preset': 'custom', 'normalize': True, 'target_lufs': '-14', 'artist': 'A'}
+    same = {'format': 'mp3', 'lufs_preset': 'custom', 'normalize': True, 'target_lufs': -14.0,
+            'artist': 'B', 'title': 'Other', 'cover_art_path': '/tmp/cover.jpg', 'trim_silence': False}
+    assert render_cache_key('abc', options) == render_cache_key('abc', same)
+    assert render_cache_key('abc', options) != render_cache_key('def', options)
+    assert render_cache_key('abc', options) != render_cache_key('abc', dict(options, target_lufs='-16'))
+    # zero is a value, not an unset option
+    assert canonical_options({'fade_in': 0, 'fade_out': None}) == {'fade_in': 0.0}
+
+def test_store_and_restore_round_trip(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 10 ** 6)
+    files = _render(tmp_path, 'first')
+    assert cache.store('key', files, {'loudness_lufs': -14.0})
+
+    restored = {name: path.replace('first', 'second') for name, path in files.items()}
+    assert cache.restore('key', restored) == {'loudness_lufs': -14.0}
+    with open(restored['output-0'], 'rb') as a, open(files['output-0'], 'rb') as b:
+        assert a.read() == b.read()
+    assert os.path.exists(os.path.join(restored['spectrogram'], 'tile-0.png'))
+    assert not os.path.exists(restored['stereo'])  # absent at store time, not restored
+
+    assert cache.restore('missing', restored) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stores'], stats['entries']) == (1, 1, 1, 1)
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 2500)
+    for index, name in enumerate(('a', 'b')):
+        cache.store(name, _render(tmp_path, name, size=1000), {})
+        os.utime(os.path.join(cache.root, name), (index, index))
+    # a hit on 'a' makes 'b' the least recently used entry
+    restored = tmp_path / 'restored'
+    restored.mkdir()
+    assert cache.restore('a', {'output-0': str(restored / 'a.mp3'), 'spectrogram': str(restored / 'tiles')}) == {}
+    cache.store('c', _render(tmp_path, 'c', size=1000), {})
+
+    assert sorted(name for name in os.listdir(cache.root) if not name.startswith('.') and name != 'stats.json') == ['a', 'c']
+    assert cache.stats()['evictions'] == 1
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = RenderCache(str(tmp_path / 'cache'), 0)
+    assert not cache.store('key', _render(tmp_path, 'x'), {})
+    assert cache.restore('key', {}) is None
+    assert not os.path.exists(cache.root)
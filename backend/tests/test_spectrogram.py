@@ -0,0 +1,71 @@
+import os
+import numpy as np
+from app.services.spectrogram import (
+    SPECTROGRAM_BINS, SPECTROGRAM_FFT_SIZE, SPECTROGRAM_HOP, SPECTROGRAM_TILE_COLUMNS, SpectrogramBuilder,
+    build_zoom_levels, compute_spectrogram, read_spectrogram_index, tile_path, write_spectrogram_tiles,
+)
+
+def _sine(rate, seconds, freq, amplitude=1.0):
+    t = np.arange(int(rate * seconds)) / rate
+    tone = (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    return np.stack([tone, tone], axis=1)
+
+def test_full_scale_sine_peaks_at_its_bin_near_0_dbfs():
+    rate = 48000
+    freq = 100 * rate / SPECTROGRAM_FFT_SIZE  # exactly on bin 100
+    columns = compute_spectrogram(_sine(rate, 1, freq))
+    assert columns.dtype == np.uint8
+    assert columns.shape == ((rate - SPECTROGRAM_FFT_SIZE) // SPECTROGRAM_HOP + 1, SPECTROGRAM_BINS)
+    assert (columns.argmax(axis=1) == 100).all()
+    assert columns[:, 100].min() >= 253
+    assert columns[:, 300].max() < 64
+
+def test_batching_does_not_change_the_result():
+    rng = np.random.default_rng(5)
+    noise = (rng.standard_normal((48000, 2)) * 0.1).astype(np.float32)
+    assert np.array_equal(compute_spectrogram(noise, batch_columns=7), compute_spectrogram(noise))
+
+def test_short_and_silent_input():
+    columns = compute_spectrogram(np.zeros((100, 1), dtype=np.float32))
+    assert columns.shape == (1, SPECTROGRAM_BINS) and not columns.any()
+
+def test_zoom_levels_keep_the_loudest_column():
+    columns = np.zeros((SPECTROGRAM_TILE_COLUMNS * 20 + 3, 4), dtype=np.uint8)
+    columns[5, 2] = 200
+    levels = build_zoom_levels(columns)
+    assert [len(level) for level in levels] == [5123, 1281, 321]
+    assert levels[1][1, 2] == 200 and levels[2][0, 2] == 200
+
+def test_tiles_and_index_written(tmp_path):
+    directory = str(tmp_path / 'x.spectrogram')
+    index = write_spectrogram_tiles(_sine(44100, 3, 1000, 0.5), 44100, directory)
+    assert read_spectrogram_index(directory) == index
+    zoom = index['zooms'][0]
+    assert zoom['tiles'] == -(-zoom['columns'] // SPECTROGRAM_TILE_COLUMNS)
+    assert os.path.getsize(tile_path(directory, 0, 0)) == SPECTROGRAM_TILE_COLUMNS * SPECTROGRAM_BINS
+    last = os.path.getsize(tile_path(directory, 0, zoom['tiles'] - 1))
+    assert last == (zoom['columns'] - (zoom['tiles'] - 1) * SPECTROGRAM_TILE_COLUMNS) * SPECTROGRAM_BINS
+
+def test_streamed_blocks_write_the_same_tiles_as_one_buffer(tmp_path):
+    rng = np.random.default_rng(7)
+    # long enough for three zooms, with partial tiles and a partial zoom group at the end
+    noise = (rng.standard_normal((SPECTROGRAM_HOP * 5000 + 999, 2)) * 0.1).astype(np.float32)
+    levels = build_zoom_levels(compute_spectrogram(noise))
+    builder = SpectrogramBuilder(44100, str(tmp_path / 'streamed'), batch_columns=300)
+    for start in range(0, len(noise), 12345):
+        builder.process(noise[start:start + 12345])
+    index = builder.finish()
+    assert [zoom['columns'] for zoom in index['zooms']] == [len(level) for level in levels]
+    assert index['duration_seconds'] == len(noise) / 44100
+    for zoom, columns in enumerate(levels):
+        tiles = b''.join(open(tile_path(str(tmp_path / 'streamed'), zoom, tile), 'rb').read()
+                         for tile in range(index['zooms'][zoom]['tiles']))
+        assert tiles == columns.tobytes()
+    assert sorted(os.listdir(tmp_path / 'streamed')) == sorted([str(zoom) for zoom in range(len(levels))] + ['index.json'])
+
+def test_streamed_input_shorter_than_a_window(tmp_path):
+    builder = SpectrogramBuilder(44100, str(tmp_path / 'short'))
+    builder.process(np.zeros((100, 2), dtype=np.float32))
+    index = builder.finish()
+    assert [zoom['columns'] for zoom in index['zooms']] == [1]
+    assert os.path.getsize(tile_path(str(tmp_path / 'short'), 0, 0)) == SPECTROGRAM_BINS
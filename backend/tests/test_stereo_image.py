@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from app.services.stereo_image import decode_stereo, encode_stereo, write_stereo
+
+def _history(points=10, bins=128):
+    goniometer = np.zeros((bins, bins), dtype=np.int64)
+    goniometer[64, 64] = 1000
+    goniometer[10, 64] = 1
+    correlation = np.linspace(-1, 1, points)
+    correlation[3] = np.nan
+    return {'seconds_per_point': 0.5, 'stereo': {
+        'correlation': correlation, 'correlation_overall': 0.42,
+        'goniometer': goniometer, 'goniometer_extent': 0.5,
+    }}
+
+def test_round_trip():
+    history = _history()
+    decoded = decode_stereo(encode_stereo(history))
+    assert decoded['seconds_per_point'] == pytest.approx(0.5)
+    assert decoded['correlation_overall'] == pytest.approx(0.42)
+    assert decoded['goniometer_extent'] == pytest.approx(0.5)
+    assert np.isnan(decoded['correlation'][3])
+    mask = ~np.isnan(history['stereo']['correlation'])
+    assert np.allclose(decoded['correlation'][mask], history['stereo']['correlation'][mask], atol=1 / 127)
+    # log density keeps a single stray sample visible next to the dense centre
+    assert decoded['goniometer'][64, 64] == 1.0
+    assert 0 < decoded['goniometer'][10, 64] < 0.2
+    assert decoded['goniometer'].sum() < 1.2
+
+def test_goniometer_is_fixed_size(tmp_path):
+    size = write_stereo(_history(points=7200), str(tmp_path / 'a.stereo'))
+    assert size == 24 + 7200 + 128 * 128
+
+def test_decode_rejects_foreign_data():
+    with pytest.raises(ValueError):
+        decode_stereo(b'WBLH' + bytes(32))
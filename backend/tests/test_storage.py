@@ -0,0 +1,44 @@
+import io
+import os
+import hashlib
+from app.services.storage import original_path_for, store_upload
+
+def test_store_upload_files_by_content_hash(tmp_path):
+    data = os.urandom(3 * 1024 + 17)
+    path, content_hash, size, created = store_upload(io.BytesIO(data), str(tmp_path), 7, '.WAV', chunk_bytes=1024)
+    assert content_hash == hashlib.sha256(data).hexdigest()
+    assert size == len(data) and created
+    assert path == original_path_for(str(tmp_path), 7, content_hash, '.wav')
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+def test_identical_reupload_reuses_original_per_user(tmp_path):
+    data = b'RIFF' + os.urandom(2048)
+    first, _, _, _ = store_upload(io.BytesIO(data), str(tmp_path), 1, '.wav')
+    again, _, _, created = store_upload(io.BytesIO(data), str(tmp_path), 1, '.wav')
+    assert again == first and not created
+    other_user, _, _, created = store_upload(io.BytesIO(data), str(tmp_path), 2, '.wav')
+    assert other_user != first and created
+    # no temporary files are left behind
+    assert os.listdir(os.path.dirname(first)) == [os.path.basename(first)]
+
+def test_identical_reupload_is_never_written(tmp_path, mocker):
+    data = os.urandom(5 * 1024)
+    first, _, _, _ = store_upload(io.BytesIO(data), str(tmp_path), 1, '.wav', chunk_bytes=1024)
+    temp_file = mocker.patch('app.services.storage.tempfile.NamedTemporaryFile')
+    again, _, size, created = store_upload(io.BytesIO(data), str(tmp_path), 1, '.wav', chunk_bytes=1024)
+    assert (again, size, created) == (first, len(data), False)
+    temp_file.assert_not_called()
+
+def test_upload_sharing_a_prefix_with_an_original_is_stored_whole(tmp_path):
+    data = os.urandom(5 * 1024)
+    store_upload(io.BytesIO(data), str(tmp_path), 1, '.wav', chunk_bytes=1024)
+    # diverges after three chunks, stops short of the original, runs past its end
+    for variant in (data[:3000] + os.urandom(2000), data[:4096], data + os.urandom(100)):
+        path, content_hash, size, created = store_upload(io.BytesIO(variant), str(tmp_path), 1, '.wav',
+                                                         chunk_bytes=1024)
+        assert created and size == len(variant)
+        assert content_hash == hashlib.sha256(variant).hexdigest()
+        with open(path, 'rb') as f:
+            assert f.read() == variant
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.startswith('.')]
@@ -0,0 +1,135 @@
+import os
+import json
+import shutil
+import subprocess
+import pytest
+import redis
+from app.models import ProcessingTask
+from app.services import task_events
+from app.services.task_events import (acquire_stream_slot, publish_task_event, stream_task_events,
+                                     task_event_streams_key, task_events_channel)
+from tests.helpers.fake_redis import FakeRedis
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def _pubsub(mocker, messages, clock):
+    pubsub = mocker.Mock()
+    def get_message(timeout):
+        clock.now += timeout
+        return messages.pop(0) if messages else None
+    pubsub.get_message.side_effect = get_message
+    client = mocker.Mock()
+    client.pubsub.return_value = pubsub
+    mocker.patch.object(task_events, 'redis_client', return_value=client)
+    return pubsub
+
+def test_published_event_has_the_task_status_shape(app, mocker):
+    client = mocker.Mock()
+    mocker.patch.object(task_events, 'redis_client', return_value=client)
+    task = ProcessingTask(id=5, user_id=3, status='COMPLETED', result_json='{"loudness_lufs": -14.0}')
+    with app.app_context():
+        assert publish_task_event(task)
+    channel, payload = client.publish.call_args.args
+    assert channel == task_events_channel(3) == 'task-events:3'
+    assert json.loads(payload) == {'task_id': 5, 'status': 'COMPLETED', 'result': '{"loudness_lufs": -14.0}'}
+
+def test_publish_failure_does_not_raise(app, mocker):
+    client = mocker.Mock()
+    client.publish.side_effect = redis.ConnectionError('down')
+    mocker.patch.object(task_events, 'redis_client', return_value=client)
+    with app.app_context():
+        assert not publish_task_event(ProcessingTask(id=5, user_id=3, status='PROCESSING'))
+
+def test_stream_subscribes_before_snapshot_then_relays_and_ends(app, mocker):
+    clock = _Clock()
+    messages = [{'type': 'message', 'data': '{"task_id": 2, "status": "COMPLETED", "result": null}'}]
+    pubsub = _pubsub(mocker, messages, clock)
+    def snapshot():
+        pubsub.subscribe.assert_called_once_with('task-events:3')
+        return [{'task_id': 1, 'status': 'FAILED', 'result': '{"error": "x"}'}]
+
+    with app.app_context():
+        chunks = list(stream_task_events(3, snapshot, max_seconds=40, heartbeat=15, clock=clock))
+
+    assert chunks[0] == "retry: 3000\n\n"
+    assert chunks[1] == 'event: task\ndata: {"task_id": 1, "status": "FAILED", "result": "{\\"error\\": \\"x\\"}"}\n\n'
+    assert chunks[2] == 'event: task\ndata: {"task_id": 2, "status": "COMPLETED", "result": null}\n\n'
+    # no more messages: heartbeats until max_seconds, then the client is told to reconnect
+    assert chunks[3:-1] == [": keepalive\n\n"] * 2
+    assert chunks[-1].startswith('event: end\n')
+    pubsub.close.assert_called_once()
+
+def test_stream_closes_pubsub_when_client_disconnects(app, mocker):
+    pubsub = _pubsub(mocker, [], _Clock())
+    with app.app_context():
+        stream = stream_task_events(3, max_seconds=300)
+        next(stream)
+        stream.close()
+    pubsub.close.assert_called_once()
+
+_WATCHER_JS = os.path.join(os.path.dirname(__file__), '..', 'app', 'static', 'js', 'task-events.js')
+_WATCHER_SCENARIO = """
+const vm = require('vm');
+const fs = require('fs');
+const sources = [];
+const fetched = [];
+class FakeEventSource {
+    constructor(url) { this.url = url; this.listeners = {}; sources.push(this); }
+    addEventListener(name, listener) { this.listeners[name] = listener; }
+    close() {}
+}
+const context = vm.createContext({
+    EventSource: FakeEventSource, queueMicrotask, setInterval, clearInterval, console,
+    fetch: url => {
+        fetched.push(url);
+        return Promise.resolve({ ok: true, json: () => Promise.resolve({
+            tasks: { 4: { status: 'COMPLETED', summary: null } }, missing: [] }) });
+    },
+});
+vm.runInContext(fs.readFileSync(process.argv[2], 'utf8') + '; this.TaskStatusWatcher = TaskStatusWatcher;', context);
+const watcher = new context.TaskStatusWatcher();
+['1', '2', '3'].forEach(taskId => watcher.watch(taskId));
+setTimeout(() => {
+    watcher.watch('4').then(data => {
+        console.log(JSON.stringify({ sources: sources.map(source => source.url), fetched, finished: data.status }));
+    });
+}, 0);
+"""
+
+@pytest.mark.skipif(not shutil.which('node'), reason='node is not installed')
+def test_streams_are_capped_per_worker_and_per_user(app, mocker):
+    client = FakeRedis()
+    mocker.patch.object(task_events, 'redis_client', return_value=client)
+    app.config.update(TASK_EVENTS_MAX_STREAMS=3, TASK_EVENTS_MAX_STREAMS_PER_USER=2)
+    with app.app_context():
+        first, second = acquire_stream_slot(1), acquire_stream_slot(1)
+        assert first and second
+        assert acquire_stream_slot(1) is None  # a third tab of the same user polls
+        other = acquire_stream_slot(2)
+        assert other
+        assert acquire_stream_slot(3) is None  # every stream thread of this worker is taken
+        first()
+        first()  # releasing twice gives back one slot only
+        assert client.data[task_event_streams_key(1)] == '1'
+        assert acquire_stream_slot(3)
+        assert acquire_stream_slot(4) is None
+
+def test_stream_route_answers_503_without_a_slot(logged_in_client, mocker):
+    mocker.patch('app.blueprints.audio.routes.acquire_stream_slot', return_value=None)
+    response = logged_in_client.get('/audio/task-events?ids=1')
+    assert response.status_code == 503
+
+def test_watcher_connects_once_for_ids_watched_in_one_tick(tmp_path):
+    scenario = tmp_path / 'watcher.js'
+    scenario.write_text(_WATCHER_SCENARIO)
+    result = subprocess.run(['node', str(scenario), _WATCHER_JS], capture_output=True, text=True, timeout=30, check=True)
+    outcome = json.loads(result.stdout)
+    # the snapshot request covers every id of the loop, not just the first one
+    assert outcome['sources'] == ['/audio/task-events?ids=1,2,3']
+    # an id watched while the stream is open is caught up with one status request
+    assert outcome['fetched'] == ['/audio/task-status?ids=4']
+    assert outcome['finished'] == 'COMPLETED'
@@ -0,0 +1,69 @@
+import json
+import redis
+from app.services import task_progress
+from app.services.task_progress import STAGE_WEIGHTS, TaskProgress, read_task_progress, task_progress_key
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def _progress(mocker, clock, **kwargs):
+    client = mocker.Mock()
+    return TaskProgress(7, 3, client=client, logger=mocker.Mock(), clock=clock, **kwargs), client
+
+def test_percent_is_weighted_by_stage_with_an_eta(mocker):
+    clock = _Clock()
+    progress, client = _progress(mocker, clock)
+    progress.start(['decode', 'encode', 'tagging'])
+    total = STAGE_WEIGHTS['decode'] + STAGE_WEIGHTS['encode'] + STAGE_WEIGHTS['tagging']
+
+    progress.stage('decode', duration=100)
+    clock.now = 10.0
+    encode = progress.stage('encode', duration=50)
+    encode(25)
+    snapshot = progress.snapshot()
+    done = (STAGE_WEIGHTS['decode'] + STAGE_WEIGHTS['encode'] / 2) / total
+    assert snapshot['stage'] == 'encode'
+    assert snapshot['percent'] == round(done * 100, 1)
+    assert snapshot['eta_seconds'] == round(10.0 * (1 - done) / done, 1)
+
+def test_writes_are_throttled_but_stage_changes_are_not(mocker):
+    clock = _Clock()
+    progress, client = _progress(mocker, clock, min_interval=1.0)
+    progress.start(['render', 'tagging'])
+    render = progress.stage('render', duration=10)
+    for second in range(1, 6):
+        clock.now = second * 0.4
+        render(second)
+    progress.stage('tagging')
+    pipe = client.pipeline.return_value
+    # entering render (0.0 s), the first update a full interval later (1.2 s), entering tagging
+    assert pipe.execute.call_count == 3
+    key, value = pipe.set.call_args.args
+    assert key == task_progress_key(7) and pipe.set.call_args.kwargs['ex'] == task_progress.PROGRESS_TTL_SECONDS
+    assert json.loads(value)['stage'] == 'tagging'
+    channel, event = pipe.publish.call_args.args
+    assert channel == 'task-events:3' and json.loads(event)['progress']['stage'] == 'tagging'
+
+def test_redis_failure_disables_progress_without_raising(mocker):
+    progress, client = _progress(mocker, _Clock())
+    client.pipeline.return_value.execute.side_effect = redis.ConnectionError('down')
+    progress.start(['copy'])
+    progress.stage('copy')
+    progress.stage('copy')
+    progress.clear()
+    assert client.pipeline.return_value.execute.call_count == 1
+    client.delete.assert_not_called()
+
+def test_read_task_progress_is_one_mget(app, mocker):
+    client = mocker.Mock()
+    client.mget.return_value = [json.dumps({'percent': 50.0, 'stage': 'render', 'eta_seconds': 3.0}), None]
+    mocker.patch.object(task_progress, 'redis_client', return_value=client)
+    with app.app_context():
+        assert read_task_progress([1, 2]) == {1: {'percent': 50.0, 'stage': 'render', 'eta_seconds': 3.0}}
+        client.mget.assert_called_once_with(['task-progress:1', 'task-progress:2'])
+        client.mget.side_effect = redis.ConnectionError('down')
+        assert read_task_progress([1]) == {}
+        assert read_task_progress([]) == {}
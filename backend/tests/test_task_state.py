@@ -0,0 +1,194 @@
+import os
+import json
+import pytest
+import redis
+from celery.exceptions import Retry
+from sqlalchemy.exc import OperationalError
+from sqlalchemy import event
+from app.models import AudioFile, ProcessingTask
+from app.services import task_state
+from app.services.task_state import (FLUSH_QUEUE, FLUSHED_STATE_TTL_SECONDS, claim_flush, finish_task,
+                                     flush_task_states, read_task_states, record_queued, start_task,
+                                     task_state_key)
+from app.tasks import audio_tasks
+from app.tasks.audio_tasks import persist_task_states, process_audio_file
+from tests.helpers.fake_redis import FakeRedis
+from tests.test_tasks import mock_decode
+
+@pytest.fixture
+def fake_redis(mocker):
+    client = FakeRedis()
+    for module in ('task_state', 'task_events', 'task_progress'):
+        mocker.patch(f'app.services.{module}.redis_client', return_value=client)
+    return client
+
+@pytest.fixture
+def commits(db):
+    counted = []
+    listener = lambda connection: counted.append(connection)
+    event.listen(db.engine, 'commit', listener)
+    yield counted
+    event.remove(db.engine, 'commit', listener)
+
+def _queued_tasks(db, user, count):
+    tasks = []
+    for index in range(count):
+        audio_file = AudioFile(user_id=user.id, original_filename=f'tone{index}.wav', original_file_path='dummy')
+        db.session.add(audio_file)
+        db.session.flush()
+        tasks.append(ProcessingTask(user_id=user.id, audio_file_id=audio_file.id))
+    db.session.add_all(tasks)
+    db.session.commit()
+    return [(task.id, task.audio_file_id) for task in tasks]
+
+def _run(app, user, task_ids):
+    app.config['RENDER_FUSE_GRAPH'] = False
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'tone.wav')
+    with open(filepath, 'w') as f: f.write('dummy')
+    for index, (task_id, _) in enumerate(task_ids):
+        process_audio_file.s(task_id, filepath, f'tone{index}.wav', user.id, {'format': 'mp3'}).apply()
+
+def test_finished_tasks_reach_the_database_in_one_batched_commit(db, test_user, app, mocker, fake_redis, commits):
+    mock_decode(mocker, amplitude=0.1)
+    mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
+    schedule = mocker.patch.object(audio_tasks.persist_task_states, 'apply_async')
+    task_ids = _queued_tasks(db, test_user, 5)
+    commits.clear()
+
+    _run(app, test_user, task_ids)
+    # no bookkeeping commit while the tasks run, and one flush scheduled for the whole burst
+    assert commits == []
+    schedule.assert_called_once_with(countdown=app.config['TASK_STATE_FLUSH_SECONDS'])
+    states = read_task_states(task_id for task_id, _ in task_ids)
+    assert {state['status'] for state in states.values()} == {'COMPLETED'}
+    assert ProcessingTask.query.filter_by(status='COMPLETED').count() == 0
+
+    assert flush_task_states() == 5
+    assert len(commits) == 1
+    db.session.expire_all()
+    for index, (task_id, audio_file_id) in enumerate(task_ids):
+        task_entry = db.session.get(ProcessingTask, task_id)
+        assert task_entry.status == 'COMPLETED' and task_entry.completed_at is not None
+        assert task_entry.celery_task_id
+        assert json.loads(task_entry.result_json)['processed_filename'] == f'tone{index}.mp3'
+        audio_file = db.session.get(AudioFile, audio_file_id)
+        assert audio_file.processed_filename == f'tone{index}.mp3'
+        assert [output.filename for output in audio_file.outputs] == [f'tone{index}.mp3']
+        assert fake_redis.ttl[task_state_key(task_id)] == FLUSHED_STATE_TTL_SECONDS
+    assert fake_redis.data[FLUSH_QUEUE] == []
+
+def test_without_redis_every_transition_is_committed(db, test_user, app, mocker, commits):
+    mock_decode(mocker, amplitude=0.1)
+    mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
+    mocker.patch.object(task_state, 'redis_client', side_effect=redis.ConnectionError('down'))
+    schedule = mocker.patch.object(audio_tasks.persist_task_states, 'apply_async')
+    task_ids = _queued_tasks(db, test_user, 2)
+    commits.clear()
+
+    _run(app, test_user, task_ids)
+    assert len(commits) == 4  # PROCESSING and COMPLETED of each task
+    schedule.assert_not_called()
+    db.session.expire_all()
+    for task_id, audio_file_id in task_ids:
+        assert db.session.get(ProcessingTask, task_id).status == 'COMPLETED'
+        assert db.session.get(AudioFile, audio_file_id).outputs
+
+def test_queued_id_does_not_overwrite_a_started_task(db, test_user, app, fake_redis):
+    (task_id, _), = _queued_tasks(db, test_user, 1)
+    task_entry = db.session.get(ProcessingTask, task_id)
+    start_task(task_entry, 'celery-1')
+    assert record_queued(task_entry, 'celery-1')
+    assert read_task_states([task_id])[task_id]['status'] == 'PROCESSING'
+
+def test_flush_skips_deleted_files_and_requeues_on_database_errors(db, test_user, app, mocker, fake_redis):
+    (task_id, audio_file_id), (other_id, _) = _queued_tasks(db, test_user, 2)
+    for queued_id, result in ((task_id, {'ok': True}), (other_id, {'error': 'boom'})):
+        task_entry = db.session.get(ProcessingTask, queued_id)
+        start_task(task_entry, f'celery-{queued_id}')
+        update = {'processed_filename': 'x.mp3', 'processed_file_path': '/tmp/x.mp3', 'loudness_lufs': -14.0,
+                  'duration_seconds': 1.0, 'true_peak_db': -1.0, 'outputs': []} if queued_id == task_id else None
+        finish_task(task_entry, 'COMPLETED' if update else 'FAILED', json.dumps(result), update)
+    # the file and its task are deleted while the final state still waits in Redis
+    db.session.delete(db.session.get(ProcessingTask, task_id))
+    db.session.delete(db.session.get(AudioFile, audio_file_id))
+    db.session.commit()
+
+    mocker.patch.object(task_state, '_persist', side_effect=RuntimeError('db down'))
+    with pytest.raises(RuntimeError):
+        flush_task_states()
+    assert fake_redis.data[FLUSH_QUEUE] == [str(task_id), str(other_id)]
+
+    mocker.stopall()
+    mocker.patch.object(task_state, 'redis_client', return_value=fake_redis)
+    assert flush_task_states() == 2
+    db.session.expire_all()
+    assert db.session.get(ProcessingTask, other_id).status == 'FAILED'
+    assert db.session.get(ProcessingTask, task_id) is None
+    assert db.session.get(AudioFile, audio_file_id) is None
+
+def test_claim_flush_is_once_per_interval(app, fake_redis):
+    with app.app_context():
+        assert claim_flush(5)
+        assert not claim_flush(5)
+        assert fake_redis.ttl[task_state.FLUSH_SCHEDULED] == 5
+
+def test_pages_show_state_that_is_not_flushed_yet(logged_in_client, db, test_user, app, fake_redis):
+    (done_id, done_file_id), (running_id, _) = _queued_tasks(db, test_user, 2)
+    db.session.get(AudioFile, done_file_id).file_size_bytes = 3
+    db.session.commit()
+    output_path = os.path.join(app.config['UPLOAD_FOLDER'], 'tone0.mp3')
+    with open(output_path, 'w') as f: f.write('mp3')
+    update = {'processed_filename': 'tone0.mp3', 'processed_file_path': output_path, 'loudness_lufs': -9.5,
+              'duration_seconds': 1.0, 'true_peak_db': -1.0,
+              'outputs': [{'format': 'mp3', 'filename': 'tone0.mp3', 'file_path': output_path}]}
+    start_task(db.session.get(ProcessingTask, running_id), 'celery-running')
+    done = db.session.get(ProcessingTask, done_id)
+    start_task(done, 'celery-done')
+    finish_task(done, 'COMPLETED', json.dumps({'processed_filename': 'tone0.mp3'}), update)
+
+    history = logged_in_client.get('/audio/history').data.decode()
+    assert f'id="task-row-{done_id}" class="file-row" data-status="COMPLETED"' in history
+    assert f'id="task-row-{running_id}" class="file-row" data-status="PROCESSING"' in history
+    assert '-9.5' in history
+    dashboard = logged_in_client.get('/audio/dashboard').data.decode()
+    assert 'data-pending-count="1"' in dashboard
+    details = logged_in_client.get(f'/audio/file/{done_file_id}').data.decode()
+    assert 'href="/uploads/tone0.mp3"' in details
+    # the pages only read: rows change when the flush writes them
+    db.session.expire_all()
+    assert {task.status for task in ProcessingTask.query} == {'PENDING'}
+    assert not db.session.get(AudioFile, done_file_id).outputs
+
+def test_failed_flush_retries_and_states_queued_meanwhile_get_a_follow_up(db, test_user, app, mocker, fake_redis):
+    (task_id, _), (late_id, _) = _queued_tasks(db, test_user, 2)
+    task_entry = db.session.get(ProcessingTask, task_id)
+    start_task(task_entry, 'celery-1')
+    finish_task(task_entry, 'FAILED', json.dumps({'error': 'boom'}))
+    interval = app.config['TASK_STATE_FLUSH_SECONDS']
+
+    mocker.patch.object(task_state, '_persist', side_effect=OperationalError('UPDATE', {}, Exception('db down')))
+    retry = mocker.patch.object(persist_task_states, 'retry', side_effect=Retry)
+    with pytest.raises(Retry):
+        persist_task_states.run()
+    assert retry.call_args.kwargs['countdown'] == interval
+    assert fake_redis.data[FLUSH_QUEUE] == [str(task_id)]
+
+    mocker.stopall()
+    mocker.patch.object(task_state, 'redis_client', return_value=fake_redis)
+    schedule = mocker.patch.object(persist_task_states, 'apply_async')
+    flush = task_state.flush_task_states
+
+    def flush_while_a_late_task_finishes():
+        written = flush()
+        # finished after the queue was drained and lost claim_flush() to the running flush
+        late = db.session.get(ProcessingTask, late_id)
+        start_task(late, 'celery-2')
+        finish_task(late, 'COMPLETED', json.dumps({}))
+        assert not claim_flush(interval)
+        return written
+
+    mocker.patch.object(audio_tasks, 'flush_task_states', side_effect=flush_while_a_late_task_finishes)
+    assert claim_flush(interval)  # the finisher that scheduled this run
+    assert persist_task_states.run() == 1
+    schedule.assert_called_once_with(countdown=interval)
+    assert fake_redis.data[FLUSH_QUEUE] == [str(late_id)]
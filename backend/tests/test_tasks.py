@@ -1,33 +1,50 @@
 import os
 import json
+import base64
 import pytest
-import array
 import mutagen
 import subprocess
 import numpy as np
 from mutagen.mp3 import MP3
-from mutagen.flac import FLAC
+from mutagen.flac import Picture
+from app.tasks import audio_tasks
 from app.tasks.audio_tasks import process_audio_file
+from app.services.audio_analyzer import analyze_audio, measure_loudness
+from app.services.loudness_history import decode_history, history_path_for
+from app.services.waveform import peaks_path_for
+from app.services.spectrogram import spectrogram_dir_for
+from app.services.cover_art import cover_art_path_for
 from app.models import ProcessingTask, AudioFile
 
+def mock_decode(mocker, frames=44100, channels=2, rate=44100, amplitude=0.0):
+    tone = amplitude * np.sin(2 * np.pi * 1000 * np.arange(frames) / rate)
+    samples = np.repeat(tone[:, None], channels, axis=1).astype(np.float32)
+    return mocker.patch('app.tasks.audio_tasks.decode_audio', return_value=(samples, rate))
+
 def test_task_handles_nonexistent_task_id(app):
     result = process_audio_file.s(999, '/tmp/file', 'file.wav', 1, {}).apply()
     assert result.state == 'FAILURE'
 
 def test_task_handles_processing_exception(db, test_user, dummy_wav_file, mocker, app):
+    app.config['RENDER_FUSE_GRAPH'] = False
     task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=1)
     db.session.add(task_entry)
     db.session.commit()
-    mocker.patch('soundfile.read', side_effect=Exception("Corrupted file"))
+    mocker.patch('app.tasks.audio_tasks.decode_audio', side_effect=Exception("Corrupted file"))
+    published = []
+    mocker.patch('app.tasks.audio_tasks.publish_task_event', side_effect=lambda task: published.append(task.status))
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'test.wav')
     with open(filepath, 'wb') as f: f.write(dummy_wav_file[0].read())
     process_audio_file.s(task_entry.id, filepath, 'test.wav', test_user.id, {}).apply()
     db.session.refresh(task_entry)
     assert task_entry.status == 'FAILED'
+    assert published == ['PROCESSING', 'FAILED']
     result_dict = json.loads(task_entry.result_json)
     assert 'Corrupted file' in result_dict['error']
 
-def test_task_success_path_no_normalization(db, test_user, dummy_wav_file, app):
+def test_task_success_path_no_normalization(db, test_user, dummy_wav_file, app, mocker):
+    published = []
+    mocker.patch('app.tasks.audio_tasks.publish_task_event', side_effect=lambda task: published.append(task.status))
     audio_file = AudioFile(user_id=test_user.id, original_filename='test.wav', original_file_path='dummy')
     db.session.add(audio_file)
     db.session.commit()
@@ -43,18 +60,17 @@ def test_task_success_path_no_normalization(db, test_user, dummy_wav_file, app):
     db.session.refresh(task_entry)
     assert task_entry.status == 'COMPLETED'
     assert 'processed_filename' in json.loads(task_entry.result_json)
+    # every status change is pushed to the owner's SSE stream
+    assert published == ['PROCESSING', 'COMPLETED']
 
-@pytest.mark.parametrize("sample_width", [2, 4])
-def test_task_normalization_by_sample_width(db, test_user, app, mocker, sample_width):
-    mock_audio_segment = mocker.patch('app.tasks.audio_tasks.AudioSegment.from_wav').return_value
-    mock_audio_segment.sample_width = sample_width
-    mock_audio_segment.get_array_of_samples.return_value = array.array('h', [0, 1, -1])
-    mock_audio_segment.apply_gain.return_value = mock_audio_segment
-    mock_audio_segment.frame_rate = 44100
-
-    mocker.patch('soundfile.read', return_value=(np.array([0, 0]), 44100))
-    mock_meter_instance = mocker.patch('pyloudnorm.Meter').return_value
-    mock_meter_instance.integrated_loudness.return_value = -23.0
+@pytest.mark.parametrize("channels", [1, 2])
+def test_task_normalization_scales_decoded_buffer(db, test_user, app, mocker, channels):
+    rate = 44100
+    tone = (0.1 * np.sin(2 * np.pi * 1000 * np.arange(rate * 2) / rate)).astype(np.float32)
+    samples = np.repeat(tone[:, None], channels, axis=1)
+    initial_lufs = measure_loudness(samples, rate)['input_i']
+    mocker.patch('app.tasks.audio_tasks.decode_audio', return_value=(samples, rate))
+    mock_encode = mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
 
     audio_file = AudioFile(user_id=test_user.id, original_filename='test.wav', original_file_path='dummy')
     db.session.add(audio_file)
@@ -70,33 +86,25 @@ def test_task_normalization_by_sample_width(db, test_user, app, mocker, sample_w
     
     db.session.refresh(task_entry)
     assert task_entry.status == 'COMPLETED'
+    encoded = mock_encode.call_args.args[0]
+    assert encoded is samples  # gain applied in place, no second buffer
+    expected_peak = 0.1 * 10 ** ((-14.0 - initial_lufs) / 20)
+    assert np.abs(encoded).max() == pytest.approx(expected_peak, rel=1e-3)
 
-@pytest.mark.parametrize("options, should_normalize, expected_export_params", [
-    ({'lufs_preset': 'spotify', 'format': 'wav', 'bit_depth': '16'}, True, {'format': 'wav', 'parameters': ['-ar', '44100', '-acodec', 'pcm_s16le']}),
-    ({'lufs_preset': 'apple_music', 'format': 'flac', 'bit_depth': '24'}, True, {'format': 'flac', 'parameters': ['-ar', '44100', '-acodec', 'pcm_s24le']}),
-    ({'lufs_preset': 'none', 'format': 'mp3', 'bitrate': '320k', 'bit_depth': '16'}, False, {'format': 'mp3', 'parameters': ['-ar', '44100'], 'bitrate': '320k'}),
-    ({'lufs_preset': 'custom', 'normalize': True, 'target_lufs': -10.0, 'format': 'wav', 'bit_depth': '32f'}, True, {'format': 'wav', 'parameters': ['-ar', '44100', '-acodec', 'pcm_f32le']}),
-    ({'lufs_preset': 'custom', 'normalize': False, 'format': 'wav'}, False, {'format': 'wav', 'parameters': ['-ar', '44100']}),
-    ({'lufs_preset': 'youtube', 'format': 'mp3', 'bitrate': '192k', 'bit_depth': '24'}, True, {'format': 'mp3', 'parameters': ['-ar', '44100'], 'bitrate': '192k'}),
+@pytest.mark.parametrize("options, should_normalize, expected_output_args", [
+    ({'lufs_preset': 'spotify', 'format': 'wav', 'bit_depth': '16'}, True, ['-acodec', 'pcm_s16le', '-ar', '44100']),
+    ({'lufs_preset': 'apple_music', 'format': 'flac', 'bit_depth': '24'}, True, ['-sample_fmt', 's32', '-bits_per_raw_sample', '24', '-ar', '44100']),
+    ({'lufs_preset': 'none', 'format': 'mp3', 'bitrate': '320k', 'bit_depth': '16'}, False, ['-b:a', '320k', '-ar', '44100']),
+    ({'lufs_preset': 'custom', 'normalize': True, 'target_lufs': -10.0, 'format': 'wav', 'bit_depth': '32f'}, True, ['-acodec', 'pcm_f32le', '-ar', '44100']),
+    ({'lufs_preset': 'custom', 'normalize': False, 'format': 'wav'}, False, ['-ar', '44100']),
+    ({'lufs_preset': 'youtube', 'format': 'mp3', 'bitrate': '192k', 'bit_depth': '24'}, True, ['-b:a', '192k', '-ar', '44100']),
+    ({'lufs_preset': 'none', 'format': 'mp3', 'bitrate': 'v0', 'sample_rate': 'original'}, False, ['-q:a', '0', '-ar', '44100']),
 ])
-def test_task_presets_and_bit_depth_logic(db, test_user, app, mocker, options, should_normalize, expected_export_params):
-    INITIAL_LUFS = -25.0
-    
-    # Mock subprocess.run for FFmpeg decode (lossy format LUFS analysis)
-    mock_subprocess_result = mocker.MagicMock()
-    mock_subprocess_result.returncode = 0
-    mocker.patch('app.tasks.audio_tasks.subprocess.run', return_value=mock_subprocess_result)
-    
-    mock_audio_segment = mocker.MagicMock()
-    mock_audio_segment.apply_gain.return_value = mock_audio_segment
-    mock_audio_segment.get_array_of_samples.return_value = array.array('h', [1000, -1000])
-    mock_audio_segment.sample_width = 2
-    mock_audio_segment.frame_rate = 44100
-    mocker.patch('app.tasks.audio_tasks.AudioSegment.from_wav', return_value=mock_audio_segment)
-
-    mocker.patch('soundfile.read', return_value=(np.array([0, 0]), 44100))
-    mock_meter = mocker.patch('pyloudnorm.Meter').return_value
-    mock_meter.integrated_loudness.return_value = INITIAL_LUFS
+def test_task_presets_and_bit_depth_logic(db, test_user, app, mocker, options, should_normalize, expected_output_args):
+    app.config['RENDER_FUSE_GRAPH'] = False
+    mock_decode(mocker, amplitude=0.05)
+    mock_gain = mocker.patch('app.tasks.audio_tasks.apply_gain')
+    mock_encode = mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
     
     audio_file = AudioFile(user_id=test_user.id, original_filename='test.wav', original_file_path='dummy_path')
     db.session.add(audio_file)
@@ -115,63 +123,27 @@ def test_task_presets_and_bit_depth_logic(db, test_user, app, mocker, options, s
     assert task_entry.status == 'COMPLETED'
     
     if should_normalize:
-        assert mock_audio_segment.apply_gain.called
+        assert mock_gain.called
     else:
-        assert not mock_audio_segment.apply_gain.called
+        assert not mock_gain.called
         
-    mock_audio_segment.export.assert_called_once_with(mocker.ANY, **expected_export_params)
-
-@pytest.mark.parametrize("options, audio_format, expected_easy_tags, expect_cover_art", [
-    (
-        {'artist': 'Test Artist', 'album': 'Test Album', 'title': 'Test Title', 'track_number': '1', 'isrc': 'US1234567890', 'cover_art_path': '/tmp/cover.jpg', 'format': 'mp3'},
-        'mp3',
-        {'artist': 'Test Artist', 'album': 'Test Album', 'title': 'Test Title', 'tracknumber': '1'},
-        True
-    ),
-    (
-        {'artist': 'Another Artist', 'album': '', 'title': '', 'track_number': '', 'isrc': '', 'cover_art_path': None, 'format': 'flac'},
-        'flac',
-        {'artist': 'Another Artist'},
-        False
-    ),
-])
-def test_task_metadata_application(db, test_user, app, mocker, options, audio_format, expected_easy_tags, expect_cover_art):
-    # Mock subprocess.run for FFmpeg decode (lossy format LUFS analysis)
-    mock_subprocess_result = mocker.MagicMock()
-    mock_subprocess_result.returncode = 0
-    mocker.patch('app.tasks.audio_tasks.subprocess.run', return_value=mock_subprocess_result)
-    
-    mocker.patch('app.tasks.audio_tasks.AudioSegment.from_wav').return_value.export.return_value = None
-    mocker.patch('soundfile.read', return_value=(np.array([0, 0]), 44100))
-    mocker.patch('pyloudnorm.Meter').return_value.integrated_loudness.return_value = -20.0
-    mock_os_remove = mocker.patch('os.remove')
-    
-    easy_tags_storage = {}
-    def set_easy_tag(key, value):
-        easy_tags_storage[key] = value
-    def get_easy_tag(key):
-        return easy_tags_storage.get(key)
-
-    mock_mutagen_easy = mocker.MagicMock()
-    mock_mutagen_easy.__setitem__.side_effect = set_easy_tag
-    mock_mutagen_easy.__getitem__.side_effect = get_easy_tag
-    
-    if audio_format == 'mp3':
-        mock_mutagen_file = mocker.MagicMock(spec=MP3)
-        mock_mutagen_file.tags = mocker.MagicMock()
-    else:
-        mock_mutagen_file = mocker.MagicMock(spec=FLAC)
-
-    def mutagen_file_side_effect(path, easy=False):
-        if easy:
-            return mock_mutagen_easy
-        return mock_mutagen_file
-
-    mocker.patch('mutagen.File', side_effect=mutagen_file_side_effect)
+    mock_encode.assert_called_once()
+    output_args = mock_encode.call_args.args[2]
+    assert output_args[:-1] == expected_output_args
+    assert output_args[-1].endswith('.m4a' if options['format'] == 'aac' else f".{options['format']}")
 
-    if options.get('cover_art_path'):
-        mocker.patch('os.path.exists', return_value=True)
-        mocker.patch('builtins.open', mocker.mock_open(read_data=b'imagedata'))
+@pytest.mark.parametrize("options, expect_cover_art", [
+    ({'artist': 'Test Artist', 'album': 'Test Album', 'title': 'Test Title', 'track_number': '1', 'isrc': 'US1234567890', 'cover_art_path': 'cover.jpg', 'format': 'mp3'}, True),
+    ({'artist': 'Another Artist', 'album': '', 'title': '', 'track_number': '', 'isrc': '', 'cover_art_path': None, 'format': 'flac'}, False),
+])
+def test_task_metadata_application(db, test_user, app, mocker, options, expect_cover_art):
+    app.config['RENDER_FUSE_GRAPH'] = False
+    mock_decode(mocker)
+    mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
+    mock_metadata = mocker.patch('app.tasks.audio_tasks._apply_metadata')
+    if options['cover_art_path']:
+        options = dict(options, cover_art_path=os.path.join(app.config['UPLOAD_FOLDER'], options['cover_art_path']))
+        with open(options['cover_art_path'], 'wb') as f: f.write(b'imagedata')
 
     audio_file = AudioFile(user_id=test_user.id, original_filename='meta.wav', original_file_path='dummy')
     db.session.add(audio_file)
@@ -187,18 +159,84 @@ def test_task_metadata_application(db, test_user, app, mocker, options, audio_fo
 
     db.session.refresh(task_entry)
     assert task_entry.status == 'COMPLETED'
-    
-    mock_mutagen_easy.save.assert_called_once()
-    mock_mutagen_file.save.assert_called_once()
-    
-    for key, value in expected_easy_tags.items():
-        assert easy_tags_storage[key] == value
-
+    output = os.path.join(app.config['UPLOAD_FOLDER'], f"meta.{options['format']}")
+    mock_metadata.assert_called_once_with(output, options)
     if expect_cover_art:
-        assert mock_mutagen_file.tags.add.called or mock_mutagen_file.add_picture.called
-        mock_os_remove.assert_any_call(options['cover_art_path'])
-    
-    mock_os_remove.assert_any_call(filepath)
+        assert not os.path.exists(options['cover_art_path'])
+    # the content-addressed original is kept for re-uploads
+    assert os.path.exists(filepath)
+
+def test_batch_cover_art_is_resolved_and_kept(db, test_user, app, mocker):
+    app.config['RENDER_FUSE_GRAPH'] = False
+    mock_decode(mocker)
+    mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
+    mock_metadata = mocker.patch('app.tasks.audio_tasks._apply_metadata')
+    cover_art_id = 'a' * 64
+    cover = cover_art_path_for(app.config['UPLOAD_FOLDER'], test_user.id, cover_art_id)
+    os.makedirs(os.path.dirname(cover), exist_ok=True)
+    with open(cover, 'wb') as f: f.write(b'jpeg')
+    options = {'format': 'mp3', 'artist': 'Artist', 'cover_art_id': cover_art_id}
+
+    audio_file = AudioFile(user_id=test_user.id, original_filename='album.wav', original_file_path='dummy')
+    db.session.add(audio_file)
+    db.session.commit()
+    task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id)
+    db.session.add(task_entry)
+    db.session.commit()
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'album.wav')
+    with open(filepath, 'w') as f: f.write('dummy')
+
+    process_audio_file.s(task_entry.id, filepath, 'album.wav', test_user.id, options).apply()
+
+    db.session.refresh(task_entry)
+    assert task_entry.status == 'COMPLETED'
+    tag_options = mock_metadata.call_args.args[1]
+    assert tag_options['cover_art_path'] == cover
+    # the rest of the batch still needs the shared cover
+    assert os.path.exists(cover)
+
+PNG_PIXEL = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+def _encoded(tmp_path, extension):
+    path = str(tmp_path / f"tone.{extension}")
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=d=1', '-ac', '2', '-y', path], check=True)
+    return path
+
+@pytest.mark.parametrize("extension", ['mp3', 'wav', 'aiff', 'flac', 'm4a', 'ogg', 'opus'])
+def test_apply_metadata_tags_every_container_in_one_save(app, tmp_path, mocker, extension):
+    path = _encoded(tmp_path, extension)
+    cover = tmp_path / 'cover.png'
+    cover.write_bytes(PNG_PIXEL)
+    options = {'artist': 'Artist', 'album': 'Album', 'title': 'Title', 'track_number': '3',
+               'isrc': 'US1234567890', 'cover_art_path': str(cover)}
+    opened = mocker.spy(mutagen, 'File')
+    with app.app_context():
+        audio_tasks._apply_metadata(path, options)
+    opened.assert_called_once_with(path)
+
+    audio = mutagen.File(path)
+    if extension in ('mp3', 'wav', 'aiff'):
+        tags = {key: str(audio.tags[key]) for key in ('TPE1', 'TALB', 'TIT2', 'TRCK', 'TSRC')}
+        assert tags == {'TPE1': 'Artist', 'TALB': 'Album', 'TIT2': 'Title', 'TRCK': '3', 'TSRC': 'US1234567890'}
+        assert audio.tags['APIC:Cover'].data == PNG_PIXEL
+    elif extension == 'm4a':
+        assert audio.tags['\xa9ART'] == ['Artist'] and audio.tags['trkn'] == [(3, 0)]
+        assert bytes(audio.tags['----:com.apple.iTunes:ISRC'][0]) == b'US1234567890'
+        assert bytes(audio.tags['covr'][0]) == PNG_PIXEL
+    else:
+        assert audio.tags['artist'] == ['Artist'] and audio.tags['isrc'] == ['US1234567890']
+        pictures = audio.pictures if extension == 'flac' else [
+            Picture(base64.b64decode(audio.tags['metadata_block_picture'][0]))]
+        assert pictures[0].data == PNG_PIXEL and pictures[0].mime == 'image/png'
+
+@pytest.mark.parametrize("extension", ['mp3', 'flac', 'm4a', 'opus'])
+def test_later_tag_edits_fit_in_the_reserved_padding(app, tmp_path, extension):
+    path = _encoded(tmp_path, extension)
+    with app.app_context():
+        audio_tasks._apply_metadata(path, {'artist': 'First', 'title': 'Title'})
+        size = os.path.getsize(path)
+        audio_tasks._apply_metadata(path, {'artist': 'A much longer artist name than before', 'album': 'Album'})
+    assert os.path.getsize(path) == size
 
 @pytest.mark.parametrize("limit_peak, preset, use_ffmpeg", [
     (True, 'spotify', True),
@@ -207,16 +245,13 @@ def test_task_metadata_application(db, test_user, app, mocker, options, audio_fo
     (False, 'none', False),
 ])
 def test_task_true_peak_limiter_logic(db, test_user, app, mocker, limit_peak, preset, use_ffmpeg):
-    mock_run_ffmpeg = mocker.patch('app.tasks.audio_tasks._run_ffmpeg_loudnorm', return_value=True)
+    app.config['RENDER_FUSE_GRAPH'] = False
+    silent_metrics = analyze_audio(np.zeros((4410, 2), dtype=np.float32), 44100).metrics()
+    mock_run_ffmpeg = mocker.patch('app.tasks.audio_tasks._run_ffmpeg_loudnorm', return_value=silent_metrics)
     mocker.patch('app.tasks.audio_tasks._apply_metadata')
-    mocker.patch('soundfile.read', return_value=(np.array([0.1, -0.1]), 44100))
-    mocker.patch('pyloudnorm.Meter').return_value.integrated_loudness.return_value = -20.0
     
-    mock_audio_segment = mocker.MagicMock()
-    mock_audio_segment.frame_rate = 44100
-    mock_audio_segment.get_array_of_samples.return_value = array.array('h', [100, -100])
-    mock_audio_segment.apply_gain.return_value = mock_audio_segment
-    mocker.patch('app.tasks.audio_tasks.AudioSegment.from_wav', return_value=mock_audio_segment)
+    mock_decode(mocker)
+    mock_encode = mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
 
     options = {
         'lufs_preset': preset,
@@ -244,10 +279,10 @@ def test_task_true_peak_limiter_logic(db, test_user, app, mocker, limit_peak, pr
 
     if use_ffmpeg:
         mock_run_ffmpeg.assert_called_once()
-        mock_audio_segment.export.assert_not_called()
+        mock_encode.assert_not_called()
     else:
         mock_run_ffmpeg.assert_not_called()
-        mock_audio_segment.export.assert_called_once()
+        mock_encode.assert_called_once()
 
 def test_task_dithering_and_resampling_real_ffmpeg(db, test_user, app, dummy_wav_file):
     options = {
@@ -274,3 +309,358 @@ def test_task_dithering_and_resampling_real_ffmpeg(db, test_user, app, dummy_wav
     
     db.session.refresh(task_entry)
     assert task_entry.status == 'COMPLETED'
+
+def test_loudnorm_uses_in_process_measurement_in_single_encode(app, mocker):
+    from app.tasks.audio_tasks import _run_ffmpeg_loudnorm
+    rate = 48000
+    tone = (0.1 * np.sin(2 * np.pi * 1000 * np.arange(rate * 2) / rate)).astype(np.float32)
+    samples = np.repeat(tone[:, None], 2, axis=1)
+    source = analyze_audio(samples, rate)
+    stats = source.loudnorm_stats()
+    mock_encode = mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm', return_value=(
+        'Stream mapping: ...\n[Parsed_loudnorm_0 @ 0x1]\n'
+        '{"input_i" : "-20.50", "output_i" : "-14.02", "output_tp" : "-1.10", "output_lra" : "6.20", "normalization_type" : "linear"}\n'
+    ))
+
+    with app.app_context():
+        final_metrics = _run_ffmpeg_loudnorm(samples, rate, [('wav', {'sample_rate': 'original'}, '/tmp/out.wav')], -14.0, source.result())
+    assert final_metrics['integrated_lufs'] == -14.02
+    assert final_metrics['true_peak_db'] == -1.10
+    assert final_metrics['loudness_range'] == 6.20
+    # everything else follows the integrated-loudness change applied by loudnorm
+    gain_db = -14.02 - stats['input_i']
+    assert final_metrics['sample_peak_db'] == pytest.approx(source.metrics()['sample_peak_db'] + gain_db)
+    assert final_metrics['history']['max_momentary'] == pytest.approx(source.history()['max_momentary'] + gain_db)
+    assert final_metrics['correlation'] == pytest.approx(1.0)
+
+    mock_encode.assert_called_once()
+    output_args = mock_encode.call_args.args[2]
+    loudnorm_filter = output_args[output_args.index('-af') + 1]
+    assert f"measured_I={stats['input_i']:.2f}" in loudnorm_filter
+    assert f"measured_LRA={stats['input_lra']:.2f}" in loudnorm_filter
+    assert f"measured_tp={stats['input_tp']:.2f}" in loudnorm_filter
+    assert f"measured_thresh={stats['input_thresh']:.2f}" in loudnorm_filter
+    assert output_args[output_args.index('-ar') + 1] == '48000'
+
+@pytest.mark.parametrize("verify_output", [False, True])
+def test_final_metrics_skip_re_decode_unless_verified(db, test_user, app, mocker, verify_output):
+    rate = 44100
+    tone = (0.5 * np.sin(2 * np.pi * 440 * np.arange(rate * 2) / rate)).astype(np.float32)
+    samples = np.repeat(tone[:, None], 2, axis=1)
+    mock_decode = mocker.patch('app.tasks.audio_tasks.decode_audio', return_value=(samples, rate))
+    encoded = np.concatenate([samples, np.zeros((2205, 2), dtype=np.float32)])  # encoder padding
+    mock_verify = mocker.patch('app.tasks.audio_tasks.analyze_file', return_value=analyze_audio(encoded, rate))
+    mocker.patch('app.tasks.audio_tasks._apply_metadata')
+    mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
+
+    audio_file = AudioFile(user_id=test_user.id, original_filename='final.wav', original_file_path='dummy')
+    db.session.add(audio_file)
+    db.session.commit()
+    task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id)
+    db.session.add(task_entry)
+    db.session.commit()
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'final.wav')
+    with open(filepath, 'w') as f: f.write('dummy')
+
+    options = {'format': 'mp3', 'lufs_preset': 'custom', 'normalize': True, 'target_lufs': -14.0, 'verify_output': verify_output}
+    process_audio_file.s(task_entry.id, filepath, 'final.wav', test_user.id, options).apply()
+
+    db.session.refresh(task_entry)
+    assert task_entry.status == 'COMPLETED'
+    mock_decode.assert_called_once()
+    result = json.loads(task_entry.result_json)
+    if verify_output:
+        mock_verify.assert_called_once()
+        assert result['loudness_lufs'] == round(measure_loudness(encoded, rate)['input_i'], 2)
+        assert result['duration_seconds'] == 2.05
+    else:
+        mock_verify.assert_not_called()
+        source_stats = measure_loudness(samples, rate)
+        gain_db = -14.0 - source_stats['input_i']
+        assert result['loudness_lufs'] == pytest.approx(-14.0, abs=0.01)
+        assert result['true_peak_db'] == pytest.approx(source_stats['input_tp'] + gain_db, abs=0.01)
+        # steady tone: momentary matches integrated; 2 s is too short for a 3 s short-term window
+        assert result['max_momentary_lufs'] == pytest.approx(-14.0, abs=0.05)
+        assert result['max_short_term_lufs'] is None
+        with open(history_path_for(os.path.join(app.config['UPLOAD_FOLDER'], 'final.mp3')), 'rb') as f:
+            history = decode_history(f.read())
+        assert len(history['momentary']) == 4
+        assert history['momentary'].max() == pytest.approx(result['max_momentary_lufs'], abs=0.01)
+        assert result['stereo_correlation'] == pytest.approx(1.0)
+        assert result['stereo_url'] == f'/audio/file/{audio_file.id}/stereo'
+        assert result['sample_peak_db'] == pytest.approx(result['true_peak_db'], abs=0.05)
+        assert result['crest_factor_db'] == pytest.approx(3.01, abs=0.01)
+        assert result['dc_offset'] == [0.0, 0.0]
+        assert result['clipped_samples'] == 0
+
+def test_render_args_fan_out_shared_filters_with_asplit():
+    from app.tasks.audio_tasks import _render_args
+    outputs = [
+        ('mp3', {'bitrate': '320k'}, '/out/a.mp3'),
+        ('flac', {'bit_depth': '24', 'resampler': 'soxr', 'sample_rate': '48000'}, '/out/a.flac'),
+    ]
+    args = _render_args(outputs, 44100, ['loudnorm=I=-14'])
+    graph = args[args.index('-filter_complex') + 1]
+    assert graph == '[0:a]loudnorm=I=-14,asplit=2[split0][split1];[split0]anull[out0];[split1]aresample=resampler=soxr[out1]'
+    assert args[args.index('/out/a.mp3') - 5:args.index('/out/a.mp3')] == ['[out0]', '-b:a', '320k', '-ar', '44100']
+    assert args[-1] == '/out/a.flac' and args[-3:-1] == ['-ar', '48000']
+    # without shared filters every output just filters the input itself
+    plain = _render_args(outputs, 44100)
+    assert '-filter_complex' not in plain
+    assert plain == ['-b:a', '320k', '-ar', '44100', '/out/a.mp3',
+                     '-af', 'aresample=resampler=soxr', '-sample_fmt', 's32', '-bits_per_raw_sample', '24', '-ar', '48000', '/out/a.flac']
+
+def test_output_targets_and_filenames():
+    from app.tasks.audio_tasks import _output_filenames, _output_targets
+    options = {'format': 'wav', 'bit_depth': '16', 'lufs_preset': 'spotify',
+               'targets': [{'format': 'mp3', 'bitrate': '128k'}, {'format': 'mp3', 'unknown': 1}, {'format': 'aac'}]}
+    targets = _output_targets(options)
+    assert [target['format'] for target in targets] == ['mp3', 'mp3', 'aac']
+    assert targets[0]['bitrate'] == '128k' and targets[0]['lufs_preset'] == 'spotify'
+    assert 'unknown' not in targets[1] and 'targets' not in targets[1]
+    assert _output_filenames('song.wav', targets) == ['song.mp3', 'song-2.mp3', 'song.m4a']
+    assert _output_targets({'format': 'flac'}) == [{'format': 'flac'}]
+
+def test_task_renders_all_targets_in_one_encode(db, test_user, app, mocker):
+    mock_decode(mocker, amplitude=0.1)
+    mock_encode = mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
+
+    audio_file = AudioFile(user_id=test_user.id, original_filename='multi.wav', original_file_path='dummy')
+    db.session.add(audio_file)
+    db.session.commit()
+    task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id)
+    db.session.add(task_entry)
+    db.session.commit()
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'multi.wav')
+    with open(filepath, 'w') as f: f.write('dummy')
+
+    options = {'lufs_preset': 'spotify', 'targets': [
+        {'format': 'mp3', 'bitrate': '320k'}, {'format': 'flac', 'bit_depth': '24'}, {'format': 'aac', 'bitrate': '256k'},
+    ]}
+    process_audio_file.s(task_entry.id, filepath, 'multi.wav', test_user.id, options).apply()
+
+    db.session.refresh(task_entry)
+    assert task_entry.status == 'COMPLETED'
+    mock_encode.assert_called_once()
+    output_args = mock_encode.call_args.args[2]
+    upload_folder = app.config['UPLOAD_FOLDER']
+    assert [arg for arg in output_args if arg.startswith(upload_folder)] == [
+        os.path.join(upload_folder, name) for name in ('multi.mp3', 'multi.flac', 'multi.m4a')
+    ]
+    db.session.refresh(audio_file)
+    assert audio_file.processed_filename == 'multi.mp3'
+    assert [(output.format, output.filename) for output in audio_file.outputs] == [
+        ('mp3', 'multi.mp3'), ('flac', 'multi.flac'), ('aac', 'multi.m4a'),
+    ]
+    result = json.loads(task_entry.result_json)
+    assert [output['processed_file_url'] for output in result['outputs']] == [
+        '/uploads/multi.mp3', '/uploads/multi.flac', '/uploads/multi.m4a',
+    ]
+
+def test_reupload_reuses_cached_probe_and_analysis(db, test_user, app, mocker):
+    app.config['RENDER_FUSE_GRAPH'] = False
+    mock_decode(mocker, amplitude=0.1)
+    mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm')
+    mock_probe = mocker.patch('app.tasks.audio_tasks._detect_audio_format', return_value={'is_lossless': True})
+    analyze = mocker.spy(audio_tasks, 'analyze_audio')
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'content.wav')
+    with open(filepath, 'w') as f: f.write('dummy')
+
+    results = []
+    for _ in range(2):
+        audio_file = AudioFile(user_id=test_user.id, original_filename='song.wav', original_file_path=filepath)
+        db.session.add(audio_file)
+        db.session.commit()
+        task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id)
+        db.session.add(task_entry)
+        db.session.commit()
+        options = {'format': 'mp3', 'lufs_preset': 'spotify'}
+        process_audio_file.s(task_entry.id, filepath, 'song.wav', test_user.id, options).apply()
+        db.session.refresh(task_entry)
+        assert task_entry.status == 'COMPLETED'
+        results.append(json.loads(task_entry.result_json))
+
+    mock_probe.assert_called_once()
+    analyze.assert_called_once()
+    assert os.path.exists(filepath)
+    assert results[1]['loudness_lufs'] == results[0]['loudness_lufs']
+    assert results[1]['input_format'] == {'is_lossless': True}
+
+def test_render_cache_hit_only_retags_the_copy(db, test_user, app, mocker):
+    decode = mock_decode(mocker, amplitude=0.1)
+    def encode(samples, rate, args, **kwargs):
+        with open(args[-1], 'wb') as f: f.write(b'encoded')
+    mock_encode = mocker.patch('app.tasks.audio_tasks.run_ffmpeg_with_pcm', side_effect=encode)
+    mock_metadata = mocker.patch('app.tasks.audio_tasks._apply_metadata')
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'content.wav')
+    with open(filepath, 'w') as f: f.write('dummy')
+
+    results = []
+    for artist, filename in (('First', 'song.wav'), ('Second', 'again.wav')):
+        audio_file = AudioFile(user_id=test_user.id, original_filename=filename, original_file_path=filepath,
+                               content_hash='ab' * 32)
+        db.session.add(audio_file)
+        db.session.commit()
+        task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id)
+        db.session.add(task_entry)
+        db.session.commit()
+        options = {'format': 'mp3', 'lufs_preset': 'spotify', 'artist': artist}
+        process_audio_file.s(task_entry.id, filepath, filename, test_user.id, options).apply()
+        db.session.refresh(task_entry)
+        assert task_entry.status == 'COMPLETED'
+        results.append(json.loads(task_entry.result_json))
+
+    decode.assert_called_once()
+    mock_encode.assert_called_once()
+    assert [result['render_cache_hit'] for result in results] == [False, True]
+    assert results[1]['loudness_lufs'] == results[0]['loudness_lufs']
+    copy = os.path.join(app.config['UPLOAD_FOLDER'], 'again.mp3')
+    with open(copy, 'rb') as f: assert f.read() == b'encoded'
+    assert os.path.exists(history_path_for(copy))
+    mock_metadata.assert_called_with(copy, mocker.ANY)
+    assert mock_metadata.call_args.args[1]['artist'] == 'Second'
+
+def _tone_file(app, name='tone.wav', seconds=3):
+    import soundfile as sf
+    rate = 44100
+    tone = 0.1 * np.sin(2 * np.pi * 440 * np.arange(rate * seconds) / rate)
+    path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+    sf.write(path, np.stack([tone, 0.8 * tone], axis=1), rate)
+    return path
+
+@pytest.mark.parametrize("options, strategy, processes", [
+    ({'format': 'mp3'}, 'fused', 1),
+    ({'format': 'mp3', 'fade_in': 1, 'fade_out': 1, 'verify_output': True}, 'fused', 2),
+    ({'format': 'mp3', 'lufs_preset': 'spotify'}, 'pipe', 2),
+    ({'format': 'wav', 'trim_silence': True}, 'pipe', 2),
+])
+def test_plan_render_picks_fewest_processes(app, options, strategy, processes):
+    with app.app_context():
+        path = _tone_file(app)
+        outputs = audio_tasks.render_outputs(options, 'tone.wav', app.config['UPLOAD_FOLDER'])
+        plan = audio_tasks.plan_render(path, outputs, options, {'sample_rate': 44100, 'channels': 2, 'duration': 3.0})
+    assert (plan['strategy'], plan['processes']) == (strategy, processes)
+    assert len(plan['commands']) == {'fused': 1, 'pipe': 2}[strategy]
+    assert (plan['reason'] is None) == (strategy == 'fused')
+
+def test_plan_render_refuses_to_fuse_a_trim(app):
+    with app.app_context():
+        path = _tone_file(app)
+        options = {'format': 'wav', 'trim_silence': True}
+        outputs = audio_tasks.render_outputs(options, 'tone.wav', app.config['UPLOAD_FOLDER'])
+        with pytest.raises(ValueError, match='trim_silence'):
+            audio_tasks.plan_render(path, outputs, options, None, strategy='fused')
+
+def test_analyzed_original_renders_in_one_fused_ffmpeg(db, test_user, app, mocker):
+    filepath = _tone_file(app, 'stored.wav')
+    decode = mocker.spy(audio_tasks, 'decode_audio')
+    fused = mocker.spy(audio_tasks, 'iter_ffmpeg_pcm')
+    options = {'format': 'flac', 'lufs_preset': 'spotify', 'fade_in': 0.5}
+
+    results = []
+    for name in ('first.wav', 'second.wav'):
+        audio_file = AudioFile(user_id=test_user.id, original_filename=name, original_file_path=filepath)
+        db.session.add(audio_file)
+        db.session.commit()
+        task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id)
+        db.session.add(task_entry)
+        db.session.commit()
+        process_audio_file.s(task_entry.id, filepath, name, test_user.id, options).apply()
+        db.session.refresh(task_entry)
+        assert task_entry.status == 'COMPLETED'
+        results.append(json.loads(task_entry.result_json))
+
+    # the first run measures the source (decode + encode), the second has the analysis and fuses
+    decode.assert_called_once()
+    fused.assert_called_once()
+    assert results[1]['loudness_lufs'] == pytest.approx(results[0]['loudness_lufs'], abs=0.05)
+    assert results[1]['duration_seconds'] == results[0]['duration_seconds']
+    assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'second.flac'))
+
+def test_fused_loudnorm_artifacts_describe_the_normalized_output(db, test_user, app, mocker):
+    import soundfile as sf
+    from app.services.waveform import decode_peaks
+    filepath = _tone_file(app, 'stored.wav')
+    options = {'format': 'flac', 'lufs_preset': 'spotify', 'limit_true_peak': True}
+    plan = mocker.spy(audio_tasks, 'plan_render')
+    for name in ('first.wav', 'second.wav'):
+        audio_file = AudioFile(user_id=test_user.id, original_filename=name, original_file_path=filepath)
+        db.session.add(audio_file)
+        db.session.commit()
+        task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id)
+        db.session.add(task_entry)
+        db.session.commit()
+        process_audio_file.s(task_entry.id, filepath, name, test_user.id, options).apply()
+        db.session.refresh(task_entry)
+        assert task_entry.status == 'COMPLETED'
+        assert plan.spy_return['strategy'] == ('pipe' if name == 'first.wav' else 'fused')
+
+    output = os.path.join(app.config['UPLOAD_FOLDER'], 'second.flac')
+    encoded, _ = sf.read(output, dtype='float32')
+    with open(peaks_path_for(output), 'rb') as f:
+        _, frames, levels = decode_peaks(f.read())
+    _, mins, maxs = levels[0]
+    # drawn from the tap after loudnorm: the envelope is the one the player serves, not the quiet source
+    assert frames == len(encoded)
+    assert maxs.max() == pytest.approx(encoded.max(), abs=0.02)
+    assert encoded.max() > 0.15
+
+MP3_320 = {'codec': 'mp3', 'format_name': 'mp3', 'sample_rate': 44100, 'bitrate': 320000, 'bitrate_mode': 'cbr'}
+FLAC_24 = {'codec': 'flac', 'format_name': 'flac', 'sample_rate': 48000, 'bits_per_sample': 24}
+
+@pytest.mark.parametrize("output_format, options, info, copies", [
+    ('mp3', {'bitrate': '320k'}, MP3_320, True),
+    ('mp3', {}, MP3_320, True),
+    ('mp3', {'bitrate': '192k'}, MP3_320, False),
+    ('mp3', {'bitrate': 'v0'}, MP3_320, False),
+    ('mp3', {'bitrate': '320k'}, dict(MP3_320, bitrate_mode='vbr'), False),
+    # an unknown mode (ffprobe fallback, mutagen UNKNOWN) may be VBR averaging near the target
+    ('mp3', {'bitrate': '320k'}, dict(MP3_320, bitrate_mode=None), False),
+    ('aac', {'bitrate': '256k'}, {'codec': 'aac', 'format_name': 'mov,mp4,m4a,3gp,3g2,mj2', 'sample_rate': 44100,
+                                  'bitrate': 256000, 'bitrate_mode': None}, False),
+    ('aac', {'bitrate': '256k'}, {'codec': 'aac', 'format_name': 'mov,mp4,m4a,3gp,3g2,mj2', 'sample_rate': 44100,
+                                  'bitrate': 256000, 'bitrate_mode': 'cbr'}, True),
+    ('mp3', {'bitrate': '320k', 'sample_rate': '48000'}, MP3_320, False),
+    ('aac', {'bitrate': '320k'}, MP3_320, False),
+    ('flac', {'sample_rate': 'original'}, FLAC_24, True),
+    ('flac', {'sample_rate': 'original', 'bit_depth': '16'}, FLAC_24, False),
+    ('flac', {}, FLAC_24, False),
+    ('wav', {'bit_depth': '24'}, {'codec': 'pcm_s24le', 'format_name': 'wav', 'sample_rate': 44100}, True),
+    ('wav', {}, {'codec': 'pcm_s24le', 'format_name': 'wav', 'sample_rate': 44100}, False),
+])
+def test_copies_source_only_for_identical_encodes(output_format, options, info, copies):
+    assert audio_tasks._copies_source(output_format, options, info) is copies
+
+def test_metadata_only_job_copies_the_audio(db, test_user, app, mocker):
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'stored.mp3')
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=d=3', '-ac', '2', '-b:a', '320k', '-y', filepath], check=True)
+    with open(filepath, 'rb') as f: original = f.read()
+    decode = mocker.spy(audio_tasks, 'iter_audio_blocks')
+    encode = mocker.spy(audio_tasks, 'run_ffmpeg_with_pcm')
+    fused = mocker.spy(audio_tasks, 'iter_ffmpeg_pcm')
+
+    for name, artist in (('first.mp3', 'First'), ('second.mp3', 'Second')):
+        audio_file = AudioFile(user_id=test_user.id, original_filename=name, original_file_path=filepath)
+        db.session.add(audio_file)
+        db.session.commit()
+        task_entry = ProcessingTask(user_id=test_user.id, audio_file_id=audio_file.id)
+        db.session.add(task_entry)
+        db.session.commit()
+        options = {'format': 'mp3', 'bitrate': '320k', 'artist': artist}
+        process_audio_file.s(task_entry.id, filepath, name, test_user.id, options).apply()
+        db.session.refresh(task_entry)
+        assert task_entry.status == 'COMPLETED'
+
+    # one decode draws the analysis and artifacts; nothing is ever re-encoded
+    decode.assert_called_once()
+    encode.assert_not_called()
+    fused.assert_not_called()
+    output = os.path.join(app.config['UPLOAD_FOLDER'], 'second.mp3')
+    assert MP3(output).tags['TPE1'].text == ['Second']
+    assert MP3(output).info.bitrate == MP3(filepath).info.bitrate
+    with open(output, 'rb') as f:
+        assert f.read().endswith(original[-4096:])  # same MPEG frames, only the tag differs
+    assert os.path.exists(peaks_path_for(output))
+    # the original's shared artifacts were renamed into place, with no staging left behind
+    assert os.path.exists(peaks_path_for(filepath)) and os.path.isdir(spectrogram_dir_for(filepath))
+    assert not [name for name in os.listdir(os.path.dirname(filepath)) if name.startswith('.artifacts-')]
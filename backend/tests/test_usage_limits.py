@@ -187,8 +187,10 @@ def test_upload_endpoint_blocks_when_limit_reached(active_subscriber_client, db,
     assert 'limit' in json_data
     assert json_data['used'] == 10
 
-def test_upload_endpoint_allows_within_limit(active_subscriber_client, db, test_user):
+def test_upload_endpoint_allows_within_limit(active_subscriber_client, db, test_user, mocker):
     """Test czy endpoint pozwala na upload w ramach limitu"""
+    mock_delay = mocker.patch('app.blueprints.audio.routes.process_audio_file.delay')
+    mock_delay.return_value.id = 'mock_celery_id_123'
     with active_subscriber_client.application.app_context():
         # Upewnij się że user ma aktywną subskrypcję i limit nie jest osiągnięty
         test_user.plan_name = "Free"
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from app.services.waveform import (
+    PEAKS_BASE_FRAMES, PEAKS_LEVEL_FACTOR, PeakBuilder, build_peak_levels, decode_peaks, encode_peaks, write_peaks,
+)
+
+def _ramp(frames, channels=2):
+    ramp = np.linspace(-1, 1, frames, dtype=np.float32)
+    return np.stack([ramp, -ramp * 0.5][:channels], axis=1)
+
+def test_finest_level_is_min_max_of_each_block_across_channels():
+    samples = _ramp(PEAKS_BASE_FRAMES * 10 + 17)
+    frames_per_peak, mins, maxs = build_peak_levels(samples, min_pairs=1)[0]
+    assert frames_per_peak == PEAKS_BASE_FRAMES
+    assert len(mins) == 11  # partial last block gets its own pair
+    block = samples[PEAKS_BASE_FRAMES * 3:PEAKS_BASE_FRAMES * 4]
+    assert mins[3] == block.min() and maxs[3] == block.max()
+    assert mins[-1] == samples[-17:].min()
+
+def test_coarser_levels_merge_the_level_below():
+    rng = np.random.default_rng(1)
+    samples = (rng.standard_normal((PEAKS_BASE_FRAMES * 5000, 1)) * 0.2).astype(np.float32)
+    levels = build_peak_levels(samples)
+    assert [frames for frames, _, _ in levels] == [PEAKS_BASE_FRAMES * PEAKS_LEVEL_FACTOR ** i for i in range(len(levels))]
+    assert len(levels[-1][1]) >= 512
+    for (frames, mins, maxs), (_, fine_mins, fine_maxs) in zip(levels[1:], levels):
+        assert mins[0] == fine_mins[:PEAKS_LEVEL_FACTOR].min()
+        assert maxs[-1] == samples[(len(maxs) - 1) * frames:].max()
+
+def test_encoding_round_trips_at_8_bit_resolution(tmp_path):
+    samples = _ramp(PEAKS_BASE_FRAMES * 3000)
+    path = tmp_path / 'x.peaks'
+    size = write_peaks(samples, 48000, str(path))
+    sample_rate, frames, levels = decode_peaks(path.read_bytes())
+    assert size == path.stat().st_size
+    assert (sample_rate, frames) == (48000, len(samples))
+    reference = build_peak_levels(samples)
+    assert len(levels) == len(reference)
+    for (frames_per_peak, mins, maxs), (ref_frames, ref_mins, ref_maxs) in zip(levels, reference):
+        assert frames_per_peak == ref_frames
+        assert np.allclose(mins, ref_mins, atol=1 / 127) and np.allclose(maxs, ref_maxs, atol=1 / 127)
+    # two bytes per pair: far smaller than the 24 MB of float PCM it describes
+    assert size < len(samples) * 2 * 4 / 100
+
+def test_blocks_of_any_size_build_the_same_pyramid():
+    samples = _ramp(PEAKS_BASE_FRAMES * 2100 + 77)
+    builder = PeakBuilder()
+    for start in range(0, len(samples), 1000):
+        builder.process(samples[start:start + 1000])
+    assert builder.frames == len(samples)
+    for (frames_per_peak, mins, maxs), (ref_frames, ref_mins, ref_maxs) in zip(builder.levels(), build_peak_levels(samples),
+                                                                            strict=True):
+        assert frames_per_peak == ref_frames
+        assert np.array_equal(mins, ref_mins) and np.array_equal(maxs, ref_maxs)
+
+def test_decode_rejects_foreign_data():
+    with pytest.raises(ValueError):
+        decode_peaks(b'RIFF' + bytes(32))
+    assert decode_peaks(encode_peaks(build_peak_levels(np.zeros((10, 2), dtype=np.float32)), 44100, 10))[1] == 10